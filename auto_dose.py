@@ -5,6 +5,8 @@ import time
 from datetime import datetime, timedelta
 import paho.mqtt.client as mqtt
 import glob
+from utils.result_index import index_record
+from utils.sensor_store import SensorStore
 
 # ================= CONFIG =================
 RADIUS_CM = 6.5
@@ -23,6 +25,8 @@ POND_INFO_BASE = os.environ.get("POND_INFO_BASE", "./data_ponds")
 TXT_WATER_DIR = os.environ.get("TXT_WATER_DIR", "./output/water_output")
 SAN_BASE = os.environ.get("SAN_BASE", "./local_storage/san")
 os.makedirs(SAN_BASE, exist_ok=True)
+# ค่า sensor อ่านจาก time-series store เดียวกับ main.py (ไฟล์ sensor_*.json เดิมให้ migrate ด้วย utils.sensor_store)
+sensor_store = SensorStore()
 
 # =================================================
 # ฟังก์ชันคำนวณสารที่เหลือ
@@ -90,6 +94,7 @@ def handle_san_status(data):
         )
         with open(save_path, "w", encoding="utf-8") as f:
             json.dump(record, f, ensure_ascii=False, indent=2)
+        index_record("san", save_path, record)
 
         print(f"[SAVE] ✅ บันทึกไฟล์ {save_path}")
         print(f"   → สารเหลือในแต่ละกล่อง (g): {remaining_list}")
@@ -260,9 +265,9 @@ def process_auto_dose(pond_id, pond_size_rai, ph, temp, do, last_dose, txt_dir,
 # Monitor sensor + water
 # =================================================
 def monitor_sensor_and_water():
-    print("=== [START] Monitor Sensor/Water File (FLAT sensor folder, check by pond_id) ===")
+    print("=== [START] Monitor Sensor/Water (sensor store, check by pond_id) ===")
     last_txt_file = None
-    pond_sensor_checked = {}  # pond_id -> set(sensor_file_names)
+    pond_sensor_checked = {}  # pond_id -> received_at ของ 5 ค่าล่าสุดที่ตรวจแล้ว
 
     while True:
         print(f"\n===== Loop @ {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} =====")
@@ -271,12 +276,7 @@ def monitor_sensor_and_water():
         if ai_txt_path and ai_txt_path != last_txt_file and should_dose_green_extract(ai_txt):
             print(f"\n[TRIGGER] พบ .txt สีน้ำใหม่ ({os.path.basename(ai_txt_path)}) -> น้ำใส! (trigger ปล่อยน้ำหมัก)")
             # trigger ทุกบ่อ
-            sensor_files = sorted(glob.glob(os.path.join(SENSOR_BASE, "sensor_*.json")), key=os.path.getmtime, reverse=True)
-            pond_ids = set()
-            for sf in sensor_files:
-                with open(sf, "r", encoding="utf-8") as f:
-                    d = json.load(f)
-                pond_ids.add(str(d.get("pond_id", "1")))
+            pond_ids = set(sensor_store.ponds())
             now = datetime.now()
             for pond_id in pond_ids:
                 pond_info = get_pond_info(pond_id)
@@ -300,39 +300,29 @@ def monitor_sensor_and_water():
                 )
             last_txt_file = ai_txt_path
 
-        # 2. Trigger sensor abnormal 5 ไฟล์ล่าสุดของแต่ละบ่อ
-        sensor_files = sorted(glob.glob(os.path.join(SENSOR_BASE, "sensor_*.json")), key=os.path.getmtime, reverse=True)
-        pond_files_map = {}
-        for sf in sensor_files:
-            with open(sf, "r", encoding="utf-8") as f:
-                d = json.load(f)
-            pond_id = str(d.get("pond_id", "1"))
-            pond_files_map.setdefault(pond_id, []).append(sf)
-
-        for pond_id, pond_files in pond_files_map.items():
-            if len(pond_files) < 5:
-                print(f"[DEBUG] pond_id={pond_id} มีไฟล์ sensor น้อยกว่า 5")
+        # 2. Trigger sensor abnormal 5 ค่าล่าสุดของแต่ละบ่อ
+        for pond_id in sensor_store.ponds():
+            recent = sensor_store.last(pond_id, 5)
+            if len(recent) < 5:
+                print(f"[DEBUG] pond_id={pond_id} มีค่า sensor น้อยกว่า 5")
                 continue
-            # ห้าไฟล์ล่าสุดของบ่อนี้
-            recent_files = pond_files[:5]
-            sensor_set = tuple(os.path.basename(f) for f in recent_files)
+            # ห้าค่าล่าสุดของบ่อนี้
+            sensor_set = tuple(d["received_at"] for d in recent)
             if pond_id in pond_sensor_checked and pond_sensor_checked[pond_id] == sensor_set:
                 continue  # checked
             ph_list, temp_list, do_list = [], [], []
             all_ph_low = True
             all_temp_high = True
             all_do_low = True
-            print(f"[DEBUG] {pond_id}: sensor set {[os.path.basename(f) for f in recent_files]}")
-            for i, jf in enumerate(recent_files):
-                with open(jf, "r", encoding="utf-8") as f:
-                    d = json.load(f)
-                ph = float(d.get("ph", 7))
-                temp = float(d.get("temperature", 29))
-                do = float(d.get("do", 6))
+            print(f"[DEBUG] {pond_id}: sensor set {[d['timestamp'] for d in recent]}")
+            for i, d in enumerate(recent):
+                ph = 7.0 if d["ph"] is None else d["ph"]
+                temp = 29.0 if d["temperature"] is None else d["temperature"]
+                do = 6.0 if d["do"] is None else d["do"]
                 ph_list.append(ph)
                 temp_list.append(temp)
                 do_list.append(do)
-                print(f"    [{i+1}] {os.path.basename(jf)} | ph={ph} temp={temp} do={do}")
+                print(f"    [{i+1}] {d['timestamp']} | ph={ph} temp={temp} do={do}")
                 if ph >= 6.8:
                     all_ph_low = False
                 if temp <= 30:
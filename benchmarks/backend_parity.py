@@ -0,0 +1,116 @@
+"""
+Benchmark: latency และความตรงกันของผลลัพธ์ระหว่าง backend (torch / onnx / openvino)
+ใช้ torch (.pt) เป็นตัวอ้างอิง แล้ววัดกับภาพตัวอย่างใน output/
+- classify (water): top-1 ตรงกันกี่ % และ prob ต่างกันสูงสุดเท่าไร
+- detect (din, shrimp): จำนวนกล่องต่างกัน และ IoU เฉลี่ยของกล่องที่จับคู่ได้
+- pose (size): เหมือน detect + ระยะ keypoint ที่ต่างกันเฉลี่ย (pixel)
+
+ตัวอย่าง:
+    python -m benchmarks.backend_parity --backends onnx openvino --models water size
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.batch_inference import load_sample_images
+from utils.loader_model import MODEL_FILES, MODEL_TASKS
+from utils.model_registry import get_model, model_stats
+
+
+def _box_iou(a, b):
+    """IoU ระหว่างกล่อง xyxy ทุกคู่: a (N, 4), b (M, 4) -> (N, M)"""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def _match(ref_boxes, boxes):
+    """จับคู่กล่องแบบ greedy ตาม IoU สูงสุด คืน list ของ (index_ref, index_other, iou)"""
+    if len(ref_boxes) == 0 or len(boxes) == 0:
+        return []
+    iou = _box_iou(ref_boxes, boxes)
+    pairs = []
+    while iou.size and iou.max() > 0:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        pairs.append((i, j, float(iou[i, j])))
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return pairs
+
+
+def compare(task: str, ref, other) -> dict:
+    """เทียบผลของภาพเดียว คืน dict ของ metric ตาม task"""
+    if task == "classify":
+        ref_probs = ref.probs.data.cpu().numpy()
+        probs = other.probs.data.cpu().numpy()
+        return {"top1_match": float(int(ref.probs.top1) == int(other.probs.top1)),
+                "max_prob_diff": float(np.abs(ref_probs - probs).max())}
+
+    ref_boxes = ref.boxes.xyxy.cpu().numpy()
+    boxes = other.boxes.xyxy.cpu().numpy()
+    pairs = _match(ref_boxes, boxes)
+    row = {"count_diff": float(abs(len(ref_boxes) - len(boxes))),
+           "mean_iou": float(np.mean([p[2] for p in pairs])) if pairs else
+           (1.0 if len(ref_boxes) == len(boxes) == 0 else 0.0)}
+    if task == "pose" and pairs and ref.keypoints is not None and other.keypoints is not None:
+        ref_kpts = ref.keypoints.xy.cpu().numpy()
+        kpts = other.keypoints.xy.cpu().numpy()
+        row["kpt_px_diff"] = float(np.mean([np.linalg.norm(ref_kpts[i] - kpts[j], axis=-1).mean()
+                                            for i, j, _ in pairs]))
+    return row
+
+
+def run(model, images):
+    """predict ทีละภาพ คืน (ผลลัพธ์, ms ต่อภาพ)"""
+    model.predict(images[:1], verbose=False)  # warm-up
+    results = []
+    started = time.perf_counter()
+    for image in images:
+        results.extend(model.predict(image, verbose=False))
+    return results, 1000.0 * (time.perf_counter() - started) / len(images)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference backends against torch")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_FILES.keys()))
+    parser.add_argument("--backends", nargs="+", default=["onnx"])
+    parser.add_argument("--image-dir", default="output")
+    parser.add_argument("--images", type=int, default=16)
+    args = parser.parse_args()
+
+    images = load_sample_images(args.image_dir, args.images)
+    print(f"📷 {len(images)} ภาพ\n")
+    print(f"{'model':<8} {'backend':<9} {'ms/img':>8} {'speedup':>8}  parity")
+    for model_key in args.models:
+        task = MODEL_TASKS[model_key]
+        try:
+            ref_results, ref_ms = run(get_model(model_key, "torch"), images)
+        except Exception as e:
+            print(f"{model_key:<8} ⚠️ skip: {e}")
+            continue
+        print(f"{model_key:<8} {'torch':<9} {ref_ms:>8.1f} {1.0:>7.2f}x  (reference)")
+
+        for backend in args.backends:
+            try:
+                model = get_model(model_key, backend)
+                status = model_stats()["models"].get(f"{model_key}:{backend}", {})
+                if status.get("status") != "loaded":
+                    raise RuntimeError(status.get("error") or status.get("status"))
+                results, ms = run(model, images)
+            except Exception as e:
+                print(f"{model_key:<8} {backend:<9} ⚠️ skip: {e}")
+                continue
+            rows = [compare(task, r, o) for r, o in zip(ref_results, results)]
+            metrics = {k: np.mean([row[k] for row in rows if k in row])
+                       for k in sorted({k for row in rows for k in row})}
+            parity = ", ".join(f"{k}={v:.4f}" for k, v in metrics.items())
+            print(f"{model_key:<8} {backend:<9} {ms:>8.1f} {ref_ms / ms:>7.2f}x  {parity}")
+
+
+if __name__ == "__main__":
+    main()
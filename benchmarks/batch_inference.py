@@ -0,0 +1,71 @@
+"""
+Benchmark: images/sec ของการเรียกโมเดลทีละภาพ เทียบกับแบบ batch
+ใช้ภาพตัวอย่างจาก output/ (วนซ้ำให้ครบจำนวนที่ต้องการ)
+
+ตัวอย่าง:
+    python -m benchmarks.batch_inference --models water size --images 32
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import cv2
+
+from utils.loader_model import MODEL_FILES
+from utils.model_registry import get_model
+
+DEFAULT_BATCH_SIZES = (1, 4, 16)
+
+
+def load_sample_images(image_dir: str, count: int):
+    paths = sorted(glob.glob(os.path.join(image_dir, "**", "*.jpg"), recursive=True))
+    images = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not images:
+        raise SystemExit(f"❌ ไม่พบภาพตัวอย่างใน {image_dir}")
+    return [images[i % len(images)] for i in range(count)]
+
+
+def bench_model(model_key: str, images, batch_sizes, repeats: int = 1):
+    model = get_model(model_key)
+    model.predict(images[:1], verbose=False)  # warm-up (สร้าง predictor / fuse layers)
+
+    rows = []
+    for batch_size in batch_sizes:
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for start in range(0, len(images), batch_size):
+                model.predict(images[start:start + batch_size], verbose=False)
+        elapsed = time.perf_counter() - started
+        total = len(images) * repeats
+        rows.append((batch_size, total, elapsed, total / elapsed if elapsed > 0 else 0.0))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched YOLO inference")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_FILES.keys()),
+                        help="model keys ใน MODEL_FILES")
+    parser.add_argument("--image-dir", default="output")
+    parser.add_argument("--images", type=int, default=32, help="จำนวนภาพต่อรอบ")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=list(DEFAULT_BATCH_SIZES))
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args()
+
+    images = load_sample_images(args.image_dir, args.images)
+    print(f"📷 {len(images)} ภาพ / รอบ, repeats={args.repeats}\n")
+    print(f"{'model':<8} {'batch':>5} {'images':>7} {'seconds':>8} {'img/s':>8} {'speedup':>8}")
+    for model_key in args.models:
+        try:
+            rows = bench_model(model_key, images, args.batch_sizes, args.repeats)
+        except Exception as e:
+            print(f"{model_key:<8} ⚠️ skip: {e}")
+            continue
+        base_rate = rows[0][3] or 1.0
+        for batch_size, total, elapsed, rate in rows:
+            print(f"{model_key:<8} {batch_size:>5} {total:>7} {elapsed:>8.2f} {rate:>8.2f} {rate / base_rate:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
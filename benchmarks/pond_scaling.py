@@ -0,0 +1,105 @@
+"""
+Benchmark: หน่วยความจำและ CPU ของ PondStatusEngine ตามจำนวนบ่อ
+สร้าง result index ชั่วคราวที่มีผลครบ 6 ชนิดต่อบ่อ แล้ววัด
+- load: CPU ที่ใช้สร้างสถานะเริ่มต้นของทุกบ่อ และหน่วยความจำของ state (tracemalloc)
+- event: CPU ต่อ change event 1 ครั้ง (sensor ใหม่ของบ่อหนึ่ง) ซึ่งไม่ควรขึ้นกับจำนวนบ่อ
+- burst: sensor ใหม่ของทุกบ่อพร้อมกันใน debounce window เดียว
+
+ตัวอย่าง:
+    python -m benchmarks.pond_scaling
+    python -m benchmarks.pond_scaling --ponds 10 100 1000 5000 --events 500
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from utils.pond_status import PondStatusEngine
+from utils.result_index import index_record, latest_record
+
+
+def _docs(pond: int):
+    url = f"http://example/files/pond{pond}"
+    return {
+        "sensor": {"pond_id": pond, "ph": 7.8, "temperature": 29.5, "do": 5.2, "timestamp": "2026-01-01T00:00:00"},
+        "san": {"pond_id": pond, "remaining_g": [120.0, 80.5, 64.0, 12.25]},
+        "water": {"pond_number": pond, "text_content": "green", "output_image": f"{url}/water.jpg"},
+        "shrimp": {"pond_number": pond, "output_image": [f"{url}/shrimp.jpg"]},
+        "size": {"pond_number": pond, "output_image": f"{url}/size.jpg", "raw_input_image": f"{url}/raw.jpg",
+                 "result": {"avg_length_cm": 8.1, "avg_weight_g": 5.4}},
+        "din": {"pond_number": pond, "output_video": f"{url}/din.mp4"},
+    }
+
+
+def _populate(root: str, db_path: str, ponds: int):
+    for pond in range(1, ponds + 1):
+        for result_type, doc in _docs(pond).items():
+            path = os.path.join(root, f"{result_type}_{pond}.json")
+            open(path, "w").close()  # latest_record ตรวจว่าไฟล์ยังอยู่
+            index_record(result_type, path, doc, db_path=db_path)
+
+
+def _add_sensor(root: str, db_path: str, pond: int, seq: int):
+    path = os.path.join(root, f"sensor_{pond}_{seq}.json")
+    open(path, "w").close()
+    index_record("sensor", path, {"pond_id": pond, "ph": 7.0 + seq % 10 / 10, "temperature": 29.0, "do": 5.0},
+                 db_path=db_path)
+
+
+def run(ponds: int, events: int) -> dict:
+    with tempfile.TemporaryDirectory() as root:
+        db_path = os.path.join(root, "index.sqlite3")
+        _populate(root, db_path, ponds)
+        engine = PondStatusEngine(lambda: "2026-01-01T00:00:00",
+                                  lookup=lambda result_type, pond: latest_record(result_type, pond, db_path))
+
+        tracemalloc.start()
+        cpu = time.process_time()
+        engine.load(range(1, ponds + 1))
+        load_cpu = time.process_time() - cpu
+        state_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        # event ทีละบ่อ (สุ่มบ่อ) วัดเฉพาะ engine.apply ไม่รวมการเขียนดัชนี
+        event_cpu = 0.0
+        for seq in range(events):
+            pond = random.randint(1, ponds)
+            _add_sensor(root, db_path, pond, seq)
+            cpu = time.process_time()
+            engine.apply({("sensor", str(pond))})
+            event_cpu += time.process_time() - cpu
+
+        for pond in range(1, ponds + 1):
+            _add_sensor(root, db_path, pond, events + pond)
+        cpu = time.process_time()
+        engine.apply({("sensor", str(pond)) for pond in range(1, ponds + 1)})
+        burst_cpu = time.process_time() - cpu
+
+    return {
+        "ponds": ponds,
+        "load_ms": 1000 * load_cpu,
+        "state_kb": state_bytes / 1024,
+        "per_pond_kb": state_bytes / 1024 / ponds,
+        "event_ms": 1000 * event_cpu / max(events, 1),
+        "burst_ms": 1000 * burst_cpu,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multi-pond status engine scaling")
+    parser.add_argument("--ponds", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--events", type=int, default=200, help="จำนวน change event ที่สุ่มวัดต่อขนาด")
+    args = parser.parse_args()
+
+    print(f"{'ponds':>6} {'load ms':>9} {'state KB':>9} {'KB/pond':>8} {'ms/event':>9} {'burst ms':>9}")
+    for ponds in args.ponds:
+        r = run(ponds, args.events)
+        print(f"{r['ponds']:>6} {r['load_ms']:>9.1f} {r['state_kb']:>9.1f} {r['per_pond_kb']:>8.2f} "
+              f"{r['event_ms']:>9.3f} {r['burst_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark: INT8 (onnx_int8) เทียบกับ FP32 สำหรับโมเดลวัดขนาด (size) และสีน้ำ (water)
+รายงานแยกรายบ่อ (จากชื่อไฟล์ ..._pond<n>_...) เพื่อเลือกเปิด SIZE_PROFILE_POND_<n>=int8 /
+WATER_PROFILE_POND_<n>=int8 เฉพาะบ่อที่ผลคลาดเคลื่อนรับได้
+- size: จำนวนกุ้งต่างกัน, ความยาวเฉลี่ย (cm) และน้ำหนักเฉลี่ย (g) ที่ drift ไปกี่ %
+- water: top-1 ตรงกันกี่ % และ prob ต่างกันสูงสุด
+
+ตัวอย่าง:
+    python -m benchmarks.quant_parity --calib-dir /data/calib --image-dir /data/pond_samples
+"""
+
+import argparse
+import glob
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+
+from process.size import measure_shrimp
+from utils.model_export import export_model
+from utils.model_registry import get_profile_model, model_stats
+
+
+def _pond_of(path: str) -> str:
+    match = re.search(r"pond_?(\d+)", os.path.basename(path).lower())
+    return match.group(1) if match else "-"
+
+
+def _load_images(image_dir: str):
+    paths = []
+    for ext in ("jpg", "jpeg", "png"):
+        paths += glob.glob(os.path.join(image_dir, "**", f"*.{ext}"), recursive=True)
+    samples = [(p, cv2.imread(p)) for p in sorted(paths)]
+    samples = [(p, img) for p, img in samples if img is not None]
+    if not samples:
+        raise SystemExit(f"❌ ไม่พบภาพใน {image_dir}")
+    return samples
+
+
+def _predict(model, images):
+    model.predict(images[:1], verbose=False)  # warm-up
+    started = time.perf_counter()
+    results = [model.predict(image, verbose=False)[0] for image in images]
+    return results, 1000.0 * (time.perf_counter() - started) / len(images)
+
+
+def _pct(diff: float, base: float) -> float:
+    return 100.0 * abs(diff) / base if base else 0.0
+
+
+def compare_size(ref, other, pixel_per_cm: float) -> dict:
+    ref_m = measure_shrimp(ref, pixel_per_cm)
+    m = measure_shrimp(other, pixel_per_cm)
+    ref_len = ref_m["length_cm"].mean() if len(ref_m) else 0.0
+    length = m["length_cm"].mean() if len(m) else 0.0
+    ref_w = ref_m["weight_g"].mean() if len(ref_m) else 0.0
+    weight = m["weight_g"].mean() if len(m) else 0.0
+    return {"count_diff": abs(len(ref_m) - len(m)),
+            "length_cm_diff": abs(length - ref_len),
+            "length_drift_%": _pct(length - ref_len, ref_len),
+            "weight_drift_%": _pct(weight - ref_w, ref_w)}
+
+
+def compare_water(ref, other) -> dict:
+    return {"top1_match_%": 100.0 * (int(ref.probs.top1) == int(other.probs.top1)),
+            "max_prob_diff": float(np.abs(ref.probs.data.cpu().numpy() - other.probs.data.cpu().numpy()).max())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT8 vs FP32 parity report")
+    parser.add_argument("--models", nargs="+", default=["size", "water"], choices=["size", "water"])
+    parser.add_argument("--calib-dir", default=None, help="ภาพสำหรับ static calibration (ไม่ระบุ = dynamic)")
+    parser.add_argument("--image-dir", default="output", help="ภาพที่ใช้วัด parity")
+    parser.add_argument("--pixel-per-cm", type=float, default=13)
+    parser.add_argument("--requantize", action="store_true", help="quantize ใหม่แม้มีไฟล์ .int8.onnx แล้ว")
+    args = parser.parse_args()
+
+    samples = _load_images(args.image_dir)
+    images = [img for _, img in samples]
+    ponds = [_pond_of(p) for p, _ in samples]
+    print(f"📷 {len(images)} ภาพ จาก {args.image_dir}\n")
+
+    for model_key in args.models:
+        export_model(model_key, "onnx_int8", force=args.requantize, calib_dir=args.calib_dir)
+        fp32_results, fp32_ms = _predict(get_profile_model(model_key, "fp32"), images)
+        int8_model = get_profile_model(model_key, "int8")
+        status = model_stats()["models"].get(f"{model_key}:onnx_int8", {})
+        if status.get("status") != "loaded":
+            print(f"{model_key}: ⚠️ โหลด INT8 ไม่สำเร็จ ({status.get('error') or status.get('status')})\n")
+            continue
+        int8_results, int8_ms = _predict(int8_model, images)
+
+        if model_key == "size":
+            rows = [compare_size(r, o, args.pixel_per_cm) for r, o in zip(fp32_results, int8_results)]
+        else:
+            rows = [compare_water(r, o) for r, o in zip(fp32_results, int8_results)]
+
+        print(f"🔎 {model_key}: fp32 {fp32_ms:.1f} ms/img, int8 {int8_ms:.1f} ms/img "
+              f"({fp32_ms / int8_ms:.2f}x)")
+        keys = list(rows[0].keys())
+        print(f"{'pond':>6} {'images':>7} " + " ".join(f"{k:>15}" for k in keys))
+        for pond in sorted(set(ponds)) + ["all"]:
+            selected = [row for row, p in zip(rows, ponds) if pond in ("all", p)]
+            values = " ".join(f"{np.mean([row[k] for row in selected]):>15.3f}" for k in keys)
+            print(f"{pond:>6} {len(selected):>7} {values}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
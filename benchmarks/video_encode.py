@@ -0,0 +1,71 @@
+"""
+Benchmark: เวลา encode และขนาดไฟล์ของวิดีโอผลลัพธ์ din ตาม setting ต่าง ๆ
+วิเคราะห์วิดีโอครั้งเดียวแบบ lazy (เก็บ track ไว้) แล้ว render ซ้ำด้วยแต่ละ setting จาก track ชุดเดียวกัน
+จึงเทียบเฉพาะต้นทุนการ encode ไม่มีเวลา inference ปน
+
+ตัวอย่าง:
+    python -m benchmarks.video_encode input_video/video_pond1.mp4
+    python -m benchmarks.video_encode input_video/video_pond1.mp4 --configs "crf=30,preset=veryfast" "mode=highlights"
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+DEFAULT_CONFIGS = [
+    "",
+    "crf=28,preset=veryfast",
+    "crf=28,preset=veryfast,max_side=640,fps=10",
+    "bitrate=400k,preset=veryfast,max_side=640",
+    "mode=highlights,crf=28,preset=veryfast",
+]
+
+
+def _parse_config(text: str) -> dict:
+    config = {}
+    for part in filter(None, text.split(",")):
+        key, value = part.split("=", 1)
+        if key in ("crf", "max_side"):
+            value = int(value)
+        elif key == "fps":
+            value = float(value)
+        config[key] = value
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark din output video encoding")
+    parser.add_argument("video")
+    parser.add_argument("--configs", nargs="+", default=DEFAULT_CONFIGS,
+                        help='setting คั่นด้วย comma เช่น "crf=28,preset=veryfast,max_side=640" ("" = ค่าเริ่มต้น)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        os.environ["OUTPUT_DIN"] = output_dir
+        from process.din import _render_video, analyze_video, format_encode_report
+        from utils.annotation import pending_path
+
+        started = time.perf_counter()
+        result = analyze_video(args.video, original_name="bench_encode.mp4", annotate="lazy")
+        print(f"\n🔎 วิเคราะห์ (ไม่ encode) {time.perf_counter() - started:.2f}s\n")
+        with open(pending_path(result.output_path), "r", encoding="utf-8") as f:
+            pending = json.load(f)
+
+        reports = []
+        for idx, text in enumerate(args.configs):
+            output_path = os.path.join(output_dir, f"encode_{idx}.mp4")
+            reports.append((text or "default", _render_video(pending["source"], output_path,
+                                                             pending["detections"], _parse_config(text))))
+
+    base = reports[0][1]
+    print(f"\n{'config':<45} {'encode s':>9} {'MB':>7} {'size %':>7} {'frames':>7}")
+    for text, report in reports:
+        print(f"{text:<45} {report['encode_seconds']:>9.2f} {report['bytes'] / (1024 * 1024):>7.2f} "
+              f"{100.0 * report['bytes'] / max(base['bytes'], 1):>6.1f}% {report['frames_written']:>7}")
+        print(f"  {format_encode_report(report)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark: ความเร็วและความแม่นของ analyze_video ตาม frame stride / max inference side / infer batch
+แต่ละ setting รันใน process ใหม่ เพื่อไม่ให้ state ของ tracker ปนกันระหว่างรอบ
+เทียบผลกับ baseline (stride=1, ไม่ย่อภาพ, ส่ง YOLO ทีละเฟรม)
+
+ตัวอย่าง:
+    python -m benchmarks.video_stride input_video/video_pond1.mp4 --strides 1 2 3 5 --max-sides 0 960
+    python -m benchmarks.video_stride input_video/video_pond1.mp4 --strides 1 --infer-batches 1 4 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _run_once(video_path: str, stride: int, max_side: int, batch: int, output_dir: str):
+    os.environ["OUTPUT_DIN"] = output_dir
+    from process.din import analyze_video
+    from utils.model_registry import get_model
+
+    get_model("din")  # ไม่นับเวลาโหลดโมเดล
+    stats = {}
+    analyze_video(video_path, original_name=f"bench_s{stride}_m{max_side}_b{batch}.mp4",
+                  frame_stride=stride, max_infer_side=max_side, infer_batch=batch, stats=stats)
+    return stats
+
+
+def _overall(moved_percent: float) -> str:
+    return "good" if moved_percent >= 70 else "weak" if moved_percent >= 50 else "still"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark analyze_video frame stride / downscale")
+    parser.add_argument("video")
+    parser.add_argument("--strides", type=int, nargs="+", default=[1, 2, 3, 5])
+    parser.add_argument("--max-sides", type=int, nargs="+", default=[0])
+    parser.add_argument("--infer-batches", type=int, nargs="+", default=[1])
+    args = parser.parse_args()
+
+    settings = [(1, 0, 1)] + [(s, m, b) for b in args.infer_batches for m in args.max_sides
+                              for s in args.strides if (s, m, b) != (1, 0, 1)]
+    ctx = multiprocessing.get_context("spawn")
+    rows = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for stride, max_side, batch in settings:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                stats = pool.submit(_run_once, args.video, stride, max_side, batch, output_dir).result()
+            rows.append((stride, max_side, batch, stats))
+
+    base = rows[0][3]
+    print(f"\n{'stride':>6} {'max_side':>8} {'batch':>5} {'frames':>7} {'sec':>7} {'fps':>7} {'speedup':>8} "
+          f"{'total':>6} {'moved%':>7} {'Δmoved%':>8} {'overall':>8}")
+    for stride, max_side, batch, stats in rows:
+        fps = stats["frames"] / stats["seconds"] if stats["seconds"] else 0.0
+        speedup = base["seconds"] / stats["seconds"] if stats["seconds"] else 0.0
+        same = "same" if _overall(stats["moved_percent"]) == _overall(base["moved_percent"]) else "DIFF"
+        print(f"{stride:>6} {max_side:>8} {batch:>5} {stats['frames']:>7} {stats['seconds']:>7.2f} {fps:>7.1f} "
+              f"{speedup:>7.2f}x {stats['total']:>6} {stats['moved_percent']:>7.1f} "
+              f"{stats['moved_percent'] - base['moved_percent']:>+8.1f} {same:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
-﻿from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+﻿from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
 import shutil
 import os
 import uuid
 import json
-from typing import List
+from typing import List, Optional
 from datetime import datetime, timedelta, timezone
 import requests
 import math
@@ -11,13 +11,31 @@ import paho.mqtt.client as mqtt
 import uvicorn
 import re
 import glob
+import asyncio
+import hashlib
+import aiofiles
 from pathlib import Path
+from urllib.parse import unquote
 
-from process.size import analyze_shrimp
-from process.shrimp import analyze_kuny
-from process.din import analyze_video
-from process.water import analyze_water
+from process.size import analyze_shrimp, analyze_shrimp_batch
+from process.shrimp import analyze_kuny, analyze_kuny_batch
+from process.din import analyze_video, video_encode_settings, FRAME_STRIDE as DIN_FRAME_STRIDE, MAX_INFER_SIDE as DIN_MAX_INFER_SIDE
+from process.water import analyze_water, analyze_water_batch
 from local_storage import LocalStorage
+from utils.model_registry import model_stats, model_version, resolve_profile
+from utils.worker_pool import run_analysis, start_warm_up, shutdown as shutdown_worker_pool
+from utils.job_queue import JobStore, JobProgress, JobQueueFull
+from utils.annotation import is_pending, render_pending, resolve_annotate_mode
+from utils.result_cache import ResultCache, make_cache_key
+from utils.tiling import tiling_signature
+from process.water_prefilter import WATER_FAST_PATH, prefilter_stats
+from utils.admission import AdmissionController, AdmissionRejected, DEFAULT_LIMITS
+from utils.result_index import backfill as backfill_result_index, index_record, latest_record
+from utils.result_index import add_listener as add_index_listener, is_indexed as is_result_indexed, known_ponds
+from utils.pond_status import PondStatusEngine, SOURCE_TYPES as POND_SOURCE_TYPES
+from utils.change_events import ChangeBus, InotifyWatcher, read_json_file
+from utils.sensor_store import SensorStore
+from fastapi.responses import FileResponse, JSONResponse, Response
 
 # =============== FastAPI และ CORS ====================
 app = FastAPI()
@@ -44,6 +62,117 @@ app.mount("/size",   StaticFiles(directory=str(STORAGE_DIR / "size")), name="siz
 app.mount("/shrimp", StaticFiles(directory=str(STORAGE_DIR / "shrimp")), name="shrimp")
 app.mount("/din",    StaticFiles(directory=str(STORAGE_DIR / "din")),   name="din")
 app.mount("/water",  StaticFiles(directory=str(STORAGE_DIR / "water")), name="water")
+
+STATIC_MOUNTS = {
+    "/storage": STORAGE_DIR,
+    "/size": STORAGE_DIR / "size",
+    "/shrimp": STORAGE_DIR / "shrimp",
+    "/din": STORAGE_DIR / "din",
+    "/water": STORAGE_DIR / "water",
+}
+
+
+# โฟลเดอร์ที่ analyzer เขียนภาพ / วิดีโอผลลัพธ์จริง (ค่าเริ่มต้นเดียวกับ process/*.py)
+# make_public_url แปลง .../size_output/x.jpg เป็น /size/x.jpg จึงอาจอยู่นอก STORAGE_DIR ที่ mount ไว้
+OUTPUT_DIRS = {
+    "/size": Path(os.environ.get("OUTPUT_SIZE", "./output/size_output")),
+    "/shrimp": Path(os.environ.get("OUTPUT_SHRIMP", "./output/shrimp_output")),
+    "/din": Path(os.environ.get("OUTPUT_DIN", "./output/din_output")),
+    "/water": Path(os.environ.get("OUTPUT_WATER", "./output/water_output")),
+}
+
+
+def _file_under(base: Path, rel_path: str):
+    """path ของไฟล์ rel_path ใต้ base (None ถ้าพยายามออกนอกโฟลเดอร์)"""
+    base = base.resolve()
+    target = (base / unquote(rel_path)).resolve()
+    if target == base or base not in target.parents:
+        return None
+    return str(target)
+
+
+def _static_file_path(url_path: str):
+    """แปลง URL ของ static mount เป็น path ของไฟล์ (None ถ้าไม่ใช่ static หรือพยายามออกนอกโฟลเดอร์)"""
+    for prefix, base in STATIC_MOUNTS.items():
+        if url_path.startswith(prefix + "/"):
+            return _file_under(base, url_path[len(prefix) + 1:])
+    return None
+
+
+def _output_file_path(url_path: str):
+    """path ของไฟล์ใน OUTPUT_* ที่ตรงกับ URL (กรณี OUTPUT_* ไม่ได้อยู่ใน static mount)"""
+    for prefix, base in OUTPUT_DIRS.items():
+        if url_path.startswith(prefix + "/"):
+            return _file_under(base, url_path[len(prefix) + 1:])
+    return None
+
+
+@app.middleware("http")
+async def render_lazy_annotations(request: Request, call_next):
+    """
+    annotate=lazy: วาดภาพ / วิดีโอผลลัพธ์ตอนมีคนเปิด URL ครั้งแรก แล้วให้ StaticFiles serve ตามปกติ
+    ถ้าไฟล์ไม่อยู่ใน static mount แต่อยู่ใน OUTPUT_* (เช่นค่าเริ่มต้น ./output/*_output) จะ render และ serve จากที่นั่นแทน
+    """
+    if request.method in ("GET", "HEAD"):
+        file_path = _static_file_path(request.url.path)
+        if file_path and not os.path.exists(file_path) and not is_pending(file_path):
+            output_path = _output_file_path(request.url.path)
+            if output_path and output_path != file_path and (os.path.exists(output_path) or is_pending(output_path)):
+                if await _render_lazy(output_path) and os.path.isfile(output_path):
+                    return FileResponse(output_path)
+        elif file_path and is_pending(file_path):
+            await _render_lazy(file_path)
+    return await call_next(request)
+
+
+async def _render_lazy(file_path: str) -> bool:
+    try:
+        return await asyncio.to_thread(render_pending, file_path)
+    except Exception as e:
+        print(f"❌ Lazy render failed ({file_path}): {e}")
+        return False
+
+# ------------------------------------------------------------------------------------
+# Admission control: จำกัดงานพร้อมกันต่อ analyzer + คิวรอที่มีขอบเขต (ดู utils/admission.py)
+# ------------------------------------------------------------------------------------
+admission = AdmissionController()
+
+# /process ที่รับไว้พร้อมกัน (นับก่อนอ่าน body) เกินนี้ตอบ 429 ทันทีโดยไม่ต้องรับไฟล์
+PROCESS_MAX_INFLIGHT = int(os.environ.get(
+    "PROCESS_MAX_INFLIGHT", str(sum(c + q for c, q in DEFAULT_LIMITS.values()))))
+_process_inflight = 0
+
+
+def _too_busy(detail: str, retry_after: int):
+    return JSONResponse(status_code=429, headers={"Retry-After": str(retry_after)},
+                        content={"detail": detail, "retry_after": retry_after, "queue": admission.stats()})
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return _too_busy(str(exc), exc.retry_after)
+
+
+@app.middleware("http")
+async def limit_process_inflight(request: Request, call_next):
+    global _process_inflight
+    if request.method != "POST" or request.url.path != "/process":
+        return await call_next(request)
+    if _process_inflight >= PROCESS_MAX_INFLIGHT:
+        busiest = max(admission.gates.values(), key=lambda gate: gate.retry_after())
+        return _too_busy("เซิร์ฟเวอร์รับงานเต็ม กรุณาลองใหม่ภายหลัง", busiest.retry_after())
+    _process_inflight += 1
+    try:
+        return await call_next(request)
+    finally:
+        _process_inflight -= 1
+
+
+@app.get("/admission")
+def get_admission():
+    """queue depth / เวลารอของแต่ละ analyzer ให้ uploader ใช้ตัดสินใจ back off"""
+    return {"inflight": _process_inflight, "max_inflight": PROCESS_MAX_INFLIGHT, "analyzers": admission.stats()}
+
 # ------------------------------------------------------------------------------------
 # [Railway] Config พื้นฐาน
 # ------------------------------------------------------------------------------------
@@ -56,6 +185,28 @@ os.makedirs(DATA_PONDS_DIR, exist_ok=True)
 
 storage = LocalStorage(storage_path=LOCAL_STORAGE_BASE, base_url=FILE_BASE_URL)
 
+# ------------------------------------------------------------------------------------
+# Model warm-up: โมเดลโหลดแบบ lazy ผ่าน utils/model_registry
+# MODEL_WARMUP=1 (ค่าเริ่มต้น) จะโหลดทุกโมเดลเบื้องหลังหลัง server พร้อมรับ request
+# ANALYSIS_EXECUTOR=process โหลดใน worker แต่ละตัวแทน process หลัก (ดู utils/worker_pool.start_warm_up)
+# MODEL_WARMUP_KEYS=size,water เลือกเฉพาะบางโมเดลได้
+# ------------------------------------------------------------------------------------
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "1") == "1"
+MODEL_WARMUP_KEYS = [k.strip() for k in os.environ.get("MODEL_WARMUP_KEYS", "").split(",") if k.strip()] or None
+
+@app.on_event("startup")
+async def warm_up_models():
+    if MODEL_WARMUP:
+        start_warm_up(MODEL_WARMUP_KEYS, preload=(__name__,))
+
+@app.on_event("shutdown")
+async def stop_worker_pool():
+    shutdown_worker_pool(wait=False)
+
+@app.get("/models")
+def get_models():
+    return {**model_stats(), "water_prefilter": prefilter_stats()}
+
 BANGKOK_TZ = timezone(timedelta(hours=7))
 
 def now_bangkok():
@@ -114,11 +265,6 @@ def _extract_public_subpath(parts):
     return None
 
 
-def _payload_signature(payload: dict, ignore_keys: tuple[str, ...] = ()) -> str:
-    filtered = {k: payload[k] for k in payload if k not in ignore_keys}
-    return json.dumps(filtered, sort_keys=True, ensure_ascii=False)
-
-
 def make_public_url(file_path: str) -> str:
     abs_file = os.path.abspath(file_path)
     rel_path = _relative_to_storage(abs_file)
@@ -149,19 +295,6 @@ def build_public_url(file_path: str) -> str:
 
     return make_public_url(abs_file)
 
-# ------------------------------------------------------------------------------------
-# Helper: ดึงค่า length/weight จาก text_content
-# ------------------------------------------------------------------------------------
-def _extract_size_from_text(text: str):
-    matches = re.findall(r"Shrimp\s+\d+:\s*([\d.]+)\s*cm\s*/\s*([\d.]+)\s*g", text)
-    if matches:
-        lengths = [float(m[0]) for m in matches]
-        weights = [float(m[1]) for m in matches]
-        avg_length = sum(lengths) / len(lengths)
-        avg_weight = sum(weights) / len(weights)
-        return avg_length, avg_weight
-    return None, None
-
 # ------------------------------------------------------------------------------------
 # save_json_result (แก้ไขให้มี shrimp_size)
 # ------------------------------------------------------------------------------------
@@ -169,10 +302,16 @@ def save_json_result(result_type, original_name,
                      output_image=None, output_text_path=None,
                      pond_number=None, total_larvae=None,
                      survival_rate=None, output_video=None,
-                     original_input_path=None):
-
+                     original_input_path=None, raw_input_path=None, result=None):
+    """
+    บันทึกผลวิเคราะห์เป็น JSON
+    result: ผลลัพธ์จาก analyzer (process/results.py) เก็บลง "result" ตรง ๆ และใช้ to_text() เป็น text_content
+            จึงไม่ต้องอ่านไฟล์ txt กลับมา
+    """
     text_content = None
-    if output_text_path and os.path.exists(output_text_path):
+    if result is not None:
+        text_content = result.to_text()
+    elif output_text_path and os.path.exists(output_text_path):
         with open(output_text_path, 'r', encoding='utf-8') as f:
             text_content = f.read()
 
@@ -186,6 +325,8 @@ def save_json_result(result_type, original_name,
         "survival_rate": survival_rate,
         "text_content": text_content
     }
+    if result is not None:
+        result_data["result"] = result.to_dict()
 
     if result_data["pond_number"] is None and original_name:
         fallback_pond = extract_pond_id_from_filename(original_name.lower())
@@ -215,10 +356,14 @@ def save_json_result(result_type, original_name,
             pass
         if os.path.exists(raw_dest):
             result_data["raw_input_image"] = build_public_url(raw_dest)
+    elif raw_input_path:
+        # raw input ถูกเขียนลง storage แยกไว้แล้ว (หรือกำลังเขียนอยู่เบื้องหลัง)
+        result_data["raw_input_image"] = build_public_url(raw_input_path)
 
     # ✅ เพิ่ม shrimp_size ถ้าเป็น result_type = "size"
     if result_type == "size":
-        length_cm, weight_avg_g = _extract_size_from_text(text_content or "")
+        length_cm = getattr(result, "avg_length_cm", None)
+        weight_avg_g = getattr(result, "avg_weight_g", None)
         result_data["shrimp_size"] = {
             "length_cm": length_cm,
             "weight_avg_g": weight_avg_g,
@@ -233,6 +378,7 @@ def save_json_result(result_type, original_name,
 
     with open(json_path, 'w', encoding='utf-8') as f:
         json.dump(result_data, f, ensure_ascii=False, indent=2)
+    index_record(result_type, json_path, result_data)
 
     return json_path
 
@@ -258,120 +404,480 @@ def get_latest_pond_info_for_pond(data_ponds_dir, pond_id):
 # ------------------------------------------------------------------------------------
 # API: /process
 # ------------------------------------------------------------------------------------
-@app.post("/process")
-async def process_files(files: List[UploadFile] = File(...)):
-    os.makedirs("input_raspi1", exist_ok=True)
-    os.makedirs("input_raspi2", exist_ok=True)
-    os.makedirs("input_video", exist_ok=True)
+# ชนิดภาพ -> (prefix ของชื่อไฟล์ input, โฟลเดอร์ input, result_type ใน save_json_result, type ใน response)
+IMAGE_KINDS = {
+    "shrimp": ("shrimp_float", "input_raspi2", "shrimp", "shrimp_floating"),
+    "size":   ("shrimp",       "input_raspi1", "size",   "shrimp_size"),
+    "water":  ("water",        "input_raspi2", "water",  "water_image"),
+}
+
+
+def _classify_image(filename_lower: str):
+    if "shrimp_float" in filename_lower:
+        return "shrimp"
+    if "shrimp" in filename_lower:
+        return "size"
+    if "water" in filename_lower:
+        return "water"
+    return None
+
+
+def _upload_kind(filename: str):
+    """analyzer ที่ไฟล์นี้จะใช้ (ดูจากชื่อไฟล์อย่างเดียว) None = ไม่รู้จัก ให้ _save_upload ตอบ 400"""
+    filename_lower = (filename or "").lower()
+    ext = os.path.splitext(filename_lower)[-1]
+    if ext in [".jpg", ".jpeg", ".png"]:
+        return _classify_image(filename_lower)
+    if ext in [".mp4", ".avi", ".mov"]:
+        return "din"
+    return None
+
+
+def _unique_input_path(folder: str, stem: str, ext: str, used: set) -> str:
+    """กันชื่อไฟล์ชนกันเมื่อส่งหลายภาพของบ่อเดียวกันมาในครั้งเดียว"""
+    input_path = os.path.join(folder, f"{stem}{ext}")
+    n = 1
+    while input_path in used:
+        input_path = os.path.join(folder, f"{stem}_{n}{ext}")
+        n += 1
+    used.add(input_path)
+    return input_path
+
+
+# เก็บไฟล์ภาพ input ไว้หลังวิเคราะห์หรือไม่ (0 = ลบหลัง /process เสร็จ ยกเว้น annotate=lazy ที่ยังต้องใช้วาด)
+SAVE_INPUT_UPLOADS = os.environ.get("SAVE_INPUT_UPLOADS", "1") == "1"
+
+# upload ถูก stream ลงดิสก์ทีละ chunk ใช้ memory ไม่เกิน 1 chunk ต่อไฟล์ ไม่ว่าไฟล์จะใหญ่แค่ไหน
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_KB", "1024")) * 1024
+MAX_IMAGE_UPLOAD_MB = float(os.environ.get("MAX_IMAGE_UPLOAD_MB", "25"))
+MAX_VIDEO_UPLOAD_MB = float(os.environ.get("MAX_VIDEO_UPLOAD_MB", "500"))
+
+
+def _raw_input_path(result_type: str, input_path: str) -> str:
+    return os.path.join(LOCAL_STORAGE_BASE, result_type, "raw", os.path.basename(input_path))
+
+
+def _link_or_copy(src: str, dst: str):
+    """hard link (ไม่ต้องเขียนข้อมูลซ้ำ) ถ้าอยู่คนละ filesystem ค่อย copy"""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _remove_item_files(items):
+    """ลบไฟล์ input (ภาพ / วิดีโอ) และ hard link raw input ของ item ที่บันทึกไว้"""
+    for item in items:
+        _remove_quietly(item["input_path"])
+        if item.get("raw_input_path"):
+            _remove_quietly(item["raw_input_path"])
+
+
+async def _stream_upload(file: UploadFile, path: str, max_mb: float) -> str:
+    """
+    เขียนไฟล์ที่อัปโหลดลงดิสก์ทีละ chunk ด้วย aiofiles และคำนวณ SHA-256 ไประหว่างทาง
+    เกิน max_mb -> 413 (ลบไฟล์ที่เขียนไปบางส่วน)
+    :return: SHA-256 (hex) ของเนื้อไฟล์
+    """
+    max_bytes = int(max_mb * 1024 * 1024)
+    too_large = HTTPException(status_code=413, detail=f"ไฟล์ {file.filename} ใหญ่เกิน {max_mb:g} MB")
+    if file.size is not None and file.size > max_bytes:
+        raise too_large
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise too_large
+                digest.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        _remove_quietly(path)
+        raise
+    return digest.hexdigest()
+
+
+def _run_image_batch(kind: str, items: list, annotate: str = None):
+    """เรียกโมเดลครั้งเดียวต่อกลุ่มภาพ แล้วคืนผลแยกตามลำดับ items"""
+    # ภาพถูก stream ลงดิสก์แล้ว analyzer decode จาก path (ไฟล์ยังอยู่ใน page cache)
+    sources = [item["input_path"] for item in items]
+    names = [os.path.basename(item["input_path"]) for item in items]
+    if kind == "shrimp":
+        return analyze_kuny_batch(sources, names, annotate=annotate)
+    if kind == "size":
+        return analyze_shrimp_batch(sources,
+                                    total_larvae=[item["total_larvae"] for item in items],
+                                    pond_number=[item["pond_number"] for item in items],
+                                    names=names, annotate=annotate)
+    return analyze_water_batch(sources, names, pond_numbers=[item["pond_number"] for item in items],
+                               annotate=annotate)
+
+
+async def _save_uploads(files: List[UploadFile], input_root: str = None):
+    """
+    stream ไฟล์ที่อัปโหลดลงดิสก์ แล้วคืน list ของ item (dict ที่ serialize เป็น JSON ได้)
+    input_root: ถ้าระบุ จะเก็บ input ไว้ใต้โฟลเดอร์นี้แทน input_raspi1/2, input_video
+    จำกัดขนาดด้วย MAX_IMAGE_UPLOAD_MB / MAX_VIDEO_UPLOAD_MB (413) ถ้าไฟล์ใดล้มเหลว ไฟล์ที่บันทึกไปแล้วจะถูกลบ
+    """
+    root = input_root or ""
+    for folder in ("input_raspi1", "input_raspi2", "input_video"):
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
 
-    results = []
     now_str = now_bangkok().strftime("%Y%m%d_%H%M%S")
+    used_paths = set()
+    items = []
 
-    for file in files:
-        filename = file.filename
-        filename_lower = filename.lower()
-        ext = os.path.splitext(filename_lower)[-1]
-        print(f"📦 Received file: {filename}")
+    try:
+        for index, file in enumerate(files):
+            items.append(await _save_upload(index, file, root, now_str, used_paths))
+    except BaseException:
+        _remove_item_files(items)
+        raise
+    return items
 
-        try:
-            if ext in [".jpg", ".jpeg", ".png"]:
-                content = await file.read()
-                pond_id = extract_pond_id_from_filename(filename_lower)
-                if pond_id is None:
-                    raise HTTPException(status_code=400, detail="ไม่พบ pond_id ในชื่อไฟล์!")
-
-                pond_number, total_larvae = get_latest_pond_info_for_pond(DATA_PONDS_DIR, pond_id)
-
-                # Shrimp Floating
-                if "shrimp_float" in filename_lower:
-                    input_path = os.path.join("input_raspi2", f"shrimp_float_pond{pond_id}_{now_str}{ext}")
-                    with open(input_path, "wb") as f:
-                        f.write(content)
-
-                    output_img_path, output_txt_path = analyze_kuny(input_path)
-
-                    json_path = save_json_result(
-                        result_type="shrimp",
-                        original_name=filename,
-                        output_image=output_img_path,
-                        output_text_path=output_txt_path,
-                        pond_number=pond_number,
-                        total_larvae=total_larvae
-                    )
-                    results.append({"type": "shrimp_floating", "filename": filename, "json": json_path})
-
-                # Shrimp Size
-                elif "shrimp" in filename_lower:
-                    input_path = os.path.join("input_raspi1", f"shrimp_pond{pond_id}_{now_str}{ext}")
-                    with open(input_path, "wb") as f:
-                        f.write(content)
-
-                    output_img_path, output_txt_path = analyze_shrimp(input_path, total_larvae=total_larvae, pond_number=pond_number)
-
-                    json_path = save_json_result(
-                        result_type="size",
-                        original_name=filename,
-                        output_image=output_img_path,
-                        output_text_path=output_txt_path,
-                        pond_number=pond_number,
-                        total_larvae=total_larvae,
-                        original_input_path=input_path
-                    )
-                    results.append({"type": "shrimp_size", "filename": filename, "json": json_path})
-
-                # Water
-                elif "water" in filename_lower:
-                    input_path = os.path.join("input_raspi2", f"water_pond{pond_id}_{now_str}{ext}")
-                    with open(input_path, "wb") as f:
-                        f.write(content)
-
-                    output_img_path, output_txt_path = analyze_water(input_path)
-
-                    json_path = save_json_result(
-                        result_type="water",
-                        original_name=filename,
-                        output_image=output_img_path,
-                        output_text_path=output_txt_path,
-                        pond_number=pond_number,
-                        total_larvae=total_larvae
-                    )
-                    results.append({"type": "water_image", "filename": filename, "json": json_path})
-
-                else:
-                    raise HTTPException(status_code=400, detail="ชื่อไฟล์ไม่ถูกต้อง")
-
-            # Video
-            elif ext in [".mp4", ".avi", ".mov"]:
-                pond_id = extract_pond_id_from_filename(filename_lower)
-                if pond_id is None:
-                    raise HTTPException(status_code=400, detail="ไม่พบ pond_id ในชื่อไฟล์!")
-
-                pond_number, total_larvae = get_latest_pond_info_for_pond(DATA_PONDS_DIR, pond_id)
-
-                input_path = os.path.join("input_video", f"video_pond{pond_id}_{now_str}{ext}")
-                with open(input_path, "wb") as f:
-                    shutil.copyfileobj(file.file, f)
-
-                output_video_path, output_txt_path = analyze_video(input_path)
-
-                json_path = save_json_result(
-                    result_type="din",
-                    original_name=filename,
-                    output_video=output_video_path,
-                    output_text_path=output_txt_path,
-                    pond_number=pond_number,
-                    total_larvae=total_larvae
-                )
-                results.append({"type": "shrimp_video", "filename": filename, "json": json_path})
 
-            else:
-                raise HTTPException(status_code=400, detail="ไม่รองรับไฟล์ประเภทนี้")
+async def _save_upload(index: int, file: UploadFile, root: str, now_str: str, used_paths: set) -> dict:
+    filename = file.filename
+    filename_lower = filename.lower()
+    ext = os.path.splitext(filename_lower)[-1]
+    print(f"📦 Received file: {filename}")
+
+    try:
+        if ext in [".jpg", ".jpeg", ".png"]:
+            pond_id = extract_pond_id_from_filename(filename_lower)
+            if pond_id is None:
+                raise HTTPException(status_code=400, detail="ไม่พบ pond_id ในชื่อไฟล์!")
+
+            kind = _classify_image(filename_lower)
+            if kind is None:
+                raise HTTPException(status_code=400, detail="ชื่อไฟล์ไม่ถูกต้อง")
+
+            pond_number, total_larvae = get_latest_pond_info_for_pond(DATA_PONDS_DIR, pond_id)
 
+            prefix, folder, result_type, _ = IMAGE_KINDS[kind]
+            input_path = _unique_input_path(os.path.join(root, folder),
+                                            f"{prefix}_pond{pond_id}_{now_str}", ext, used_paths)
+            sha256 = await _stream_upload(file, input_path, MAX_IMAGE_UPLOAD_MB)
+
+        # Video
+        elif ext in [".mp4", ".avi", ".mov"]:
+            pond_id = extract_pond_id_from_filename(filename_lower)
+            if pond_id is None:
+                raise HTTPException(status_code=400, detail="ไม่พบ pond_id ในชื่อไฟล์!")
+
+            kind = "din"
+            pond_number, total_larvae = get_latest_pond_info_for_pond(DATA_PONDS_DIR, pond_id)
+
+            input_path = _unique_input_path(os.path.join(root, "input_video"),
+                                            f"video_pond{pond_id}_{now_str}", ext, used_paths)
+            sha256 = await _stream_upload(file, input_path, MAX_VIDEO_UPLOAD_MB)
+
+        else:
+            raise HTTPException(status_code=400, detail="ไม่รองรับไฟล์ประเภทนี้")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"❗ Error processing {filename}: {e}")
+
+    item = {
+        "index": index,
+        "kind": kind,
+        "filename": filename,
+        "input_path": input_path,
+        "pond_id": pond_id,
+        "pond_number": pond_number,
+        "total_larvae": total_larvae,
+        "sha256": sha256,
+    }
+    if kind == "size":
+        # raw input ของภาพวัดขนาดใช้เป็น PicFood ใน app จึงเก็บลง storage เสมอ (hard link ไม่ต้องเขียนซ้ำ)
+        item["raw_input_path"] = _raw_input_path(result_type, input_path)
+        await asyncio.to_thread(_link_or_copy, input_path, item["raw_input_path"])
+    return item
+
+
+# ------------------------------------------------------------------------------------
+# Result cache: ไฟล์เดิม (SHA-256 เดียวกัน) + โมเดลเดิม + พารามิเตอร์เดิม -> คืน JSON เดิม ไม่รันโมเดลซ้ำ
+# ------------------------------------------------------------------------------------
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE", "1") == "1"
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(LOCAL_STORAGE_BASE, "result_cache"))
+RESULT_CACHE_MAX_MB = float(os.environ.get("RESULT_CACHE_MAX_MB", "64"))
+
+result_cache = ResultCache(RESULT_CACHE_DIR, int(RESULT_CACHE_MAX_MB * 1024 * 1024)) if RESULT_CACHE_ENABLED else None
+
+# analyzer ของแต่ละ kind ใช้โมเดลตัวไหน
+KIND_MODEL_KEYS = {"size": "size", "shrimp": "shrimp", "water": "water", "din": "din"}
+
+
+def _result_cache_key(item: dict, annotate: str):
+    if result_cache is None or not item.get("sha256"):
+        return None
+    kind = item["kind"]
+    model_key = KIND_MODEL_KEYS[kind]
+    # pond_id จากชื่อไฟล์ต้องอยู่ใน key: ภาพเดียวกันที่ส่งมาในนามบ่ออื่นต้องได้ผล (และไฟล์ JSON) ของบ่อนั้น
+    # pond_number มาจากข้อมูลบ่อ (data_ponds) และเป็น None ได้ถ้าบ่อยังไม่มีข้อมูล
+    params = {"annotate": annotate, "pond_id": item.get("pond_id"), "pond_number": item["pond_number"],
+              "total_larvae": item["total_larvae"]}
+    if kind == "din":
+        params.update(frame_stride=DIN_FRAME_STRIDE, max_infer_side=DIN_MAX_INFER_SIDE,
+                      encode=video_encode_settings())
+    elif kind in ("size", "shrimp"):
+        params["tiling"] = tiling_signature(model_key)
+    elif kind == "water":
+        params["fast_path"] = WATER_FAST_PATH
+    profile = resolve_profile(model_key, None, item["pond_number"])
+    return make_cache_key(sha256=item["sha256"], kind=kind,
+                          model=model_version(model_key, profile), params=params)
+
+
+def _cached_result(key: str, filename: str):
+    """คืน response ของผลที่เคยวิเคราะห์แล้ว (เขียน JSON กลับคืนถ้าไฟล์เดิมถูกลบไป)"""
+    entry = result_cache.get(key) if key else None
+    if entry is None:
+        return None
+    json_path = entry["json_path"]
+    if not os.path.exists(json_path):
+        os.makedirs(os.path.dirname(json_path), exist_ok=True)
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(entry["document"], f, ensure_ascii=False, indent=2)
+        index_record(os.path.basename(os.path.dirname(json_path)), json_path, entry["document"])
+    print(f"♻️ Cache hit: {filename} -> {json_path}")
+    return {"type": entry["type"], "filename": filename, "json": json_path, "cached": True}
+
+
+def _store_result(key: str, response: dict):
+    if not key:
+        return
+    with open(response["json"], "r", encoding="utf-8") as f:
+        document = json.load(f)
+    result_cache.put(key, {"type": response["type"], "json_path": response["json"], "document": document})
+
+
+@app.get("/cache")
+def get_cache_stats():
+    """สถิติของ result cache (hit rate, จำนวน entry, ขนาดบนดิสก์)"""
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+
+async def _analyze_items(items: list, on_file_done=None, video_progress=None, annotate: str = None,
+                         reject: bool = True):
+    """
+    วิเคราะห์ item ที่บันทึกแล้ว: ภาพรันเป็น batch ต่อ analyzer, วิดีโอรันทีละไฟล์
+    on_file_done(n_files, current_filename): coroutine ที่ await หลังแต่ละไฟล์/กลุ่มเสร็จ
+    video_progress: callback ที่ส่งต่อให้ analyze_video (ต้อง pickle ได้)
+    annotate: off / eager / lazy (None = ANNOTATE_MODE ดู utils/annotation.py)
+    reject: True = คิวของ analyzer เต็มให้ raise AdmissionRejected (429), False = รอจนได้ slot (/jobs)
+    :return: list ของผลลัพธ์ตามลำดับไฟล์ที่อัปโหลด
+    """
+    annotate = resolve_annotate_mode(annotate)
+    results = {}
+
+    # ---------- ไฟล์ที่เคยวิเคราะห์แล้ว (upload ซ้ำ) คืนผลเดิมจาก cache ----------
+    cache_keys = {}
+    pending = []
+    for item in items:
+        key = _result_cache_key(item, annotate)
+        cached = await asyncio.to_thread(_cached_result, key, item["filename"]) if key else None
+        if cached is not None:
+            results[item["index"]] = cached
+            if on_file_done:
+                await on_file_done(1, None)
+            continue
+        cache_keys[item["index"]] = key
+        pending.append(item)
+    items = pending
+
+    for item in items:
+        if item["kind"] != "din":
+            continue
+        filename = item["filename"]
+        if on_file_done:
+            await on_file_done(0, filename)
+        try:
+            din_result = await admission.run(
+                "din", run_analysis, analyze_video, item["input_path"],
+                progress_callback=video_progress, annotate=annotate, reject=reject)
+
+            json_path = await asyncio.to_thread(
+                save_json_result,
+                result_type="din",
+                original_name=filename,
+                output_video=din_result.output_path,
+                result=din_result,
+                pond_number=item["pond_number"],
+                total_larvae=item["total_larvae"]
+            )
+            item["saved"] = True
+        except AdmissionRejected:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"❗ Error processing {filename}: {e}")
+        results[item["index"]] = {"type": "shrimp_video", "filename": filename, "json": json_path}
+        await asyncio.to_thread(_store_result, cache_keys[item["index"]], results[item["index"]])
+        if on_file_done:
+            await on_file_done(1, None)
+
+    # ---------- รันโมเดลครั้งเดียวต่อกลุ่มภาพ แล้วแยกผลกลับไปแต่ละไฟล์ ----------
+    for kind in IMAGE_KINDS:
+        group = [item for item in items if item["kind"] == kind]
+        if not group:
+            continue
+        _, _, result_type, response_type = IMAGE_KINDS[kind]
+        names = ", ".join(item["filename"] for item in group)
+        if on_file_done:
+            await on_file_done(0, names)
+        try:
+            outputs = await admission.run(kind, run_analysis, _run_image_batch, kind, group, annotate,
+                                          reject=reject)
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"❗ Error processing {names}: {e}")
+
+        for item, result in zip(group, outputs):
+            try:
+                json_path = await asyncio.to_thread(
+                    save_json_result,
+                    result_type=result_type,
+                    original_name=item["filename"],
+                    output_image=result.output_path,
+                    result=result,
+                    pond_number=item["pond_number"],
+                    total_larvae=item["total_larvae"],
+                    raw_input_path=item.get("raw_input_path")
+                )
+                item["saved"] = True
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"❗ Error processing {item['filename']}: {e}")
+            results[item["index"]] = {"type": response_type, "filename": item["filename"], "json": json_path}
+            await asyncio.to_thread(_store_result, cache_keys[item["index"]], results[item["index"]])
+        if on_file_done:
+            await on_file_done(len(group), None)
+
+    return [results[i] for i in sorted(results)]
+
+
+def _annotate_param(annotate: Optional[str]):
+    try:
+        return resolve_annotate_mode(annotate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+
+@app.post("/process")
+async def process_files(files: List[UploadFile] = File(...),
+                        annotate: Optional[str] = Query(None, description="off / eager / lazy")):
+    annotate = _annotate_param(annotate)
+    # ปฏิเสธก่อนบันทึกไฟล์ถ้าคิวของ analyzer ที่ต้องใช้เต็มแล้ว (ผลที่วิเคราะห์ไปแล้วอยู่ใน result cache
+    # ถ้าถูกปฏิเสธกลางทาง การส่งซ้ำจึงไม่ต้องวิเคราะห์ไฟล์เดิมอีก)
+    admission.check(kind for kind in map(_upload_kind, (file.filename for file in files)) if kind)
+    items = await _save_uploads(files)
+    try:
+        results = await _analyze_items(items, annotate=annotate)
+    except BaseException:
+        # 429 (AdmissionRejected) หรือ error กลางทาง: ไฟล์ที่ยังไม่มี JSON ผลลัพธ์อ้างถึง (saved) ไม่มีใครใช้แล้ว
+        # ลบทุกชนิดรวมวิดีโอและ raw input ส่วนที่วิเคราะห์เสร็จแล้วเก็บไว้ (raw_input_image / lazy render ยังอ้างอยู่)
+        _remove_item_files(item for item in items if not item.get("saved"))
+        raise
+    finally:
+        if not SAVE_INPUT_UPLOADS and annotate != "lazy":
+            for item in items:
+                if item["kind"] in IMAGE_KINDS:
+                    _remove_quietly(item["input_path"])
     return {"status": "success", "message": f"✅ ประมวลผลไฟล์สำเร็จ {len(results)} รายการ", "results": results}
 
+# ------------------------------------------------------------------------------------
+# API: /jobs (วิเคราะห์แบบ asynchronous สำหรับงานยาว เช่น วิดีโอ)
+# ------------------------------------------------------------------------------------
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(LOCAL_STORAGE_BASE, "jobs"))
+JOBS_MAX_QUEUED = int(os.environ.get("JOBS_MAX_QUEUED", "32"))
+JOBS_CONCURRENCY = max(1, int(os.environ.get("JOBS_CONCURRENCY", "1")))
+
+job_store = JobStore(JOBS_DIR, max_queued=JOBS_MAX_QUEUED)
+
+
+async def _run_job(job: dict):
+    job_id = job["id"]
+    files_done = 0
+
+    async def on_file_done(n_files, current_file):
+        # อ่าน + เขียนไฟล์ JSON ของงาน ทำใน thread เพื่อไม่ block event loop (await ทีละครั้ง ลำดับจึงไม่สลับ)
+        nonlocal files_done
+        files_done += n_files
+        await asyncio.to_thread(job_store.update, job_id,
+                                progress={"files_done": files_done, "current_file": current_file})
+
+    try:
+        return await _analyze_items(job["items"], on_file_done=on_file_done,
+                                    video_progress=JobProgress(job_store.progress_path(job_id)),
+                                    annotate=(job.get("options") or {}).get("annotate"), reject=False)
+    except HTTPException as e:
+        raise RuntimeError(e.detail)
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_store.recover()
+    for _ in range(JOBS_CONCURRENCY):
+        asyncio.create_task(job_store.worker(_run_job))
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(files: List[UploadFile] = File(...),
+                     annotate: Optional[str] = Query(None, description="off / eager / lazy")):
+    annotate = _annotate_param(annotate)
+    if job_store.queued_count() >= job_store.max_queued:
+        raise HTTPException(status_code=429, detail="คิวงานเต็ม กรุณาลองใหม่ภายหลัง")
+
+    job_id = job_store.new_job_id()
+    try:
+        items = await _save_uploads(files, input_root=job_store.input_dir(job_id))
+    except HTTPException:
+        shutil.rmtree(job_store.input_dir(job_id), ignore_errors=True)
+        raise
+    try:
+        job = job_store.submit(job_id, items, options={"annotate": annotate})
+    except JobQueueFull:
+        shutil.rmtree(job_store.input_dir(job_id), ignore_errors=True)
+        raise HTTPException(status_code=429, detail="คิวงานเต็ม กรุณาลองใหม่ภายหลัง")
+    return {"status": job["status"], "job_id": job_id, "status_url": f"/jobs/{job_id}"}
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ไม่พบงานนี้")
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "created_at": job.get("created_at"),
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "progress": job.get("progress"),
+        "results": job.get("results") or [],
+        "error": job.get("error"),
+    }
+
 @app.post("/data_ponds")
 async def receive_stock_json(request: Request):
     try:
@@ -401,6 +907,10 @@ async def receive_stock_json(request: Request):
 SENSOR_DIR = os.environ.get("SENSOR_DIR", "/data/local_storage/sensor")  # [Railway]
 os.makedirs(SENSOR_DIR, exist_ok=True)  # [Railway]
 
+# ค่า sensor ใหม่เก็บใน time-series store (utils/sensor_store.py) แยกตามบ่อ/วัน แทนไฟล์ JSON ต่อค่า
+# SENSOR_DIR เหลือไว้สำหรับไฟล์ sensor_*.json เดิม (ยังอ่านผ่าน result index จนกว่าจะ migrate)
+sensor_store = SensorStore()
+
 @app.post("/data")
 async def receive_sensor_data(request: Request):
     try:
@@ -409,28 +919,40 @@ async def receive_sensor_data(request: Request):
         raise HTTPException(status_code=400, detail="Invalid JSON")
 
     required_keys = ["pond_id", "ph", "temperature", "do", "timestamp"]
-    if not all(k in data for k in required_keys):
+    if not isinstance(data, dict) or not all(k in data for k in required_keys):
         raise HTTPException(status_code=400, detail="Missing required fields")
 
-    filename = f"sensor_{now_bangkok().strftime('%Y%m%dT%H%M%S%f')}.json"
-    file_path = os.path.join(SENSOR_DIR, filename)
-
     try:
-        with open(file_path, "w", encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # รอ group commit (เขียน + fsync พร้อมกับ request อื่นที่เข้ามาพร้อมกัน)
+        file_path = await asyncio.wrap_future(sensor_store.append(data))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save sensor data: {e}")
+    change_bus.publish("sensor", data.get("pond_id"))
 
-    print(f"✅ Saved sensor JSON: {file_path}")
     return {"status": "success", "saved_file": file_path}
 
+
+@app.get("/ponds/{pond_id}/sensors")
+def get_sensor_readings(pond_id: int,
+                        last: Optional[int] = Query(None, ge=1, le=10000, description="N ค่าล่าสุด (ใหม่ -> เก่า)"),
+                        start: Optional[datetime] = Query(None, description="ISO 8601 (ไม่มี timezone = เวลาไทย)"),
+                        end: Optional[datetime] = Query(None)):
+    """ค่า sensor ของบ่อ: ?last=N หรือช่วงเวลา ?start=...&end=... (เรียงเก่า -> ใหม่)"""
+    if start is None and end is None:
+        return {"pond_id": pond_id, "readings": sensor_store.last(pond_id, last or 1)}
+
+    def _epoch(dt):
+        return None if dt is None else (dt if dt.tzinfo else dt.replace(tzinfo=BANGKOK_TZ)).timestamp()
+
+    readings = sensor_store.range(pond_id, _epoch(start), _epoch(end))
+    return {"pond_id": pond_id, "readings": readings[-last:] if last else readings}
+
 # -----------------------------------------------------------------------------
 # [Railway] เพิ่ม entrypoint สำหรับรันด้วยพอร์ตที่ Railway กำหนดผ่าน ENV PORT
 
 
 # =========================
 # 1) CONFIG: โฟลเดอร์แหล่งข้อมูล (แก้ ENV ได้)
-import asyncio
 
 # =========================
 # 1) CONFIG
@@ -446,34 +968,41 @@ FS_SHRIMP_DIR = os.path.join(BASE_LOCAL, "shrimp")
 FS_SIZE_DIR   = os.path.join(BASE_LOCAL, "size")
 FS_DIN_DIR    = os.path.join(BASE_LOCAL, "din")
 
-POND_STATUS_FILE = os.path.join(BASE_LOCAL, "pond_status.json")
-SHRIMP_SIZE_FILE = os.path.join(BASE_LOCAL, "shrimp_size.json")
+# เอกสารของแต่ละบ่อ ({pond_id} = เลขบ่อ)
+POND_STATUS_FILE = os.path.join(BASE_LOCAL, "pond_status_{pond_id}.json")
+SHRIMP_SIZE_FILE = os.path.join(BASE_LOCAL, "shrimp_size_{pond_id}.json")
+# ชื่อไฟล์เดิม (ก่อนแยกต่อบ่อ) ยังเขียนให้บ่อหลัก DEFAULT_POND_ID เพื่อให้ผู้อ่านเดิม (/view, สคริปต์ภายนอก) ใช้ได้ต่อ
+DEFAULT_POND_ID = os.environ.get("DEFAULT_POND_ID", "1")
+LEGACY_POND_STATUS_FILE = os.path.join(BASE_LOCAL, "pond_status.json")
+LEGACY_SHRIMP_SIZE_FILE = os.path.join(BASE_LOCAL, "shrimp_size.json")
 
 # =========================
 # 2) HELPERS
 # =========================
-def _latest_json_in_dir(dir_path: str, pond_id: int | None = None):
-    if not os.path.isdir(dir_path):
-        return None, None
-    files = glob.glob(os.path.join(dir_path, "*.json"))
-    files.sort(key=lambda p: os.path.getmtime(p), reverse=True)
-    if not files:
-        return None, None
-    for p in files:
-        try:
-            with open(p, "r", encoding="utf-8") as f:
-                d = json.load(f)
-            pid = d.get("pond_id", d.get("pond_number"))
-            if pond_id is None or pid == pond_id:
-                return p, d
-        except:
-            continue
-    return None, None
+# ผลล่าสุดของแต่ละชนิดอ่านจาก result index (utils/result_index.py) แทนการ glob ทั้งโฟลเดอร์
+# ไฟล์ที่มีอยู่ก่อนมีดัชนีถูกนำเข้าตอน startup (หรือ python -m utils.result_index backfill)
+RESULT_INDEX_DIRS = {
+    "sensor": FS_SENSOR_DIR,
+    "san": FS_SAN_DIR,
+    "water": FS_WATER_DIR,
+    "shrimp": FS_SHRIMP_DIR,
+    "size": FS_SIZE_DIR,
+    "din": FS_DIN_DIR,
+}
+RESULT_INDEX_BACKFILL_ON_STARTUP = os.environ.get("RESULT_INDEX_BACKFILL_ON_STARTUP", "1") == "1"
+
+
+def _result_index_dirs() -> dict:
+    return dict(RESULT_INDEX_DIRS, sensor=SENSOR_DIR) if SENSOR_DIR != FS_SENSOR_DIR else RESULT_INDEX_DIRS
 
-def _pick_url_maybe_list(v):
-    if isinstance(v, list):
-        return v[0] if v else None
-    return v
+
+@app.on_event("startup")
+async def backfill_result_index_on_startup():
+    if not RESULT_INDEX_BACKFILL_ON_STARTUP:
+        return
+    imported = await asyncio.to_thread(backfill_result_index, _result_index_dirs())
+    if any(imported.values()):
+        print(f"📥 Result index backfill: {imported}")
 
 def _send_json_to(url: str, data: dict):
     """ส่ง JSON ไปยังปลายทาง ถ้าไม่ได้ตั้งค่า URL จะไม่ส่ง"""
@@ -489,233 +1018,150 @@ def _send_json_to(url: str, data: dict):
     except Exception as e:
         print(f"❌ Push to app failed ({url}): {e}")
 
-def _extract_size_from_json(size_json: dict):
-    if "shrimp_size" in size_json:
-        sc = size_json["shrimp_size"]
-        return sc.get("length_cm"), sc.get("weight_avg_g")
-
-    txt = size_json.get("text_content") or ""
-    # ✅ Match pattern "Shrimp 1: 0.33 cm / 0.00 g"
-    matches = re.findall(r"Shrimp\s+\d+:\s*([\d.]+)\s*cm\s*/\s*([\d.]+)\s*g", txt)
-    if matches:
-        lengths = [float(m[0]) for m in matches]
-        weights = [float(m[1]) for m in matches]
-        avg_length = sum(lengths) / len(lengths)
-        avg_weight = sum(weights) / len(weights)
-        return avg_length, avg_weight
-
-    return None, None
-
 
 # =========================
-# 3) CACHE
+# 3) POND STATE
 # =========================
-last_seen_data = {
-    "sensor": None,
-    "san": None,
-    "water": None,
-    "shrimp": None,
-    "size": None,
-    "din": None
+# สถานะของทุกบ่ออยู่ใน pond_engine (utils/pond_status.py) ตารางต่อบ่อ อัปเดตเฉพาะช่องที่มี change event
+# เอกสารที่เปลี่ยนจริง (signature ใหม่) จะถูกเขียนลงไฟล์ของบ่อนั้นและ push ไปแอป
+# PUSH_POND_IDS = จำกัดเฉพาะบ่อ (คั่นด้วย comma) ว่าง = ทุกบ่อที่มีข้อมูล
+PUSH_POND_IDS = [p.strip() for p in os.environ.get("PUSH_POND_IDS", "").split(",") if p.strip()]
+PUSH_DEBOUNCE_MS = float(os.environ.get("PUSH_DEBOUNCE_MS", "300"))
+PUSH_INOTIFY = os.environ.get("PUSH_INOTIFY", "1") == "1"
+
+PUSH_TARGETS = {
+    "status": (POND_STATUS_FILE, LEGACY_POND_STATUS_FILE, APP_STATUS_URL),
+    "size": (SHRIMP_SIZE_FILE, LEGACY_SHRIMP_SIZE_FILE, APP_SIZE_URL),
 }
 
-last_seen_paths = {
-    "sensor": None,
-    "san": None,
-    "water": None,
-    "shrimp": None,
-    "size": None,
-    "din": None
-}
 
-last_sent_signatures = {
-    "status": None,
-    "size": None
-}
+def _write_json_atomic(path: str, doc: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
 
-# =========================
-# 4) BUILDERS
-# =========================
-def build_pond_status_json(pond_id: int) -> dict:
-    sensor_d = last_seen_data["sensor"]
-    san_d    = last_seen_data["san"]
-    water_d  = last_seen_data["water"]
-    shrimp_d = last_seen_data["shrimp"]
-
-    sensor_part = {"temperature": None, "ph": None, "do": None}
-    if sensor_d:
-        sensor_part = {
-            "temperature": sensor_d.get("temperature"),
-            "ph": sensor_d.get("ph"),
-            "do": sensor_d.get("do"),
-        }
 
-    minerals = {"Mineral_1": 0.0, "Mineral_2": 0.0, "Mineral_3": 0.0, "Mineral_4": 0.0}
-    if san_d:
-        arr = san_d.get("remaining_g") or []
-        for i in range(4):
-            minerals[f"Mineral_{i+1}"] = float(arr[i]) if i < len(arr) else 0.0
+def _publish_pond_document(kind: str, pond_id, doc: dict):
+    file_template, legacy_path, url = PUSH_TARGETS[kind]
+    _write_json_atomic(file_template.format(pond_id=pond_id), doc)
+    if str(pond_id) == DEFAULT_POND_ID:
+        _write_json_atomic(legacy_path, doc)
+    if url:
+        _send_json_to(url, doc)
 
-    water_image = None
-    water_color = "unknown"
-    if water_d:
-        water_image = _pick_url_maybe_list(water_d.get("output_image"))
-        water_color = (water_d.get("text_content") or "").strip() or "unknown"
 
-    shrimp_float_image = None
-    if shrimp_d:
-        shrimp_float_image = _pick_url_maybe_list(shrimp_d.get("output_image"))
+def _pond_lookup(result_type: str, pond: str):
+    """sensor อ่านจาก sensor_store (key = เวลารับค่า) ถ้าบ่อนี้ยังไม่มีใน store ใช้ไฟล์เดิมจาก result index"""
+    if result_type == "sensor":
+        readings = sensor_store.last(pond, 1)
+        if readings:
+            return f"sensor_store:{readings[0]['received_at']!r}", readings[0]
+    return latest_record(result_type, pond)
 
-    data = {
-        "pondId": str(pond_id) if pond_id is not None else None,
-        "timestamp": format_timestamp(),
-        "DO": sensor_part["do"],
-        "PH": sensor_part["ph"],
-        "Temp": sensor_part["temperature"],
-        "ColorWater": water_color,
-        "Mineral_1": minerals["Mineral_1"],
-        "Mineral_2": minerals["Mineral_2"],
-        "Mineral_3": minerals["Mineral_3"],
-        "Mineral_4": minerals["Mineral_4"],
-        "PicColorWater": water_image,
-        "PicKungOnWater": shrimp_float_image
-    }
 
-    with open(POND_STATUS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    return data
+def _initial_ponds():
+    return PUSH_POND_IDS or sorted(set(known_ponds(POND_SOURCE_TYPES)) | set(sensor_store.ponds()))
 
-def build_shrimp_size_json(pond_id: int) -> dict:
-    size_d = last_seen_data["size"]
-    din_d  = last_seen_data["din"]
 
-    size_image = None
-    raw_image = None
-    length_cm, weight_g = None, None
-    if size_d:
-        size_image = _pick_url_maybe_list(size_d.get("output_image"))
-        raw_image = size_d.get("raw_input_image")
-        length_cm, weight_g = _extract_size_from_json(size_d)
-
-    video_url = None
-    if din_d:
-        video_url = din_d.get("output_video")
-
-    data = {
-        "pondId": pond_id,
-        "timestamp": format_timestamp(),
-        "Size_CM": length_cm,
-        "Size_gram": weight_g,
-        "SizePic": size_image,
-        "PicFood": raw_image or size_image,
-        "PicKungDinn": video_url
-    }
-    with open(SHRIMP_SIZE_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    return data
+pond_engine = PondStatusEngine(format_timestamp, _publish_pond_document, ponds=PUSH_POND_IDS or None,
+                               lookup=_pond_lookup)
+change_bus = ChangeBus()
+result_watcher = None
 
 # =========================
-# 5) BACKGROUND LOOP
+# 4) BACKGROUND LOOP
 # =========================
-async def loop_build_and_push(pond_id: int):
-    global last_seen_data, last_seen_paths, last_sent_signatures
+# ไม่ poll โฟลเดอร์: ทุกครั้งที่มีผลใหม่เข้าดัชนี (index_record) จะมี change event (utils/change_events.py)
+# task เดียวดูแลทุกบ่อ ตื่นทันที รอ PUSH_DEBOUNCE_MS เพื่อรวม event ที่ตามมาติด ๆ แล้วอัปเดตเฉพาะบ่อ/ชนิดที่เปลี่ยน
+# ไฟล์ที่ process อื่นเขียน (auto_dose.py) จับด้วย inotify (PUSH_INOTIFY=1) แล้ว index + ส่ง event เหมือนกัน
+async def loop_build_and_push():
+    subscription = change_bus.subscribe()
+    try:
+        # สถานะเริ่มต้นของทุกบ่อที่มีข้อมูลอยู่แล้ว
+        await asyncio.to_thread(lambda: pond_engine.load(_initial_ponds()))
+    except Exception as e:
+        print("?? Loop error:", e)
     while True:
+        changes = await subscription.wait(PUSH_DEBOUNCE_MS / 1000.0)
         try:
-            status_dirty = False
-            size_dirty = False
-            new_paths = {}
-
-            sensor_path, sensor_d = _latest_json_in_dir(FS_SENSOR_DIR, pond_id=pond_id)
-            if sensor_d:
-                last_seen_data["sensor"] = sensor_d
-            if sensor_path:
-                new_paths["sensor"] = sensor_path
-                if sensor_path != last_seen_paths.get("sensor"):
-                    status_dirty = True
-
-            san_path, san_d = _latest_json_in_dir(FS_SAN_DIR, pond_id=pond_id)
-            if san_d:
-                last_seen_data["san"] = san_d
-            if san_path:
-                new_paths["san"] = san_path
-                if san_path != last_seen_paths.get("san"):
-                    status_dirty = True
-
-            water_path, water_d = _latest_json_in_dir(FS_WATER_DIR, pond_id=pond_id)
-            if water_d:
-                last_seen_data["water"] = water_d
-            if water_path:
-                new_paths["water"] = water_path
-                if water_path != last_seen_paths.get("water"):
-                    status_dirty = True
-
-            shrimp_path, shrimp_d = _latest_json_in_dir(FS_SHRIMP_DIR, pond_id=pond_id)
-            if shrimp_d:
-                last_seen_data["shrimp"] = shrimp_d
-            if shrimp_path:
-                new_paths["shrimp"] = shrimp_path
-                if shrimp_path != last_seen_paths.get("shrimp"):
-                    status_dirty = True
-
-            size_path, size_d = _latest_json_in_dir(FS_SIZE_DIR, pond_id=pond_id)
-            if size_d:
-                last_seen_data["size"] = size_d
-            if size_path:
-                new_paths["size"] = size_path
-                if size_path != last_seen_paths.get("size"):
-                    size_dirty = True
-
-            din_path, din_d = _latest_json_in_dir(FS_DIN_DIR, pond_id=pond_id)
-            if din_d:
-                last_seen_data["din"] = din_d
-            if din_path:
-                new_paths["din"] = din_path
-                if din_path != last_seen_paths.get("din"):
-                    size_dirty = True
-
-            if status_dirty or size_dirty:
-                if status_dirty:
-                    status_json = build_pond_status_json(pond_id)
-                    status_signature = _payload_signature(status_json, ("timestamp", "pondId"))
-                    if status_signature != last_sent_signatures.get("status"):
-                        if APP_STATUS_URL:
-                            _send_json_to(APP_STATUS_URL, status_json)
-                        last_sent_signatures["status"] = status_signature
-
-                if size_dirty:
-                    size_json = build_shrimp_size_json(pond_id)
-                    size_signature = _payload_signature(size_json, ("timestamp", "pondId"))
-                    if size_signature != last_sent_signatures.get("size"):
-                        if APP_SIZE_URL:
-                            _send_json_to(APP_SIZE_URL, size_json)
-                        last_sent_signatures["size"] = size_signature
-
-                for key, value in new_paths.items():
-                    last_seen_paths[key] = value
-
+            # lookup + push (requests) เป็น blocking IO จึงรันใน thread ไม่ให้ event loop ค้าง
+            await asyncio.to_thread(pond_engine.apply, changes)
         except Exception as e:
             print("?? Loop error:", e)
 
-        await asyncio.sleep(5)
+
+def _on_external_result_file(result_type: str, path: str):
+    """
+    inotify: ส่ง event ทุกครั้ง เพราะ process อื่น (auto_dose.py) index ลงดัชนีเดียวกันเองได้
+    แต่ listener ของ process นี้ไม่ถูกเรียก event ซ้ำกับของ process นี้ถูกรวมด้วย debounce อยู่แล้ว
+    ไฟล์ที่ยังไม่อยู่ในดัชนีจะถูก index ก่อน (index_record ส่ง event ให้เอง)
+    """
+    doc = read_json_file(path)
+    if doc is None:
+        return
+    if not is_result_indexed(path):
+        index_record(result_type, path, doc, ts=os.path.getmtime(path))
+        return
+    pond = doc.get("pond_id", doc.get("pond_number"))
+    change_bus.publish(result_type, None if pond is None else str(pond))
+
+
+@app.on_event("startup")
+async def start_push_loop():
+    global result_watcher
+    change_bus.bind()
+    add_index_listener(change_bus.publish)
+    if PUSH_INOTIFY:
+        result_watcher = InotifyWatcher(_result_index_dirs(), _on_external_result_file)
+        if not result_watcher.start():
+            result_watcher = None
+            print("⚠️ inotify ใช้ไม่ได้ในระบบนี้: รับเฉพาะ change event จาก process นี้")
+    asyncio.create_task(loop_build_and_push())
+
+
+@app.on_event("shutdown")
+async def stop_result_watcher():
+    sensor_store.close()
+    if result_watcher is not None:
+        result_watcher.stop()
 
 
 # =========================
-# 6) ENDPOINTS
+# 5) ENDPOINTS
 # =========================
+@app.get("/ponds")
+def get_ponds():
+    return {**pond_engine.stats(), "events_published": change_bus.published}
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match ใช้ weak comparison (RFC 9110): ตัด W/ ออกก่อนเทียบ, "*" ตรงทุกค่า"""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _pond_document_response(kind: str, pond_id: int, request: Request, missing: str):
+    """ตอบจาก bytes ที่ serialize ไว้แล้วใน pond_engine ไม่มี disk I/O / json.load ต่อ request"""
+    cached = pond_engine.body(kind, pond_id)
+    if cached is None:
+        return JSONResponse({"error": missing})
+    body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @app.get("/ponds/{pond_id}/status")
-def get_status(pond_id: int):
-    if os.path.exists(POND_STATUS_FILE):
-        with open(POND_STATUS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"error": "no pond_status.json yet"}
+async def get_status(pond_id: int, request: Request):
+    return _pond_document_response("status", pond_id, request, f"no pond status for pond {pond_id} yet")
 
 @app.get("/ponds/{pond_id}/shrimp_size")
-def get_size(pond_id: int):
-    if os.path.exists(SHRIMP_SIZE_FILE):
-        with open(SHRIMP_SIZE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {"error": "no shrimp_size.json yet"}
-
+async def get_size(pond_id: int, request: Request):
+    return _pond_document_response("size", pond_id, request, f"no shrimp size for pond {pond_id} yet")
 
 
 from fastapi.responses import JSONResponse
@@ -753,7 +1199,8 @@ from fastapi.responses import FileResponse
 def view_file(path: str):
     """
     ดูไฟล์ที่อยู่ใน container (เช่น JSON หรือ TXT)
-    ใช้ query param เช่น /view?path=/data/local_storage/pond_status.json
+    ใช้ query param เช่น /view?path=/data/local_storage/pond_status_1.json
+    (pond_status.json / shrimp_size.json = สำเนาของบ่อ DEFAULT_POND_ID)
     """
     if not os.path.exists(path):
         raise HTTPException(status_code=404, detail="File not found")
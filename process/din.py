@@ -1,26 +1,302 @@
 import os
-from ultralytics import YOLO
+import threading
+import time
+from utils.model_registry import get_model
 from deep_sort_realtime.deepsort_tracker import DeepSort
 import numpy as np
 import imageio.v2 as imageio
 import cv2
+from utils.pipeline import StageStats, ThreadedSource, ThreadedSink, summarize_stages, format_stage_report
+from process.results import DinResult
+from utils.annotation import ANNOTATE_EAGER, ANNOTATE_LAZY, defer_render, register_renderer, resolve_annotate_mode
 
-# โหลดโมเดลกุ้งดิ้นจากโฟลเดอร์ Model/
-model_path = os.environ.get("MODEL_DIN", os.path.join("Model", "din.pt"))
-model = YOLO(model_path)
+# โมเดลกุ้งดิ้นโหลดแบบ lazy ผ่าน model registry (ดู utils/model_registry.py)
+MODEL_KEY = "din"
 
-tracker = DeepSort(max_age=30, n_init=3, max_cosine_distance=0.3)
 NO_MOVE_THRESHOLD = 2000
 LIGHT_MOVE_THRESHOLD = 2500
-shrimp_moved_once = set()
-movement_status = {}
 CONFIDENCE_THRESHOLD = 0.5
+FRAME_STRIDE = int(os.environ.get("DIN_FRAME_STRIDE", "1"))
+MAX_INFER_SIDE = int(os.environ.get("DIN_MAX_INFER_SIDE", "0"))
+PIPELINE_QUEUE_SIZE = int(os.environ.get("DIN_PIPELINE_QUEUE", "8"))
+INFER_BATCH = int(os.environ.get("DIN_INFER_BATCH", "4"))
 
-def analyze_video(input_path, original_name: str = None):
+# ===================== OUTPUT VIDEO ENCODING =====================
+# full       : เขียนทุกเฟรมที่วิเคราะห์ (แบบเดิม)
+# highlights : เขียนเฉพาะเฟรมที่มี track เปลี่ยนสถานะ (+ เฟรมสุดท้าย) เป็น slideshow ที่ DIN_HIGHLIGHT_FPS
+VIDEO_MODES = ("full", "highlights")
+HIGHLIGHT_FPS = float(os.environ.get("DIN_HIGHLIGHT_FPS", "2"))
+
+def _env_int(name):
+    value = os.environ.get(name)
+    return int(value) if value else None
+
+def video_encode_settings(**overrides) -> dict:
+    """
+    ค่า encode วิดีโอผลลัพธ์ (ค่าเริ่มต้นจาก env, override รายครั้งได้)
+    - mode: DIN_VIDEO_MODE (full / highlights)
+    - codec: DIN_VIDEO_CODEC (libx264)
+    - crf: DIN_VIDEO_CRF (ไม่ระบุ = ค่าเดิมของ imageio ~ crf 25) ใช้เมื่อไม่ได้ตั้ง bitrate
+    - bitrate: DIN_VIDEO_BITRATE เช่น "600k"
+    - preset: DIN_VIDEO_PRESET เช่น "veryfast" (libx264)
+    - max_side: DIN_VIDEO_MAX_SIDE ย่อด้านยาวของวิดีโอผลลัพธ์ (0 = ขนาดเดิม)
+    - fps: DIN_VIDEO_FPS fps ของวิดีโอผลลัพธ์ (0 = fps / frame_stride เหมือนเดิม) ความยาววิดีโอเท่าเดิม
+    """
+    settings = {
+        "mode": os.environ.get("DIN_VIDEO_MODE", "full"),
+        "codec": os.environ.get("DIN_VIDEO_CODEC", "libx264"),
+        "crf": _env_int("DIN_VIDEO_CRF"),
+        "bitrate": os.environ.get("DIN_VIDEO_BITRATE") or None,
+        "preset": os.environ.get("DIN_VIDEO_PRESET") or None,
+        "max_side": int(os.environ.get("DIN_VIDEO_MAX_SIDE", "0")),
+        "fps": float(os.environ.get("DIN_VIDEO_FPS", "0")),
+    }
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+    if settings["mode"] not in VIDEO_MODES:
+        raise ValueError(f"❌ Unknown DIN video mode: {settings['mode']}. ใช้ได้แค่ {list(VIDEO_MODES)}")
+    return settings
+
+class AnnotatedVideoWriter:
+    """
+    เขียนวิดีโอผลลัพธ์ตาม video_encode_settings: ลด fps (ข้ามเฟรม), ย่อขนาด, highlights
+    และจับเวลา encode + ขนาดไฟล์ไว้เทียบกันระหว่าง setting
+    """
+
+    def __init__(self, output_path: str, analyzed_fps: float, settings: dict):
+        self.output_path = output_path
+        self.settings = settings
+        if settings["mode"] == "highlights":
+            self.step, self.fps = 1, settings["fps"] or HIGHLIGHT_FPS
+        else:
+            self.step = max(1, int(round(analyzed_fps / settings["fps"]))) if settings["fps"] else 1
+            self.fps = analyzed_fps / self.step
+        self._writer = None
+        self._size = None
+        self._seen = 0
+        self._last = None  # เฟรมล่าสุดที่ยังไม่ได้เขียน (highlights จะปิดท้ายด้วยเฟรมนี้)
+        self.frames_written = 0
+        self.encode_seconds = 0.0
+
+    def _open(self, frame):
+        height, width = frame.shape[:2]
+        max_side = self.settings["max_side"]
+        scale = max_side / float(max(width, height)) if max_side and max(width, height) > max_side else 1.0
+        self._size = (int(round(width * scale)) // 2 * 2, int(round(height * scale)) // 2 * 2)
+        output_params = []
+        if self.settings["bitrate"] is None and self.settings["crf"] is not None:
+            output_params += ["-crf", str(self.settings["crf"])]
+        if self.settings["preset"]:
+            output_params += ["-preset", self.settings["preset"]]
+        kwargs = {"quality": None} if self.settings["bitrate"] or self.settings["crf"] is not None else {}
+        self._writer = imageio.get_writer(self.output_path, fps=self.fps, codec=self.settings["codec"],
+                                          bitrate=self.settings["bitrate"], macro_block_size=2,
+                                          output_params=output_params, **kwargs)
+
+    def _write(self, frame):
+        started = time.perf_counter()
+        if self._writer is None:
+            self._open(frame)
+        if (frame.shape[1], frame.shape[0]) != self._size:
+            frame = cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA)
+        self._writer.append_data(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        self.frames_written += 1
+        self.encode_seconds += time.perf_counter() - started
+
+    def append(self, frame, changed: bool = True):
+        """frame: เฟรม BGR ที่วาดแล้ว, changed: มี track เปลี่ยนสถานะในเฟรมนี้ (ใช้ใน highlights)"""
+        index = self._seen
+        self._seen += 1
+        if self.settings["mode"] == "highlights":
+            write = changed
+        else:
+            write = index % self.step == 0
+        if write:
+            self._write(frame)
+            self._last = None
+        else:
+            self._last = frame
+
+    def close(self) -> dict:
+        if self._last is not None and (self.settings["mode"] == "highlights" or self.frames_written == 0):
+            self._write(self._last)
+        self._last = None
+        if self._writer is not None:
+            started = time.perf_counter()
+            self._writer.close()
+            self.encode_seconds += time.perf_counter() - started
+        return self.stats()
+
+    def stats(self) -> dict:
+        size_bytes = os.path.getsize(self.output_path) if os.path.exists(self.output_path) else 0
+        return {
+            "mode": self.settings["mode"],
+            "codec": self.settings["codec"],
+            "crf": self.settings["crf"],
+            "bitrate": self.settings["bitrate"],
+            "preset": self.settings["preset"],
+            "resolution": f"{self._size[0]}x{self._size[1]}" if self._size else None,
+            "fps": round(self.fps, 2),
+            "frames_in": self._seen,
+            "frames_written": self.frames_written,
+            "encode_seconds": round(self.encode_seconds, 3),
+            "bytes": size_bytes,
+        }
+
+def format_encode_report(stats: dict) -> str:
+    quality = f"bitrate={stats['bitrate']}" if stats["bitrate"] else f"crf={stats['crf'] or 'default'}"
+    return (f"🎞️ encode [{stats['mode']}] {stats['codec']} {quality} preset={stats['preset'] or 'default'} "
+            f"{stats['resolution']} @{stats['fps']}fps: {stats['frames_written']}/{stats['frames_in']} เฟรม, "
+            f"{stats['encode_seconds']:.2f}s, {stats['bytes'] / (1024 * 1024):.2f} MB")
+
+# ===================== TRACKING SESSION =====================
+# embedder (MobileNetV2) ของ DeepSort ไม่มี state จึงโหลดครั้งเดียวแล้วใช้ร่วมกันทุก session
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def _get_embedder():
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = DeepSort(max_age=30, n_init=3, max_cosine_distance=0.3).embedder
+    return _embedder
+
+class TrackingSession:
+    """
+    state ของการ track กุ้งใน 1 วิดีโอ (tracker + สถานะการขยับ)
+    analyze_video สร้างใหม่ทุกครั้ง จึงรันหลายวิดีโอพร้อมกันได้โดย track ไม่ปนกัน
+    และ state ถูกคืน memory เมื่อวิดีโอจบ
+    """
+
+    def __init__(self):
+        self.tracker = DeepSort(max_age=30, n_init=3, max_cosine_distance=0.3, embedder=None)
+        self.tracker.embedder = _get_embedder()
+        self.prev_positions = {}
+        self.moved_once = set()
+        self.movement_status = {}
+        self.changed = False  # มี track เปลี่ยนสถานะใน update ล่าสุดหรือไม่ (ใช้กับ highlights)
+
+    def _set_status(self, track_id, status):
+        if self.movement_status.get(track_id) != status:
+            self.movement_status[track_id] = status
+            self.changed = True
+
+    def update(self, detections, frame, frame_index: int, scale: float = 1.0):
+        """
+        อัปเดต tracker ด้วย detection ของเฟรมนี้
+        :return: list ของ (track_id, (x1, y1, x2, y2), color, label) ในพิกัดเฟรมต้นฉบับ
+        """
+        drawn = []
+        self.changed = False
+        for track in self.tracker.update_tracks(detections, frame=frame):
+            if not track.is_confirmed():
+                continue
+            track_id = track.track_id
+            # พิกัดกลับเป็นขนาดเฟรมต้นฉบับ เพื่อให้ threshold (px) มีความหมายเท่าเดิม
+            x1, y1, x2, y2 = (int(v / scale) for v in track.to_ltrb())
+            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+
+            if track_id in self.prev_positions:
+                px, py, prev_index = self.prev_positions[track_id]
+                dx, dy = cx - px, cy - py
+                # ระยะต่อ 1 เฟรมต้นฉบับ (normalize ตามเวลาจริงระหว่างเฟรมที่วิเคราะห์)
+                dist = np.sqrt(dx ** 2 + dy ** 2) / max(frame_index - prev_index, 1)
+                if dist < NO_MOVE_THRESHOLD:
+                    if track_id not in self.moved_once:
+                        self._set_status(track_id, "sick")
+                    color = (0, 0, 255)
+                elif dist < LIGHT_MOVE_THRESHOLD:
+                    self._set_status(track_id, "medium")
+                    self.moved_once.add(track_id)
+                    color = (0, 255, 255)
+                else:
+                    self._set_status(track_id, "good")
+                    self.moved_once.add(track_id)
+                    color = (0, 255, 0)
+            else:
+                color = (255, 255, 0)
+
+            self.prev_positions[track_id] = (cx, cy, frame_index)
+            label = f"id_{track_id} ({self.movement_status.get(track_id, 'None')})"
+            drawn.append((track_id, (x1, y1, x2, y2), color, label))
+        return drawn
+
+    def summary(self):
+        total = len(self.prev_positions)
+        moved = len(self.moved_once)
+        moved_percent = (moved / total) * 100 if total > 0 else 0
+        return total, moved, moved_percent
+
+def _draw_tracks(frame, tracks):
+    """วาดกรอบ + สถานะของแต่ละ track ลงบนเฟรม BGR"""
+    for track_id, (x1, y1, x2, y2), color, label in tracks:
+        color = tuple(int(c) for c in color)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(frame, label, (x1, y1 - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return frame
+
+def _render_video(source_path, output_path, detections, encode: dict = None):
+    """
+    lazy annotation: decode วิดีโอต้นฉบับอีกรอบ แล้ววาด track ที่เก็บไว้ลงเฉพาะเฟรมที่วิเคราะห์
+    encode: override ค่า encode ที่บันทึกไว้ตอนวิเคราะห์ (benchmarks/video_encode.py ใช้เทียบ setting)
+    """
+    frame_stride = detections["frame_stride"]
+    frames = {frame_index: tracks for frame_index, tracks in detections["frames"]}
+    changed = set(detections.get("changed", frames))
+    settings = video_encode_settings(**{**detections.get("encode", {}), **(encode or {})})
+    reader = imageio.get_reader(source_path)
+    writer = AnnotatedVideoWriter(output_path, detections["fps"] / frame_stride, settings)
+    try:
+        for frame_index, frame in enumerate(reader):
+            if frame_index % frame_stride != 0:
+                continue
+            frame = _draw_tracks(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR), frames.get(frame_index, []))
+            writer.append(frame, changed=frame_index in changed)
+    finally:
+        reader.close()
+        report = writer.close()
+    print(format_encode_report(report))
+    return report
+
+register_renderer(MODEL_KEY, _render_video)
+
+def _estimate_frame_count(meta: dict):
+    nframes = meta.get("nframes")
+    if isinstance(nframes, int) and nframes > 0:
+        return nframes
+    duration, fps = meta.get("duration"), meta.get("fps")
+    if duration and fps:
+        return int(round(duration * fps))
+    return None
+
+def analyze_video(input_path, original_name: str = None, progress_callback=None,
+                  frame_stride: int = None, max_infer_side: int = None, infer_batch: int = None,
+                  stats: dict = None, annotate=None, encode: dict = None):
+    """
+    progress_callback(frames_done, frames_total) ถูกเรียกทุกเฟรม (frames_total อาจเป็น None)
+    frame_stride: วิเคราะห์ทุก ๆ N เฟรม (ค่าเริ่มต้นจาก DIN_FRAME_STRIDE)
+                  วิดีโอผลลัพธ์จะมีเฉพาะเฟรมที่วิเคราะห์ ที่ fps / N (ความยาวเท่าเดิม)
+    max_infer_side: ย่อเฟรมให้ด้านยาวไม่เกินค่านี้ก่อนส่งเข้า YOLO/DeepSort (0 = ไม่ย่อ)
+    infer_batch: จำนวนเฟรมต่อการเรียก YOLO หนึ่งครั้ง (ค่าเริ่มต้นจาก DIN_INFER_BATCH)
+    annotate: "off" / "eager" / "lazy" (ค่าเริ่มต้นตาม ANNOTATE_MODE)
+              eager encode วิดีโอ annotate ทันที, lazy เก็บ track ไว้แล้ว encode ตอนเปิด URL ครั้งแรก,
+              off ไม่สร้างวิดีโอ (คืน output_video_path เป็น None)
+    encode: override ค่า encode วิดีโอผลลัพธ์ (codec, crf, bitrate, preset, max_side, fps, mode)
+            ดู video_encode_settings ค่าเริ่มต้นจาก DIN_VIDEO_*
+    stats: ถ้าส่ง dict มา จะถูกเติมสรุปผล (จำนวนเฟรม, เวลา, จำนวนกุ้ง) สำหรับ benchmark
+    ระยะการขยับถูกหารด้วยจำนวนเฟรมต้นฉบับที่ผ่านไป จึงเทียบกับ threshold (px/เฟรม) ได้เหมือนเดิม
+    :return: DinResult (output_path = วิดีโอ, text_path = txt)
+    """
     if not os.path.exists(input_path):
         print(f"❌ ไม่พบวิดีโอ: {input_path}")
         return
 
+    frame_stride = max(1, int(frame_stride or FRAME_STRIDE))
+    max_infer_side = MAX_INFER_SIDE if max_infer_side is None else int(max_infer_side)
+    infer_batch = max(1, int(infer_batch or INFER_BATCH))
+    annotate = resolve_annotate_mode(annotate)
+    encode_settings = video_encode_settings(**(encode or {}))
+
     output_dir = os.environ.get("OUTPUT_DIN", "./output/din_output")
     os.makedirs(output_dir, exist_ok=True)
 
@@ -28,81 +304,160 @@ def analyze_video(input_path, original_name: str = None):
     output_video_path = os.path.join(output_dir, f"{base_name}.mp4")
     output_txt_path = os.path.join(output_dir, f"{base_name}.txt")
 
+    model = get_model(MODEL_KEY)
+    started = time.perf_counter()
     reader = imageio.get_reader(input_path)
-    fps = reader.get_meta_data().get("fps", 25)
-    size = reader.get_meta_data().get("size", None)
+    meta = reader.get_meta_data()
+    fps = meta.get("fps", 25)
+    size = meta.get("size", None)
+    frames_total = _estimate_frame_count(meta)
+    frames_done = 0
+    frames_analyzed = 0
 
     if size is None:
         print("❌ ไม่สามารถอ่านขนาดวิดีโอ")
         return
 
     width, height = size
-    writer = imageio.get_writer(output_video_path, fps=fps)
-    prev_positions = {}
+    scale = 1.0
+    if max_infer_side and max(width, height) > max_infer_side:
+        scale = max_infer_side / float(max(width, height))
+        infer_size = (int(round(width * scale)), int(round(height * scale)))
+
+    writer = AnnotatedVideoWriter(output_video_path, fps / frame_stride, encode_settings) \
+        if annotate == ANNOTATE_EAGER else None
+    lazy_frames = []
+    changed_frames = []
+    encode_report = None
+    session = TrackingSession()
 
-    for frame in reader:
+    # ===================== PIPELINE =====================
+    # decode (thread) -> infer + track (thread นี้) -> encode (thread) ต่อกันด้วย bounded queue
+    decode_stats, infer_stats, track_stats, encode_stats = (
+        StageStats(name) for name in ("decode", "infer", "track", "encode"))
+
+    def decode(indexed):
+        nonlocal frames_done
+        frame_index, frame = indexed
+        frames_done = frame_index + 1
+        if frame_index % frame_stride != 0:
+            return None
         frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        infer_frame = cv2.resize(frame, infer_size, interpolation=cv2.INTER_AREA) if scale != 1.0 else frame
+        return frame_index, frame, infer_frame
 
-        results = model.predict(source=frame, conf=CONFIDENCE_THRESHOLD, verbose=False)
-        boxes = results[0].boxes.xyxy.cpu().numpy()
-        scores = results[0].boxes.conf.cpu().numpy()
+    def encode(item):
+        frame, changed = item
+        writer.append(frame, changed)
 
-        detections = [([x1, y1, x2 - x1, y2 - y1], score, None)
-                      for (x1, y1, x2, y2), score in zip(boxes, scores)
-                      if score >= CONFIDENCE_THRESHOLD]
+    source = ThreadedSource(enumerate(reader), decode_stats, maxsize=PIPELINE_QUEUE_SIZE, transform=decode)
+    sink = ThreadedSink(encode, encode_stats, maxsize=PIPELINE_QUEUE_SIZE) if writer is not None else None
+    pipeline_started = time.perf_counter()
 
-        tracks = tracker.update_tracks(detections, frame=frame)
+    def process_batch(batch):
+        nonlocal frames_analyzed
+        # YOLO รับทั้ง mini-batch ในครั้งเดียว แล้วป้อนผลให้ tracker ตามลำดับเฟรมเหมือนเดิม
+        stage_started = time.perf_counter()
+        results = model.predict(source=[infer_frame for _, _, infer_frame in batch],
+                                conf=CONFIDENCE_THRESHOLD, verbose=False)
+        infer_stats.busy_seconds += time.perf_counter() - stage_started
+        infer_stats.items += len(batch)
 
-        for track in tracks:
-            if not track.is_confirmed():
-                continue
-            track_id = track.track_id
-            x1, y1, x2, y2 = map(int, track.to_ltrb())
-            cx, cy = (x1 + x2) // 2, (y1 + y2) // 2
+        for (frame_index, frame, infer_frame), result in zip(batch, results):
+            frames_analyzed += 1
+            stage_started = time.perf_counter()
+            boxes = result.boxes.xyxy.cpu().numpy()
+            scores = result.boxes.conf.cpu().numpy()
+            detections = [([x1, y1, x2 - x1, y2 - y1], score, None)
+                          for (x1, y1, x2, y2), score in zip(boxes, scores)
+                          if score >= CONFIDENCE_THRESHOLD]
 
-            if track_id in prev_positions:
-                dx, dy = cx - prev_positions[track_id][0], cy - prev_positions[track_id][1]
-                dist = np.sqrt(dx ** 2 + dy ** 2)
-                if dist < NO_MOVE_THRESHOLD:
-                    if track_id not in shrimp_moved_once:
-                        movement_status[track_id] = "sick"
-                    color = (0, 0, 255)
-                elif dist < LIGHT_MOVE_THRESHOLD:
-                    movement_status[track_id] = "medium"
-                    shrimp_moved_once.add(track_id)
-                    color = (0, 255, 255)
-                else:
-                    movement_status[track_id] = "good"
-                    shrimp_moved_once.add(track_id)
-                    color = (0, 255, 0)
-            else:
-                color = (255, 255, 0)
+            tracks = session.update(detections, infer_frame, frame_index, scale)
+            if annotate == ANNOTATE_EAGER:
+                _draw_tracks(frame, tracks)
+            elif annotate == ANNOTATE_LAZY and tracks:
+                lazy_frames.append([frame_index, tracks])
+                if session.changed:
+                    changed_frames.append(frame_index)
+            track_stats.busy_seconds += time.perf_counter() - stage_started
+            track_stats.items += 1
 
-            prev_positions[track_id] = (cx, cy)
-            label = f"id_{track_id} ({movement_status.get(track_id, 'None')})"
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-            cv2.putText(frame, label, (x1, y1 - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+            if sink is not None:
+                sink.put((frame, session.changed))
 
-        writer.append_data(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if progress_callback:
+                progress_callback(frame_index + 1, frames_total)
 
-    reader.close()
-    writer.close()
+    try:
+        batch = []
+        for item in source:
+            batch.append(item)
+            if len(batch) >= infer_batch:
+                process_batch(batch)
+                batch = []
+        if batch:
+            process_batch(batch)
+    finally:
+        source.close()
+        if sink is not None:
+            sink.close()
+        reader.close()
+        if writer is not None:
+            encode_report = writer.close()
 
-    total = len(prev_positions)
-    moved = len(shrimp_moved_once)
-    moved_percent = (moved / total) * 100 if total > 0 else 0
+    stages = [decode_stats, infer_stats, track_stats] + ([encode_stats] if sink is not None else [])
+    pipeline = summarize_stages(stages, time.perf_counter() - pipeline_started)
+    if annotate == ANNOTATE_LAZY:
+        defer_render(output_video_path, MODEL_KEY, input_path,
+                     {"fps": fps, "frame_stride": frame_stride, "frames": lazy_frames,
+                      "changed": changed_frames, "encode": encode_settings})
+    elif annotate != ANNOTATE_EAGER:
+        output_video_path = None
+    print(format_stage_report(pipeline))
+    if encode_report is not None:
+        print(format_encode_report(encode_report))
+
+    if progress_callback:
+        progress_callback(frames_done, frames_done)
+
+    total, moved, moved_percent = session.summary()
+    prev_positions, movement_status = session.prev_positions, session.movement_status
     overall_status = "✅ สุขภาพดี" if moved_percent >= 70 else \
                      "⚠️ อ่อนแรง" if moved_percent >= 50 else \
                      "❌ มีตัวนิ่งเยอะ"
+    status_counts = {st: sum(1 for tid in prev_positions if movement_status.get(tid) == st)
+                     for st in ("sick", "medium", "good")}
 
+    din_result = DinResult(
+        total=total,
+        moved=moved,
+        moved_percent=moved_percent,
+        overall_status=overall_status,
+        status_counts=status_counts,
+        tracks={str(tid): movement_status.get(tid) for tid in sorted(prev_positions.keys())},
+        output_path=output_video_path,
+        text_path=output_txt_path,
+    )
     with open(output_txt_path, "w", encoding="utf-8") as f:
-        f.write(f"🦐 จำนวนกุ้งทั้งหมด: {total} ตัว\n")
-        f.write(f"✅ เคยขยับ: {moved} ตัว ({moved_percent:.2f}%)\n")
-        f.write(f"📊 สถานะรวม: {overall_status}\n\n")
-        for tid in sorted(prev_positions.keys()):
-            f.write(f"id_{tid}: {movement_status.get(tid, 'รอข้อมูล')}\n")
+        f.write(din_result.to_text())
+
+    if stats is not None:
+        stats.update({
+            "frames": frames_done,
+            "frames_analyzed": frames_analyzed,
+            "frame_stride": frame_stride,
+            "infer_batch": infer_batch,
+            "infer_scale": round(scale, 3),
+            "annotate": annotate,
+            "encode": encode_report,
+            "pipeline": pipeline,
+            "seconds": round(time.perf_counter() - started, 3),
+            "total": total,
+            "moved": moved,
+            "moved_percent": round(moved_percent, 2),
+            "status_counts": status_counts,
+        })
 
-    print(f"✅ บันทึกวิดีโอที่: {output_video_path}")
+    print(f"✅ บันทึกวิดีโอที่ ({annotate}): {output_video_path}")
     print(f"📄 บันทึกผลข้อความที่: {output_txt_path}")
-    return output_video_path, output_txt_path
+    return din_result
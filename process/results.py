@@ -0,0 +1,136 @@
+"""
+Analyzer Results
+ผลลัพธ์แบบมีโครงสร้างของแต่ละ analyzer (size, shrimp float, din, water)
+main.py เก็บ to_dict() ลง JSON โดยตรง และข้อความภาษาไทยสร้างจาก to_text()
+จึงไม่ต้องอ่านไฟล์ .txt กลับมา regex อีก
+"""
+
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+def get_thai_datetime_string(dt):
+    day, month, year = dt.day, dt.month, dt.year + 543
+    time_str = dt.strftime("%H:%M")
+    return f"{day:02d}/{month:02d}/{year} เวลา {time_str}"
+
+
+class AnalysisResult:
+    """method ร่วมของผลลัพธ์ทุกชนิด (dataclass ลูกต้องมี output_path / text_path)"""
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def to_text(self) -> str:
+        raise NotImplementedError
+
+
+@dataclass
+class ShrimpMeasurement:
+    x: float
+    y: float
+    length_cm: float
+    weight_g: float
+
+
+@dataclass
+class SizeResult(AnalysisResult):
+    analyzed_at: str
+    pond_number: Optional[int]
+    count: int
+    shrimp: List[ShrimpMeasurement]
+    avg_length_cm: Optional[float]
+    avg_weight_g: float
+    survival_rate: float
+    n_alive: int
+    total_weight_kg: float
+    feed_size: str
+    feed_kg_per_day: float
+    morning_feed_kg: float
+    evening_feed_kg: float
+    output_path: Optional[str] = None
+    text_path: Optional[str] = None
+    kind: str = field(default="size", init=False)
+
+    def to_text(self) -> str:
+        thai_datetime_str = get_thai_datetime_string(datetime.fromisoformat(self.analyzed_at))
+        return "\n".join([
+            f"วันที่ {thai_datetime_str}",
+            f"บ่อ {self.pond_number}",
+            f"จำนวนกุ้งบนยอ : {self.count}",
+            *[f"Shrimp {idx}: {s.length_cm:.2f} cm / {s.weight_g:.2f} g"
+              for idx, s in enumerate(self.shrimp, start=1)],
+            f"น้ำหนักกุ้งเฉลี่ยต่อตัว: {self.avg_weight_g:.2f} g",
+            f"อัตราการรอด: {self.survival_rate*100:.1f}%",
+            f"จำนวนกุ้งที่เหลืออยู่: {self.n_alive}",
+            f"น้ำหนักกุ้งทั้งบ่อ: {self.total_weight_kg:.2f} kg",
+            f"ขนาดอาหารที่ควรใช้: เบอร์ {self.feed_size}",
+            f"ปริมาณอาหารที่ควรให้: {self.feed_kg_per_day:.2f} kg",
+            f" - ตอนเช้า: {self.morning_feed_kg:.2f} kg",
+            f" - ตอนเย็น: {self.evening_feed_kg:.2f} kg",
+        ])
+
+
+@dataclass
+class FloatingShrimp:
+    x1: int
+    y1: int
+    x2: int
+    y2: int
+    confidence: float
+    label: str
+
+
+@dataclass
+class FloatResult(AnalysisResult):
+    count: int
+    shrimp: List[FloatingShrimp]
+    output_path: Optional[str] = None
+    text_path: Optional[str] = None
+    kind: str = field(default="shrimp", init=False)
+
+    def to_text(self) -> str:
+        if self.count > 0:
+            return f"🦐 พบกุ้งลอยผิวน้ำ {self.count} ตัว\n" + "\n".join(s.label for s in self.shrimp)
+        return "🆗 ไม่พบกุ้งลอยผิวน้ำในภาพนี้"
+
+
+@dataclass
+class WaterResult(AnalysisResult):
+    class_name: str
+    confidence: Optional[float]           # ความน่าจะเป็นของ YOLO เท่านั้น (None เมื่อ source == "fast")
+    probs: Optional[Dict[str, float]]     # ความน่าจะเป็นของ YOLO ทุก class (None เมื่อ source == "fast")
+    output_path: Optional[str] = None
+    text_path: Optional[str] = None
+    source: str = "model"  # "model" = YOLO, "fast" = colour pre-classifier (process/water_prefilter.py)
+    fast_score: Optional[float] = None    # fast path: margin ของ nearest-centroid (0-1) ไม่ใช่ความน่าจะเป็น
+    kind: str = field(default="water", init=False)
+
+    def to_text(self) -> str:
+        if self.confidence is None:
+            return f"{self.class_name} (fast path)"
+        return f"{self.class_name} ({self.confidence * 100:.0f}%)"
+
+
+@dataclass
+class DinResult(AnalysisResult):
+    total: int
+    moved: int
+    moved_percent: float
+    overall_status: str
+    status_counts: Dict[str, int]
+    tracks: Dict[str, Optional[str]]
+    output_path: Optional[str] = None
+    text_path: Optional[str] = None
+    kind: str = field(default="din", init=False)
+
+    def to_text(self) -> str:
+        lines = [
+            f"🦐 จำนวนกุ้งทั้งหมด: {self.total} ตัว",
+            f"✅ เคยขยับ: {self.moved} ตัว ({self.moved_percent:.2f}%)",
+            f"📊 สถานะรวม: {self.overall_status}",
+            "",
+        ]
+        lines += [f"id_{tid}: {status or 'รอข้อมูล'}" for tid, status in self.tracks.items()]
+        return "\n".join(lines) + "\n"
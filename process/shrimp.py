@@ -1,48 +1,88 @@
 import cv2
-from ultralytics import YOLO
+from utils.model_registry import get_model
+from utils.image_io import decode_image, source_stem
+from utils.tiling import predict_tiled, tiling_enabled
+from process.results import FloatResult, FloatingShrimp
+from utils.annotation import (ANNOTATE_EAGER, ANNOTATE_LAZY, defer_render, image_renderer,
+                              register_renderer, resolve_annotate_mode)
 import os
 
-# โหลดโมเดลกุ้งลอยน้ำจากโฟลเดอร์ Model/
-model_path = os.environ.get("MODEL_SHRIMP", os.path.join("Model", "shrimp.pt"))
-model = YOLO(model_path)
+# โมเดลกุ้งลอยน้ำโหลดแบบ lazy ผ่าน model registry (ดู utils/model_registry.py)
+MODEL_KEY = "shrimp"
+MAX_BATCH = int(os.environ.get("SHRIMP_MAX_BATCH", "16"))
 
 output_folder = os.environ.get("OUTPUT_SHRIMP", "./output/shrimp_output")
 os.makedirs(output_folder, exist_ok=True)
 
-def analyze_kuny(image_path, original_name: str = None):
-    image = cv2.imread(image_path)
-    if image is None:
-        raise ValueError(f"❌ ไม่พบภาพที่ path: {image_path}")
-
-    results = model.predict(image_path)
-    shrimp_count, info_list = 0, []
-
-    for r in results:
-        for box in r.boxes:
-            cls_id = int(box.cls[0])
-            name = r.names[cls_id]
-            if name.lower() == "shrimp":
-                shrimp_count += 1
-                label = f"shrimp float id{shrimp_count}"
-                info_list.append(label)
-
-                x1, y1, x2, y2 = box.xyxy[0].int().tolist()
-                cv2.rectangle(image, (x1, y1), (x2, y2), (255, 0, 0), 2)
-                cv2.putText(image, label, (x1, y1-10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 2.0, (255, 0, 0), 10)
-
-    header_text, color = ("HAVE SHRIMPS", (0, 0, 255)) if shrimp_count > 0 else ("NO SHRIMP", (0, 255, 0))
+def analyze_kuny(image_path, original_name: str = None, annotate=None, tiled=None):
+    return analyze_kuny_batch([image_path], [original_name], annotate=annotate, tiled=tiled)[0]
+
+def analyze_kuny_batch(image_paths, original_names=None, annotate=None, tiled=None):
+    """
+    ตรวจกุ้งลอยหลายภาพด้วยการเรียกโมเดลครั้งเดียวต่อ batch (สูงสุด SHRIMP_MAX_BATCH ภาพ)
+    image_paths แต่ละตัวเป็น path, bytes ของไฟล์ภาพ หรือ numpy array ก็ได้ (decode ครั้งเดียว)
+    annotate: "off" / "eager" / "lazy" (ค่าเริ่มต้นตาม ANNOTATE_MODE) off จะคืน image_output_path เป็น None
+    tiled: True = sliced inference สำหรับภาพผิวน้ำความละเอียดสูง (ค่าเริ่มต้นตาม SHRIMP_TILED)
+    :return: list ของ FloatResult ตามลำดับ image_paths
+    """
+    original_names = original_names or [None] * len(image_paths)
+    images = [decode_image(source) for source in image_paths]
+
+    model = get_model(MODEL_KEY)
+    use_tiles = tiling_enabled(MODEL_KEY, tiled)
+    outputs = []
+    for start in range(0, len(images), MAX_BATCH):
+        if use_tiles:
+            results = predict_tiled(model, images[start:start + MAX_BATCH], batch=MAX_BATCH)
+        else:
+            results = model.predict(images[start:start + MAX_BATCH], verbose=False)
+        for offset, r in enumerate(results):
+            idx = start + offset
+            outputs.append(_summarize_kuny(r, images[idx], image_paths[idx], original_names[idx], annotate))
+    return outputs
+
+def _draw_kuny(image, boxes):
+    """วาดกรอบกุ้งลอย + หัวข้อ HAVE SHRIMPS / NO SHRIMP ลงบนภาพ"""
+    for x1, y1, x2, y2, label in boxes:
+        cv2.rectangle(image, (x1, y1), (x2, y2), (255, 0, 0), 2)
+        cv2.putText(image, label, (x1, y1-10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 2.0, (255, 0, 0), 10)
+
+    header_text, color = ("HAVE SHRIMPS", (0, 0, 255)) if boxes else ("NO SHRIMP", (0, 255, 0))
     cv2.putText(image, header_text, (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.5, color, 5)
+    return image
+
+register_renderer(MODEL_KEY, image_renderer(_draw_kuny))
+
+def _summarize_kuny(r, image, image_path, original_name=None, annotate=None):
+    annotate = resolve_annotate_mode(annotate)
+    floating = []
 
-    filename = os.path.splitext(original_name or os.path.basename(image_path))[0]
+    for box in r.boxes:
+        cls_id = int(box.cls[0])
+        name = r.names[cls_id]
+        if name.lower() == "shrimp":
+            x1, y1, x2, y2 = box.xyxy[0].int().tolist()
+            floating.append(FloatingShrimp(x1=x1, y1=y1, x2=x2, y2=y2, confidence=float(box.conf[0]),
+                                           label=f"shrimp float id{len(floating) + 1}"))
+    boxes = [(s.x1, s.y1, s.x2, s.y2, s.label) for s in floating]
+
+    filename = source_stem(image_path, original_name, default="shrimp_float")
 
     txt_path = os.path.join(output_folder, f"{filename}.txt")
-    text = f"🦐 พบกุ้งลอยผิวน้ำ {shrimp_count} ตัว\n" + "\n".join(info_list) if shrimp_count > 0 else "🆗 ไม่พบกุ้งลอยผิวน้ำในภาพนี้"
+    image_output_path = os.path.join(output_folder, f"{filename}.jpg")
+    if annotate == ANNOTATE_EAGER:
+        cv2.imwrite(image_output_path, _draw_kuny(image, boxes))
+    elif annotate == ANNOTATE_LAZY:
+        defer_render(image_output_path, MODEL_KEY, image_path, boxes)
+    else:
+        image_output_path = None
+
+    float_result = FloatResult(count=len(floating), shrimp=floating,
+                               output_path=image_output_path, text_path=txt_path)
+    text = float_result.to_text()
     with open(txt_path, "w", encoding="utf-8") as f:
         f.write(text)
 
-    image_output_path = os.path.join(output_folder, f"{filename}.jpg")
-    cv2.imwrite(image_output_path, image)
-
     print("✅ ประมวลผลเสร็จ:", text)
-    return image_output_path, txt_path
+    return float_result
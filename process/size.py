@@ -1,21 +1,19 @@
 import cv2
-import math
-from ultralytics import YOLO
+from utils.model_registry import get_profile_model, group_by_profile
+from utils.image_io import decode_image, source_stem
+from utils.tiling import predict_tiled, tiling_enabled
+from process.results import ShrimpMeasurement, SizeResult, get_thai_datetime_string
+from utils.annotation import (ANNOTATE_EAGER, ANNOTATE_LAZY, defer_render, image_renderer,
+                              register_renderer, resolve_annotate_mode)
 import os
 from datetime import datetime
 import numpy as np
 
-# โหลดโมเดลวัดขนาดจากโฟลเดอร์ Model/
-model_path = os.environ.get("MODEL_SIZE", os.path.join("Model", "size.pt"))
-model = YOLO(model_path)
+# โมเดลวัดขนาดโหลดแบบ lazy ผ่าน model registry (ดู utils/model_registry.py)
+MODEL_KEY = "size"
 class_id = 0
 
 # ===================== Helper Function =====================
-def get_thai_datetime_string(dt):
-    day, month, year = dt.day, dt.month, dt.year + 543
-    time_str = dt.strftime("%H:%M")
-    return f"{day:02d}/{month:02d}/{year} เวลา {time_str}"
-
 def get_feed_plan(weight_avg):
     if weight_avg <= 2: return 6.0, 3
     elif weight_avg <= 5: return 5.0, 4
@@ -52,11 +50,141 @@ def get_cumulative_survival(total_larvae, weight_avg):
     return survival_rate_cumulative, int(n_current)
 
 # ===================== Main Function =====================
+MAX_BATCH = int(os.environ.get("SIZE_MAX_BATCH", "16"))
+
+def _per_item(value, n):
+    """ขยายค่า scalar ให้เป็น list ยาว n (ถ้าเป็น list อยู่แล้วใช้ตามเดิม)"""
+    if isinstance(value, (list, tuple)):
+        if len(value) != n:
+            raise ValueError(f"❌ ต้องการค่า {n} ตัว แต่ได้ {len(value)} ตัว")
+        return list(value)
+    return [value] * n
+
 def analyze_shrimp(input_path, total_larvae=None, pond_number=None,
-                   a_weight=None, b_weight=None, pixel_per_cm=13):
+                   a_weight=None, b_weight=None, pixel_per_cm=13, name=None, profile=None,
+                   annotate=None, tiled=None):
+    return analyze_shrimp_batch([input_path], total_larvae=total_larvae, pond_number=pond_number,
+                                a_weight=a_weight, b_weight=b_weight, pixel_per_cm=pixel_per_cm,
+                                names=[name], profile=profile, annotate=annotate, tiled=tiled)[0]
+
+def analyze_shrimp_batch(input_paths, total_larvae=None, pond_number=None,
+                         a_weight=None, b_weight=None, pixel_per_cm=13, names=None, profile=None,
+                         annotate=None, tiled=None):
+    """
+    วิเคราะห์หลายภาพด้วยการเรียกโมเดลครั้งเดียวต่อ batch (สูงสุด SIZE_MAX_BATCH ภาพ)
+    input_paths แต่ละตัวเป็น path, bytes ของไฟล์ภาพ หรือ numpy array ก็ได้ (decode ครั้งเดียว)
+    total_larvae / pond_number ส่งเป็น list ตามลำดับภาพ หรือค่าเดียวใช้กับทุกภาพก็ได้
+    names: ชื่อไฟล์สำหรับตั้งชื่อ output (จำเป็นเมื่อส่ง bytes / numpy array)
+    profile: "fp32" หรือ "int8" (ค่าเดียวหรือ list) ถ้าไม่ระบุใช้ SIZE_PROFILE_POND_<n> / SIZE_PROFILE
+    annotate: "off" / "eager" / "lazy" (ค่าเริ่มต้นตาม ANNOTATE_MODE ดู utils/annotation.py)
+              off จะคืน output_img_path เป็น None
+    tiled: True = sliced inference สำหรับภาพความละเอียดสูง (ค่าเริ่มต้นตาม SIZE_TILED ดู utils/tiling.py)
+    :return: list ของ SizeResult ตามลำดับ input_paths (output_path = ภาพ, text_path = txt)
+    """
+    n = len(input_paths)
+    total_larvae_list = _per_item(total_larvae, n)
+    pond_number_list = _per_item(pond_number, n)
+    name_list = _per_item(names, n) if names is not None else [None] * n
+
+    images = [decode_image(source) for source in input_paths]
+    use_tiles = tiling_enabled(MODEL_KEY, tiled)
+
+    # ===================== RUN YOLO =====================
+    outputs = [None] * n
+    for group_profile, indexes in group_by_profile(MODEL_KEY, n, profile, pond_number_list).items():
+        model = get_profile_model(MODEL_KEY, group_profile)
+        for start in range(0, len(indexes), MAX_BATCH):
+            batch_indexes = indexes[start:start + MAX_BATCH]
+            batch_images = [images[idx] for idx in batch_indexes]
+            if use_tiles:
+                results = predict_tiled(model, batch_images, batch=MAX_BATCH)
+            else:
+                results = model(batch_images, verbose=False)
+            for idx, result in zip(batch_indexes, results):
+                outputs[idx] = _summarize_shrimp(
+                    result, images[idx], input_paths[idx], name=name_list[idx],
+                    total_larvae=total_larvae_list[idx], pond_number=pond_number_list[idx],
+                    a_weight=a_weight, b_weight=b_weight, pixel_per_cm=pixel_per_cm, annotate=annotate)
+    return outputs
+
+DEFAULT_A, DEFAULT_B = 0.0089, 3.0751
+CONFIDENCE_THRESHOLD = 0.5
+
+# ผลการวัดกุ้งแต่ละตัว (1 แถวต่อ 1 ตัว)
+SHRIMP_DTYPE = np.dtype([
+    ("head", np.float32, (2,)),
+    ("middle", np.float32, (2,)),
+    ("tail", np.float32, (2,)),
+    ("conf", np.float32),
+    ("length_cm", np.float64),
+    ("weight_g", np.float64),
+])
+
+def measure_shrimp(result, pixel_per_cm=13, a_weight=None, b_weight=None):
+    """
+    วัดความยาว (cm) และน้ำหนัก (g) ของกุ้งทุกตัวจาก keypoints (หัว, กลางตัว, หาง) ด้วย numpy ทั้ง array
+    :return: structured array (SHRIMP_DTYPE) เรียงตามตำแหน่งหัว (บนลงล่าง, ซ้ายไปขวา)
+    """
+    a, b = a_weight or DEFAULT_A, b_weight or DEFAULT_B
+    if result.keypoints is None or result.boxes is None or result.keypoints.xy is None \
+            or result.boxes.cls is None or result.boxes.conf is None:
+        return np.zeros(0, dtype=SHRIMP_DTYPE)
+
+    keypoints = result.keypoints.xy.cpu().numpy()
+    boxes_cls = result.boxes.cls.cpu().numpy()
+    boxes_conf = result.boxes.conf.cpu().numpy()
+    if keypoints.ndim != 3 or keypoints.shape[1] < 3:
+        return np.zeros(0, dtype=SHRIMP_DTYPE)
+
+    n = min(len(keypoints), len(boxes_cls), len(boxes_conf))
+    keep = (boxes_cls[:n].astype(int) == class_id) & (boxes_conf[:n] > CONFIDENCE_THRESHOLD)
+    kp = keypoints[:n][keep, :3].astype(np.float64)
+
+    # ความยาว = หัว->กลางตัว + กลางตัว->หาง
+    lengths_px = np.linalg.norm(kp[:, 1] - kp[:, 0], axis=1) + np.linalg.norm(kp[:, 2] - kp[:, 1], axis=1)
+    lengths_cm = lengths_px / pixel_per_cm if pixel_per_cm > 0 else np.zeros_like(lengths_px)
+    lengths_cm = lengths_cm.astype(np.float64)
+    weights = np.where(lengths_cm > 0, a * np.power(lengths_cm, b), 0.0)
+
+    data = np.zeros(len(kp), dtype=SHRIMP_DTYPE)
+    data["head"], data["middle"], data["tail"] = kp[:, 0], kp[:, 1], kp[:, 2]
+    data["conf"] = boxes_conf[:n][keep]
+    data["length_cm"] = lengths_cm
+    data["weight_g"] = weights
+    return data[np.lexsort((data["head"][:, 0], data["head"][:, 1]))]
+
+def draw_shrimp(img, shrimp):
+    """วาด keypoints, เส้นลำตัว, ลำดับ และน้ำหนักของกุ้งแต่ละตัวลงบนภาพ"""
+    for idx, row in enumerate(shrimp, start=1):
+        head, middle, tail = row["head"].astype(int), row["middle"].astype(int), row["tail"].astype(int)
+        for (x, y) in (head, middle, tail):
+            cv2.circle(img, (int(x), int(y)), 5, (0, 255, 0), -1)
+        cv2.line(img, (int(head[0]), int(head[1])), (int(middle[0]), int(middle[1])), (255, 0, 0), 2)
+        cv2.line(img, (int(middle[0]), int(middle[1])), (int(tail[0]), int(tail[1])), (255, 0, 0), 2)
+        x, y = int(row["head"][0]), int(row["head"][1])
+        cv2.putText(img,f"{idx}",(x,y-15),cv2.FONT_HERSHEY_SIMPLEX,0.7,(0,0,255),2,cv2.LINE_AA)
+        cv2.putText(img,f"{row['weight_g']:.1f}g",(x,y+15),cv2.FONT_HERSHEY_SIMPLEX,0.5,(0,255,255),1,cv2.LINE_AA)
+    return img
+
+def _shrimp_to_json(shrimp):
+    """เก็บเฉพาะค่าที่ต้องใช้วาด (lazy annotation)"""
+    return {"head": shrimp["head"].tolist(), "middle": shrimp["middle"].tolist(),
+            "tail": shrimp["tail"].tolist(), "weight_g": shrimp["weight_g"].tolist()}
+
+def _draw_shrimp_json(img, detections):
+    shrimp = np.zeros(len(detections["weight_g"]), dtype=SHRIMP_DTYPE)
+    for field in ("head", "middle", "tail", "weight_g"):
+        if len(shrimp):
+            shrimp[field] = detections[field]
+    return draw_shrimp(img, shrimp)
+
+register_renderer(MODEL_KEY, image_renderer(_draw_shrimp_json))
+
+def _summarize_shrimp(result, img, input_path, name=None, total_larvae=None, pond_number=None,
+                      a_weight=None, b_weight=None, pixel_per_cm=13, annotate=None):
     print("\n🚀 เริ่มการวิเคราะห์กุ้ง (size.py)")
-    DEFAULT_A, DEFAULT_B = 0.0089, 3.0751
     a, b = a_weight or DEFAULT_A, b_weight or DEFAULT_B
+    annotate = resolve_annotate_mode(annotate)
     print(f"📘 ใช้ค่า a={a:.5f}, b={b:.3f} (มาตรฐานไทย)")
 
     # ===================== PATH =====================
@@ -66,56 +194,26 @@ def analyze_shrimp(input_path, total_larvae=None, pond_number=None,
 
     now = datetime.now()
     timestamp = now.strftime("%Y%m%d_%H%M%S")
-    thai_datetime_str = get_thai_datetime_string(now)
-    filename = os.path.splitext(os.path.basename(input_path))[0]
+    filename = source_stem(input_path, name, default="shrimp")
 
     output_img_path_output = os.path.join(output_dir_output, f"{filename}_{timestamp}.jpg")
     output_txt_path_output = os.path.join(output_dir_output, f"{filename}_{timestamp}.txt")
 
-    # ===================== RUN YOLO =====================
-    results = model(input_path)
-    img = cv2.imread(input_path)
-    shrimp_data = []
-
-    for result in results:
-        if result.keypoints is None or result.boxes is None: 
-            continue
-        keypoints = result.keypoints.xy.cpu().numpy() if result.keypoints.xy is not None else []
-        boxes_cls = result.boxes.cls.cpu().numpy() if result.boxes.cls is not None else []
-        boxes_conf = result.boxes.conf.cpu().numpy() if result.boxes.conf is not None else []
-
-        for i, kp in enumerate(keypoints):
-            if i >= len(boxes_cls) or i >= len(boxes_conf): 
-                continue
-            if int(boxes_cls[i]) != class_id or boxes_conf[i] <= 0.5: 
-                continue
-            if len(kp) < 3: 
-                continue
-
-            head, middle, tail = kp[0], kp[1], kp[2]
-            dist = lambda p1,p2: math.sqrt((p1[0]-p2[0])**2 + (p1[1]-p2[1])**2)
-            total_length_cm = (dist(head, middle)+dist(middle, tail)) / pixel_per_cm if pixel_per_cm > 0 else 0
-            weight = a * (total_length_cm ** b) if total_length_cm > 0 else 0
-            shrimp_data.append((head[0], head[1], total_length_cm, weight))
-
-            for (x,y) in [head,middle,tail]:
-                cv2.circle(img,(int(x),int(y)),5,(0,255,0),-1)
-            cv2.line(img,(int(head[0]),int(head[1])),(int(middle[0]),int(middle[1])),(255,0,0),2)
-            cv2.line(img,(int(middle[0]),int(middle[1])),(int(tail[0]),int(tail[1])),(255,0,0),2)
+    shrimp = measure_shrimp(result, pixel_per_cm, a, b)
 
     # ===================== สรุปผล =====================
-    shrimp_data.sort(key=lambda p:(p[1],p[0]))
-    output_lines = []
+    measurements = [ShrimpMeasurement(x=x, y=y, length_cm=length_cm, weight_g=weight_g)
+                    for (x, y), length_cm, weight_g in zip(
+                        shrimp["head"].tolist(), shrimp["length_cm"].tolist(), shrimp["weight_g"].tolist())]
 
-    print(f"\n🦐 พบกุ้งทั้งหมด: {len(shrimp_data)} ตัว")
-    for idx,(x,y,length_cm,weight_g) in enumerate(shrimp_data,start=1):
-        print(f" - Shrimp {idx}: {length_cm:.2f} cm / {weight_g:.2f} g")
-        cv2.putText(img,f"{idx}",(int(x),int(y)-15),cv2.FONT_HERSHEY_SIMPLEX,0.7,(0,0,255),2,cv2.LINE_AA)
-        cv2.putText(img,f"{weight_g:.1f}g",(int(x),int(y)+15),cv2.FONT_HERSHEY_SIMPLEX,0.5,(0,255,255),1,cv2.LINE_AA)
-        output_lines.append(f"Shrimp {idx}: {length_cm:.2f} cm / {weight_g:.2f} g")
+    print(f"\n🦐 พบกุ้งทั้งหมด: {len(shrimp)} ตัว")
+    for idx, m in enumerate(measurements, start=1):
+        print(f" - Shrimp {idx}: {m.length_cm:.2f} cm / {m.weight_g:.2f} g")
+    if annotate == ANNOTATE_EAGER:
+        draw_shrimp(img, shrimp)
 
-    count = len(shrimp_data)
-    avg_weight = np.mean([w for *_,w in shrimp_data]) if shrimp_data else 0
+    count = len(shrimp)
+    avg_weight = float(shrimp["weight_g"].mean()) if count else 0
 
     survival_rate_cumulative, n_alive = get_cumulative_survival(total_larvae, avg_weight)
 
@@ -123,27 +221,35 @@ def analyze_shrimp(input_path, total_larvae=None, pond_number=None,
     feed_g_per_day, total_weight = calc_feed_per_day(avg_weight, n_alive, feed_percent)
     morning_feed, evening_feed = feed_g_per_day*0.3, feed_g_per_day*0.7
 
-    summary_lines = [
-        f"วันที่ {thai_datetime_str}",
-        f"บ่อ {pond_number}",
-        f"จำนวนกุ้งบนยอ : {count}",
-        *output_lines,
-        f"น้ำหนักกุ้งเฉลี่ยต่อตัว: {avg_weight:.2f} g",
-        f"อัตราการรอด: {survival_rate_cumulative*100:.1f}%",
-        f"จำนวนกุ้งที่เหลืออยู่: {n_alive}",
-        f"น้ำหนักกุ้งทั้งบ่อ: {total_weight/1000:.2f} kg",
-        f"ขนาดอาหารที่ควรใช้: เบอร์ {feed_size}",
-        f"ปริมาณอาหารที่ควรให้: {feed_g_per_day/1000:.2f} kg",
-        f" - ตอนเช้า: {morning_feed/1000:.2f} kg",
-        f" - ตอนเย็น: {evening_feed/1000:.2f} kg",
-    ]
-
     # ===================== Save Output =====================
-    cv2.imwrite(output_img_path_output, img)
+    if annotate == ANNOTATE_EAGER:
+        cv2.imwrite(output_img_path_output, img)
+    elif annotate == ANNOTATE_LAZY:
+        defer_render(output_img_path_output, MODEL_KEY, input_path, _shrimp_to_json(shrimp))
+    else:
+        output_img_path_output = None
+
+    size_result = SizeResult(
+        analyzed_at=now.isoformat(timespec="seconds"),
+        pond_number=pond_number,
+        count=count,
+        shrimp=measurements,
+        avg_length_cm=float(shrimp["length_cm"].mean()) if count else None,
+        avg_weight_g=avg_weight,
+        survival_rate=survival_rate_cumulative,
+        n_alive=n_alive,
+        total_weight_kg=total_weight / 1000,
+        feed_size=str(feed_size),
+        feed_kg_per_day=feed_g_per_day / 1000,
+        morning_feed_kg=morning_feed / 1000,
+        evening_feed_kg=evening_feed / 1000,
+        output_path=output_img_path_output,
+        text_path=output_txt_path_output,
+    )
     with open(output_txt_path_output,"w",encoding="utf-8") as f:
-        f.write("\n".join(summary_lines))
+        f.write(size_result.to_text())
 
-    print(f"\n✅ บันทึกรูปภาพ: {output_img_path_output}")
+    print(f"\n✅ บันทึกรูปภาพ ({annotate}): {output_img_path_output}")
     print(f"✅ บันทึกผลลัพธ์: {output_txt_path_output}\n")
 
-    return output_img_path_output, output_txt_path_output
+    return size_result
@@ -1,33 +1,98 @@
 import cv2
 import os
-from ultralytics import YOLO
+from utils.model_registry import get_profile_model, group_by_profile
+from utils.image_io import decode_image, source_stem
+from process.results import WaterResult
+from process.water_prefilter import color_features, get_prefilter
+from utils.annotation import (ANNOTATE_EAGER, ANNOTATE_LAZY, defer_render, image_renderer,
+                              register_renderer, resolve_annotate_mode)
 
-# โหลดโมเดลสีน้ำจากโฟลเดอร์ Model/
-model_path = os.environ.get("MODEL_WATER", os.path.join("Model", "water_class.pt"))
-model = YOLO(model_path)
+# โมเดลสีน้ำโหลดแบบ lazy ผ่าน model registry (ดู utils/model_registry.py)
+MODEL_KEY = "water"
+MAX_BATCH = int(os.environ.get("WATER_MAX_BATCH", "16"))
 
 output_folder = os.environ.get("OUTPUT_WATER", "./output/water_output")
 os.makedirs(output_folder, exist_ok=True)
 
-def analyze_water(image_path: str, original_name: str = None):
-    image = cv2.imread(image_path)
-    if image is None:
-        raise ValueError(f"❌ ไม่พบภาพที่ path: {image_path}")
+# ภาพสีน้ำไม่มีอะไรให้วาด lazy จึงแค่เลื่อนการ encode ภาพไปตอนมีคนเปิดดู
+register_renderer(MODEL_KEY, image_renderer(None))
 
-    results = model.predict(image_path)
-    top1_id = results[0].probs.top1
-    class_name = results[0].names[top1_id]
-    confidence = results[0].probs.data[top1_id].item()
-    result_text = f"{class_name} ({confidence * 100:.0f}%)"
+def analyze_water(image_path: str, original_name: str = None, profile: str = None, pond_number=None,
+                  annotate=None):
+    return analyze_water_batch([image_path], [original_name], profile=profile, pond_numbers=pond_number,
+                               annotate=annotate)[0]
 
-    base_filename = os.path.splitext(original_name or os.path.basename(image_path))[0]
+def analyze_water_batch(image_paths, original_names=None, profile=None, pond_numbers=None, annotate=None):
+    """
+    วิเคราะห์สีน้ำหลายภาพด้วยการเรียกโมเดลครั้งเดียวต่อ batch (สูงสุด WATER_MAX_BATCH ภาพ)
+    image_paths แต่ละตัวเป็น path, bytes ของไฟล์ภาพ หรือ numpy array ก็ได้ (decode ครั้งเดียว)
+    profile: "fp32" หรือ "int8" (ค่าเดียวหรือ list) ถ้าไม่ระบุใช้ WATER_PROFILE_POND_<n> / WATER_PROFILE
+    annotate: "off" / "eager" / "lazy" (ค่าเริ่มต้นตาม ANNOTATE_MODE) off จะคืน image_output_path เป็น None
+    ภาพที่ colour pre-classifier มั่นใจจะไม่ถูกส่งเข้า YOLO (WATER_FAST_PATH=1 ดู process/water_prefilter.py)
+    :return: list ของ WaterResult ตามลำดับ image_paths
+    """
+    original_names = original_names or [None] * len(image_paths)
+    images = [decode_image(source) for source in image_paths]
+
+    # ===================== FAST PATH (histogram สี) =====================
+    prefilter = get_prefilter()
+    features = [color_features(image) for image in images]
+    guesses = [prefilter.predict(f) for f in features]
+    prefilter.record(images=len(images))
+
+    outputs = [None] * len(images)
+    model_indexes = set()
+    for idx, guess in enumerate(guesses):
+        if guess is not None and guess[3] and prefilter.take_fast_path():
+            class_name, margin, _, _ = guess
+            outputs[idx] = _summarize_water(class_name, None, images[idx], image_paths[idx],
+                                            original_names[idx], annotate, source="fast", fast_score=margin)
+        else:
+            model_indexes.add(idx)
+
+    # ===================== YOLO =====================
+    for group_profile, indexes in group_by_profile(MODEL_KEY, len(images), profile, pond_numbers).items():
+        indexes = [idx for idx in indexes if idx in model_indexes]
+        if not indexes:
+            continue
+        model = get_profile_model(MODEL_KEY, group_profile)
+        for start in range(0, len(indexes), MAX_BATCH):
+            batch_indexes = indexes[start:start + MAX_BATCH]
+            results = model.predict([images[idx] for idx in batch_indexes], verbose=False)
+            for idx, r in zip(batch_indexes, results):
+                probs = r.probs.data.cpu().tolist()
+                class_name = r.names[r.probs.top1]
+                guess = guesses[idx]
+                prefilter.record(fast_class=guess[0] if guess is not None and guess[3] else None,
+                                 model_class=class_name)
+                prefilter.learn(features[idx], class_name, max(probs))
+                outputs[idx] = _summarize_water(class_name, {r.names[i]: p for i, p in enumerate(probs)},
+                                                images[idx], image_paths[idx], original_names[idx], annotate)
+    return outputs
+
+def _summarize_water(class_name, probs, image, image_path, original_name=None, annotate=None, source="model",
+                     fast_score=None):
+    """probs = ความน่าจะเป็นของ YOLO (None สำหรับคำตอบจาก fast path ซึ่งมีแค่ fast_score)"""
+    annotate = resolve_annotate_mode(annotate)
+
+    base_filename = source_stem(image_path, original_name, default="water")
 
     txt_path = os.path.join(output_folder, f"{base_filename}.txt")
+    image_output_path = os.path.join(output_folder, f"{base_filename}.jpg")
+    if annotate == ANNOTATE_EAGER:
+        cv2.imwrite(image_output_path, image)
+    elif annotate == ANNOTATE_LAZY:
+        defer_render(image_output_path, MODEL_KEY, image_path, None)
+    else:
+        image_output_path = None
+
+    water_result = WaterResult(class_name=class_name, confidence=probs[class_name] if probs else None, probs=probs,
+                               output_path=image_output_path, text_path=txt_path, source=source,
+                               fast_score=fast_score)
+    result_text = water_result.to_text()
+    # auto_dose.py อ่านไฟล์ txt นี้ (read_latest_txt) จึงยังต้องเขียนไว้
     with open(txt_path, "w", encoding="utf-8") as f:
         f.write(result_text)
 
-    image_output_path = os.path.join(output_folder, f"{base_filename}.jpg")
-    cv2.imwrite(image_output_path, image)
-
-    print(f"✅ วิเคราะห์สีน้ำ: {result_text}")
-    return image_output_path, txt_path
+    print(f"✅ วิเคราะห์สีน้ำ ({source}): {result_text}")
+    return water_result
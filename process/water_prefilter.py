@@ -0,0 +1,273 @@
+"""
+Water colour pre-classifier (fast path)
+สีน้ำในบ่อเปลี่ยนช้า และภาพส่วนใหญ่ตัดสินง่าย จึงมีขั้นตอนถูก ๆ ก่อน YOLO (water_class.pt):
+crop เฉพาะ ROI ที่เป็นน้ำ -> ย่อเหลือ WATER_FAST_SIDE px -> histogram สี HSV -> nearest centroid
+- centroid ของแต่ละ class เรียนรู้เองจากผลของ YOLO (เฉพาะภาพที่ YOLO มั่นใจ >= WATER_FAST_LEARN_CONF)
+  และบันทึกไว้ที่ WATER_FAST_STATE เพื่อใช้ต่อหลัง restart และใช้ร่วมกันระหว่าง worker process
+  (merge เป็นรอบ ทุก WATER_FAST_SAVE_EVERY ตัวอย่าง / WATER_FAST_SAVE_SECONDS วินาที)
+- ตอบเองเมื่อ class ที่ใกล้สุดมีตัวอย่างพอ (WATER_FAST_MIN_SAMPLES) และห่างจาก class ที่ 2 ชัดเจน
+  (margin = 1 - d1 / d2 >= WATER_FAST_MARGIN) ไม่อย่างนั้นส่งให้ YOLO ตามเดิม
+- ทุก ๆ WATER_FAST_AUDIT_EVERY ครั้งที่ fast path ตอบ จะรัน YOLO ซ้ำเพื่อวัด agreement rate
+- WATER_FAST_PATH=0 (ค่าเริ่มต้น) = shadow mode: ยังเรียนรู้และนับสถิติว่าถ้าเปิดจะตอบเองกี่ % ตรงกับโมเดลกี่ %
+  แต่ผลลัพธ์มาจาก YOLO ทุกภาพ ใช้ดูสถิติก่อนเปิดจริง
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+try:
+    import fcntl  # ล็อกไฟล์ state ข้าม process (ไม่มีบน Windows)
+except ImportError:
+    fcntl = None
+
+WATER_FAST_PATH = os.environ.get("WATER_FAST_PATH", "0") == "1"
+WATER_ROI = os.environ.get("WATER_ROI", "0,0,1,1")  # x0,y0,x1,y1 เป็นสัดส่วนของภาพ
+WATER_FAST_SIDE = int(os.environ.get("WATER_FAST_SIDE", "64"))
+WATER_FAST_MARGIN = float(os.environ.get("WATER_FAST_MARGIN", "0.35"))
+WATER_FAST_MIN_SAMPLES = int(os.environ.get("WATER_FAST_MIN_SAMPLES", "20"))
+WATER_FAST_LEARN_CONF = float(os.environ.get("WATER_FAST_LEARN_CONF", "0.8"))
+WATER_FAST_AUDIT_EVERY = int(os.environ.get("WATER_FAST_AUDIT_EVERY", "10"))
+WATER_FAST_STATE = os.environ.get(
+    "WATER_FAST_STATE",
+    os.path.join(os.environ.get("OUTPUT_WATER", "./output/water_output"), "water_prefilter.json"))
+
+WATER_FAST_SAVE_EVERY = int(os.environ.get("WATER_FAST_SAVE_EVERY", "25"))
+WATER_FAST_SAVE_SECONDS = float(os.environ.get("WATER_FAST_SAVE_SECONDS", "30"))
+
+HIST_BINS = (18, 8, 8)  # H, S, V
+COUNTER_KEYS = ("images", "confident", "served_fast", "audited", "agreed", "learned")
+MAX_CENTROID_WEIGHT = 500  # หลังจากนี้ centroid เป็น moving average ตามสีน้ำที่เปลี่ยนไปช้า ๆ
+
+
+def parse_roi(text: str = WATER_ROI):
+    x0, y0, x1, y1 = (float(v) for v in text.split(","))
+    if not (0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1):
+        raise ValueError(f"❌ WATER_ROI ไม่ถูกต้อง: {text} (ต้องเป็น x0,y0,x1,y1 ระหว่าง 0-1)")
+    return x0, y0, x1, y1
+
+
+def color_features(image, roi=None, side: int = WATER_FAST_SIDE):
+    """crop ROI -> ย่อด้านยาวเหลือ side px -> histogram H/S/V ต่อกัน (normalize รวม = 1 ต่อ channel)"""
+    x0, y0, x1, y1 = roi or parse_roi()
+    height, width = image.shape[:2]
+    crop = image[int(y0 * height):int(y1 * height), int(x0 * width):int(x1 * width)]
+    scale = side / float(max(crop.shape[:2]))
+    if scale < 1:
+        crop = cv2.resize(crop, (max(1, int(crop.shape[1] * scale)), max(1, int(crop.shape[0] * scale))),
+                          interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+    ranges = ((0, 180), (0, 256), (0, 256))
+    hists = [cv2.calcHist([hsv], [channel], None, [bins], list(value_range)).ravel()
+             for channel, (bins, value_range) in enumerate(zip(HIST_BINS, ranges))]
+    return np.concatenate([h / max(h.sum(), 1.0) for h in hists]).astype(np.float32)
+
+
+class WaterPrefilter:
+    """
+    nearest-centroid classifier บน histogram สี เรียนรู้จากผล YOLO แบบ online
+    state (centroid + ตัวนับ) ใช้ร่วมกันทุก process ผ่านไฟล์ WATER_FAST_STATE:
+    แต่ละ process สะสมส่วนที่เพิ่ม (delta) ไว้ในหน่วยความจำ แล้ว merge ลงไฟล์ภายใต้ file lock
+    ทุก WATER_FAST_SAVE_EVERY ตัวอย่าง หรือทุก WATER_FAST_SAVE_SECONDS วินาที (ไม่เขียนไฟล์ทุกครั้งที่เรียนรู้)
+    worker ของ ANALYSIS_EXECUTOR=process จึงไม่เขียนทับกัน และ /models (process หลัก) เห็นผลรวมจากไฟล์
+    """
+
+    def __init__(self, state_path: str = WATER_FAST_STATE):
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self.centroids = {}  # class_name -> (vector, จำนวนตัวอย่าง) = ไฟล์ล่าสุด + delta ของ process นี้
+        # confident = fast path ตอบได้ (shadow mode นับด้วย), served_fast = ตอบโดยไม่รัน YOLO จริง
+        # audited / agreed = ภาพที่ fast path ตอบได้และมีผล YOLO มาเทียบ
+        self._saved_counters = dict.fromkeys(COUNTER_KEYS, 0)  # ผลรวมทุก process ตอน sync ล่าสุด
+        self._counters = dict.fromkeys(COUNTER_KEYS, 0)        # delta ของ process นี้ที่ยังไม่ merge
+        self._pending = {}  # class_name -> (ผลรวม vector, จำนวน) ที่เรียนรู้แต่ยังไม่ merge
+        self._pending_samples = 0
+        self._confident_seq = 0  # ใช้เลือกภาพ audit ใน process นี้
+        self._last_sync = time.monotonic()
+        self._state_mtime = None
+        with self._lock:
+            self._sync()
+        if self.centroids:
+            print(f"🎨 โหลด water prefilter: {', '.join(f'{k}({v[1]})' for k, v in self.centroids.items())}")
+        atexit.register(self.flush)
+
+    # ---------- state file ----------
+    def _read_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {}, dict.fromkeys(COUNTER_KEYS, 0)
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            centroids = {name: (np.asarray(c["vector"], dtype=np.float32), int(c["samples"]))
+                         for name, c in state["centroids"].items()}
+            counters = {key: int(state.get("counters", {}).get(key, 0)) for key in COUNTER_KEYS}
+            return centroids, counters
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ โหลด water prefilter ไม่สำเร็จ ({e}) เริ่มเรียนรู้ใหม่")
+            return {}, dict.fromkeys(COUNTER_KEYS, 0)
+
+    def _sync(self):
+        """
+        merge delta ของ process นี้ลงไฟล์ (อ่าน -> รวม -> เขียน tmp -> os.replace ภายใต้ file lock)
+        แล้วรับ centroid / ตัวนับรวมจากไฟล์มาใช้ (ต้องถือ self._lock)
+        """
+        dirty = bool(self._pending) or any(self._counters.values())
+        with _StateFileLock(self.state_path):
+            centroids, counters = self._read_state()
+            for name, (vector_sum, count) in self._pending.items():
+                vector, samples = centroids.get(name, (np.zeros_like(vector_sum), 0))
+                weight = min(samples, MAX_CENTROID_WEIGHT)
+                centroids[name] = ((vector * weight + vector_sum) / (weight + count), samples + count)
+            for key in COUNTER_KEYS:
+                counters[key] += self._counters[key]
+            if dirty and self.state_path:
+                state = {"bins": HIST_BINS, "counters": counters,
+                         "centroids": {name: {"vector": vector.tolist(), "samples": samples}
+                                       for name, (vector, samples) in centroids.items()}}
+                os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+                tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.state_path)
+        self.centroids = centroids
+        self._saved_counters = counters
+        self._counters = dict.fromkeys(COUNTER_KEYS, 0)
+        self._pending = {}
+        self._pending_samples = 0
+        self._last_sync = time.monotonic()
+        self._state_mtime = _mtime(self.state_path)
+
+    def _maybe_sync(self):
+        """sync เมื่อเรียนรู้ครบ WATER_FAST_SAVE_EVERY ตัวอย่าง หรือครบเวลา (และมี delta / ไฟล์ถูก process อื่นแก้)"""
+        if self._pending_samples >= WATER_FAST_SAVE_EVERY:
+            self._sync()
+        elif time.monotonic() - self._last_sync >= WATER_FAST_SAVE_SECONDS:
+            if self._pending or any(self._counters.values()) or _mtime(self.state_path) != self._state_mtime:
+                self._sync()
+
+    def flush(self):
+        with self._lock:
+            if self._pending or any(self._counters.values()):
+                self._sync()
+
+    # ---------- classifier ----------
+    def predict(self, features):
+        """
+        :return: (class_name, margin, scores, confident) หรือ None ถ้ายังไม่มี centroid พอเทียบ
+        scores = ความใกล้ของแต่ละ class (รวม = 1) ไม่ใช่ความน่าจะเป็น ผลลัพธ์จึงเก็บแค่ margin เป็น fast_score
+        """
+        with self._lock:
+            if len(self.centroids) < 2:
+                return None
+            names = list(self.centroids)
+            vectors = np.stack([self.centroids[name][0] for name in names])
+            samples = [self.centroids[name][1] for name in names]
+        distances = np.abs(vectors - features).sum(axis=1)  # L1 ระหว่าง histogram
+        order = np.argsort(distances)
+        d1, d2 = distances[order[0]], distances[order[1]]
+        margin = 1.0 - d1 / max(d2, 1e-9)
+        similarity = 1.0 / np.maximum(distances, 1e-6)
+        scores = {name: float(s) for name, s in zip(names, similarity / similarity.sum())}
+        confident = margin >= WATER_FAST_MARGIN and samples[order[0]] >= WATER_FAST_MIN_SAMPLES
+        return names[order[0]], float(margin), scores, bool(confident)
+
+    def learn(self, features, class_name: str, confidence: float):
+        """อัปเดต centroid ด้วยผลของ YOLO (เฉพาะที่มั่นใจ) เขียนไฟล์ตามรอบของ _maybe_sync"""
+        if confidence < WATER_FAST_LEARN_CONF:
+            return
+        with self._lock:
+            vector, samples = self.centroids.get(class_name, (np.zeros_like(features), 0))
+            weight = min(samples, MAX_CENTROID_WEIGHT)
+            self.centroids[class_name] = ((vector * weight + features) / (weight + 1), samples + 1)
+            vector_sum, count = self._pending.get(class_name, (np.zeros_like(features), 0))
+            self._pending[class_name] = (vector_sum + features, count + 1)
+            self._pending_samples += 1
+            self._counters["learned"] += 1
+            self._maybe_sync()
+
+    def take_fast_path(self) -> bool:
+        """
+        นับภาพที่ fast path ตอบได้ แล้วตัดสินว่าจะใช้คำตอบเลยหรือไม่
+        ทุก ๆ WATER_FAST_AUDIT_EVERY ภาพ (และทุกภาพใน shadow mode) ยังส่งให้ YOLO เพื่อวัด agreement
+        """
+        with self._lock:
+            self._counters["confident"] += 1
+            self._confident_seq += 1
+            audit = WATER_FAST_AUDIT_EVERY > 0 and (self._confident_seq - 1) % WATER_FAST_AUDIT_EVERY == 0
+            serve = WATER_FAST_PATH and not audit
+            self._counters["served_fast"] += int(serve)
+            return serve
+
+    def record(self, images: int = 0, fast_class=None, model_class=None):
+        with self._lock:
+            self._counters["images"] += images
+            if fast_class is not None and model_class is not None:
+                self._counters["audited"] += 1
+                self._counters["agreed"] += int(fast_class == model_class)
+            self._maybe_sync()
+
+    def stats(self) -> dict:
+        """ผลรวมของทุก process (จากไฟล์ ณ sync ล่าสุด) + delta ของ process นี้ที่ยังไม่ merge"""
+        with self._lock:
+            self._maybe_sync()
+            c = {key: self._saved_counters[key] + self._counters[key] for key in COUNTER_KEYS}
+            centroids = {name: samples for name, (_, samples) in self.centroids.items()}
+        images = max(c["images"], 1)
+        return {
+            "enabled": WATER_FAST_PATH,
+            "roi": WATER_ROI,
+            "scope": "shared" if self.state_path else "process",
+            "centroids": centroids,
+            **c,
+            "fast_path_rate": round(c["confident"] / images, 4),
+            "served_fast_rate": round(c["served_fast"] / images, 4),
+            "agreement_rate": round(c["agreed"] / c["audited"], 4) if c["audited"] else None,
+        }
+
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+class _StateFileLock:
+    """flock บน <state>.lock กัน process อื่น merge พร้อมกัน (ไม่มี fcntl = lock เฉพาะใน process)"""
+
+    def __init__(self, state_path: str):
+        self.path = f"{state_path}.lock" if state_path else None
+
+    def __enter__(self):
+        self.f = None
+        if self.path and fcntl is not None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.f = open(self.path, "a")
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.f is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+            self.f.close()
+
+
+_prefilter = None
+_prefilter_lock = threading.Lock()
+
+
+def get_prefilter() -> WaterPrefilter:
+    global _prefilter
+    with _prefilter_lock:
+        if _prefilter is None:
+            _prefilter = WaterPrefilter()
+    return _prefilter
+
+
+def prefilter_stats() -> dict:
+    return get_prefilter().stats()
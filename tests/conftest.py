@@ -0,0 +1,32 @@
+"""
+ตั้งค่า ENV ก่อน import main: storage / output / ดัชนี / แคช อยู่ในโฟลเดอร์ชั่วคราวทั้งหมด ไม่แตะ /data
+ไม่ warm-up โมเดล และไม่ push ไปแอป (เทสไม่ต้องมีไฟล์โมเดลจริง)
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+_TMP = tempfile.mkdtemp(prefix="shrimp-tests-")
+_STORAGE = os.path.join(_TMP, "local_storage")
+
+os.environ.update({
+    "STORAGE_DIR": _STORAGE,
+    "LOCAL_STORAGE_BASE": _STORAGE,
+    "LOCAL_STORAGE_ROOT": _STORAGE,
+    "SENSOR_DIR": os.path.join(_STORAGE, "sensor"),
+    "DATA_PONDS_DIR": os.path.join(_TMP, "data_ponds"),
+    "OUTPUT_SIZE": os.path.join(_TMP, "output", "size_output"),
+    "OUTPUT_SHRIMP": os.path.join(_TMP, "output", "shrimp_output"),
+    "OUTPUT_DIN": os.path.join(_TMP, "output", "din_output"),
+    "OUTPUT_WATER": os.path.join(_TMP, "output", "water_output"),
+    "YOLO_CONFIG_DIR": os.path.join(_TMP, "yolo"),
+    "MODEL_WARMUP": "0",
+    "PUSH_INOTIFY": "0",
+    "APP_STATUS_URL": "",
+    "APP_SIZE_URL": "",
+})
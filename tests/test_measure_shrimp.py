@@ -0,0 +1,111 @@
+"""process.size.measure_shrimp (numpy ทั้ง array) ต้องได้ผลเท่ากับลูปทีละตัวแบบเดิม"""
+
+import math
+
+import numpy as np
+import pytest
+
+from process.size import CONFIDENCE_THRESHOLD, DEFAULT_A, DEFAULT_B, class_id, measure_shrimp
+
+
+class _Tensor:
+    def __init__(self, array):
+        self.array = np.asarray(array)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class _Result:
+    """จำลองผลของ ultralytics เฉพาะส่วนที่ measure_shrimp ใช้"""
+
+    def __init__(self, keypoints, cls, conf):
+        self.keypoints = type("Keypoints", (), {"xy": None if keypoints is None else _Tensor(keypoints)})()
+        self.boxes = type("Boxes", (), {"cls": _Tensor(cls), "conf": _Tensor(conf)})()
+
+
+def _measure_loop(result, pixel_per_cm=13, a=DEFAULT_A, b=DEFAULT_B):
+    """ลูปเดิมก่อน vectorize: คืน (head_x, head_y, length_cm, weight_g) เรียงตามหัว (บนลงล่าง, ซ้ายไปขวา)"""
+    keypoints = result.keypoints.xy.cpu().numpy()
+    boxes_cls = result.boxes.cls.cpu().numpy()
+    boxes_conf = result.boxes.conf.cpu().numpy()
+    shrimp_data = []
+    for i, kp in enumerate(keypoints):
+        if i >= len(boxes_cls) or i >= len(boxes_conf):
+            continue
+        if int(boxes_cls[i]) != class_id or boxes_conf[i] <= CONFIDENCE_THRESHOLD:
+            continue
+        head, middle, tail = kp[0], kp[1], kp[2]
+        dist = lambda p1, p2: math.sqrt((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2)
+        length_cm = (dist(head, middle) + dist(middle, tail)) / pixel_per_cm if pixel_per_cm > 0 else 0
+        weight = a * (length_cm ** b) if length_cm > 0 else 0
+        shrimp_data.append((head[0], head[1], length_cm, weight))
+    shrimp_data.sort(key=lambda p: (p[1], p[0]))
+    return shrimp_data
+
+
+def _random_result(rng, n, n_boxes=None):
+    keypoints = rng.uniform(0, 2000, size=(n, 3, 2)).astype(np.float32)
+    n_boxes = n if n_boxes is None else n_boxes
+    cls = rng.integers(0, 2, size=n_boxes).astype(np.float32)
+    conf = rng.uniform(0, 1, size=n_boxes).astype(np.float32)
+    return _Result(keypoints, cls, conf)
+
+
+def _assert_same(shrimp, expected):
+    assert len(shrimp) == len(expected)
+    if not expected:
+        return
+    expected = np.array(expected, dtype=np.float64)
+    np.testing.assert_allclose(shrimp["head"][:, 0], expected[:, 0])
+    np.testing.assert_allclose(shrimp["head"][:, 1], expected[:, 1])
+    np.testing.assert_allclose(shrimp["length_cm"], expected[:, 2], rtol=1e-6)
+    np.testing.assert_allclose(shrimp["weight_g"], expected[:, 3], rtol=1e-5)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_loop_on_random_detections(seed):
+    result = _random_result(np.random.default_rng(seed), 300)
+    _assert_same(measure_shrimp(result), _measure_loop(result))
+
+
+@pytest.mark.parametrize("pixel_per_cm", [1, 13, 40.5])
+def test_matches_loop_for_pixel_scale(pixel_per_cm):
+    result = _random_result(np.random.default_rng(42), 50)
+    _assert_same(measure_shrimp(result, pixel_per_cm), _measure_loop(result, pixel_per_cm))
+
+
+def test_custom_weight_coefficients():
+    result = _random_result(np.random.default_rng(7), 50)
+    _assert_same(measure_shrimp(result, 13, 0.01, 2.9), _measure_loop(result, 13, 0.01, 2.9))
+
+
+def test_fewer_boxes_than_keypoints_are_ignored_like_the_loop():
+    result = _random_result(np.random.default_rng(3), 40, n_boxes=25)
+    shrimp = measure_shrimp(result)
+    _assert_same(shrimp, _measure_loop(result))
+    assert len(shrimp) <= 25
+
+
+def test_confidence_threshold_is_exclusive():
+    keypoints = np.array([[[0, 0], [3, 4], [6, 8]]] * 2, dtype=np.float32)
+    result = _Result(keypoints, [0, 0], [CONFIDENCE_THRESHOLD, 0.9])
+    shrimp = measure_shrimp(result, pixel_per_cm=1)
+    assert len(shrimp) == 1
+    assert shrimp["length_cm"][0] == pytest.approx(10.0)
+    assert shrimp["weight_g"][0] == pytest.approx(DEFAULT_A * 10.0 ** DEFAULT_B)
+
+
+def test_zero_pixel_scale_gives_zero_length_and_weight():
+    result = _random_result(np.random.default_rng(1), 20)
+    shrimp = measure_shrimp(result, pixel_per_cm=0)
+    assert len(shrimp) == len(_measure_loop(result, 0))
+    assert not shrimp["length_cm"].any() and not shrimp["weight_g"].any()
+
+
+def test_no_detections():
+    assert len(measure_shrimp(_Result(None, [], []))) == 0
+    assert len(measure_shrimp(_Result(np.zeros((0, 3, 2), np.float32), [], []))) == 0
@@ -0,0 +1,127 @@
+"""เอกสารสถานะบ่อที่ serialize ไว้ล่วงหน้า (utils.pond_status) และ ETag / 304 ของ GET /ponds/{id}/..."""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from utils.pond_status import PondStatusEngine
+
+
+class _Results:
+    """แทน result index: (result_type, pond) -> (path, doc) ล่าสุด"""
+
+    def __init__(self):
+        self.latest = {}
+        self.version = 0
+
+    def put(self, result_type, pond, doc):
+        self.version += 1
+        self.latest[(result_type, str(pond))] = (f"/results/{result_type}_{pond}_{self.version}.json", doc)
+
+    def lookup(self, result_type, pond):
+        return self.latest.get((result_type, pond), (None, None))
+
+
+@pytest.fixture
+def results():
+    return _Results()
+
+
+@pytest.fixture
+def engine(results):
+    published = []
+    engine = PondStatusEngine(lambda: "2025-09-10T08:00:00", lambda kind, pond, doc: published.append((kind, pond)),
+                              lookup=results.lookup)
+    engine.published = published
+    return engine
+
+
+@pytest.fixture
+def client(engine, monkeypatch):
+    monkeypatch.setattr(main, "pond_engine", engine)
+    return TestClient(main.app)  # ไม่เข้า context: ไม่รัน startup (push loop / job worker)
+
+
+def test_body_is_serialized_document_with_strong_etag(engine, results):
+    results.put("sensor", 1, {"pond_id": 1, "ph": 7.5, "temperature": 28, "do": 5})
+    engine.apply({("sensor", "1")})
+    body, etag = engine.body("status", 1)
+    doc = json.loads(body)
+    assert (doc["pondId"], doc["PH"], doc["Temp"], doc["DO"]) == ("1", 7.5, 28, 5)
+    assert etag.startswith('"') and etag.endswith('"') and not etag.startswith("W/")
+    assert engine.published == [("status", 1)]
+
+
+def test_etag_only_changes_when_document_changes(engine, results):
+    results.put("sensor", 1, {"pond_id": 1, "ph": 7.5})
+    engine.apply({("sensor", "1")})
+    _, etag = engine.body("status", 1)
+
+    results.put("sensor", 1, {"pond_id": 1, "ph": 7.5})  # ไฟล์ใหม่ ค่าเดิม
+    engine.apply({("sensor", "1")})
+    assert engine.body("status", 1)[1] == etag
+    assert len(engine.published) == 1
+
+    results.put("sensor", 1, {"pond_id": 1, "ph": 7.8})
+    engine.apply({("sensor", "1")})
+    assert engine.body("status", 1)[1] != etag
+    assert len(engine.published) == 2
+
+
+def test_event_for_one_pond_does_not_touch_another(engine, results):
+    results.put("sensor", 1, {"pond_id": 1, "ph": 7.5})
+    results.put("size", 2, {"pond_number": 2, "result": {"avg_length_cm": 9.5, "avg_weight_g": 7.1}})
+    engine.apply({("sensor", "1"), ("size", "2")})
+    _, etag = engine.body("status", 1)
+    results.put("sensor", 2, {"pond_id": 2, "ph": 8.0})
+    engine.apply({("sensor", "2")})
+    assert engine.body("status", 1)[1] == etag
+    assert json.loads(engine.body("size", 2)[0])["Size_gram"] == 7.1
+    assert engine.body("size", 1) is None
+
+
+def test_get_returns_cached_bytes_with_etag(client, engine, results):
+    results.put("sensor", 1, {"pond_id": 1, "ph": 7.5})
+    engine.apply({("sensor", "1")})
+    body, etag = engine.body("status", 1)
+
+    response = client.get("/ponds/1/status")
+    assert response.status_code == 200
+    assert response.content == body
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.headers["content-type"] == "application/json"
+
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"other", {etag}', "*"])
+def test_matching_if_none_match_returns_304(client, engine, results, if_none_match):
+    results.put("sensor", 1, {"pond_id": 1, "ph": 7.5})
+    engine.apply({("sensor", "1")})
+    _, etag = engine.body("status", 1)
+
+    response = client.get("/ponds/1/status", headers={"If-None-Match": if_none_match.format(etag=etag)})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+
+def test_stale_etag_gets_new_document(client, engine, results):
+    results.put("sensor", 1, {"pond_id": 1, "ph": 7.5})
+    engine.apply({("sensor", "1")})
+    _, old_etag = engine.body("status", 1)
+    results.put("sensor", 1, {"pond_id": 1, "ph": 7.9})
+    engine.apply({("sensor", "1")})
+
+    response = client.get("/ponds/1/status", headers={"If-None-Match": old_etag})
+    assert response.status_code == 200
+    assert response.json()["PH"] == 7.9
+    assert response.headers["etag"] != old_etag
+
+
+def test_pond_without_document(client):
+    response = client.get("/ponds/42/shrimp_size")
+    assert response.status_code == 200
+    assert response.json() == {"error": "no shrimp size for pond 42 yet"}
+    assert "etag" not in response.headers
@@ -0,0 +1,62 @@
+"""result cache key ของ /process (main._result_cache_key) และการคืนผลจากแคช"""
+
+import json
+import os
+
+import pytest
+
+import main
+
+SHA = "ab" * 32
+
+
+def _item(**overrides):
+    item = {"index": 0, "kind": "water", "filename": "water_pond1_a.jpg", "input_path": "unused.jpg",
+            "pond_id": 1, "pond_number": None, "total_larvae": None, "sha256": SHA}
+    item.update(overrides)
+    return item
+
+
+def test_same_upload_gets_same_key():
+    key = main._result_cache_key(_item(), "eager")
+    assert key is not None
+    assert key == main._result_cache_key(_item(filename="water_pond1_other_name.jpg"), "eager")
+
+
+def test_same_bytes_for_another_pond_gets_another_key():
+    # บ่อที่ยังไม่มีข้อมูลใน data_ponds ได้ pond_number = None ทั้งคู่ key ต้องแยกด้วย pond_id จากชื่อไฟล์
+    pond1 = main._result_cache_key(_item(pond_id=1, filename="water_pond1_a.jpg"), "eager")
+    pond3 = main._result_cache_key(_item(pond_id=3, filename="water_pond3_a.jpg"), "eager")
+    assert pond1 != pond3
+
+
+@pytest.mark.parametrize("changes", [
+    {"sha256": "cd" * 32},
+    {"kind": "shrimp"},
+    {"pond_number": 7},
+    {"total_larvae": 50000},
+])
+def test_inputs_that_change_the_result_change_the_key(changes):
+    assert main._result_cache_key(_item(), "eager") != main._result_cache_key(_item(**changes), "eager")
+
+
+def test_annotate_mode_is_part_of_the_key():
+    keys = {main._result_cache_key(_item(), mode) for mode in ("off", "eager", "lazy")}
+    assert len(keys) == 3
+
+
+def test_no_key_without_sha256():
+    assert main._result_cache_key(_item(sha256=None), "eager") is None
+
+
+def test_cached_result_rewrites_deleted_json(tmp_path):
+    key = main._result_cache_key(_item(pond_id=5, filename="water_pond5_a.jpg"), "eager")
+    json_path = os.path.join(main.LOCAL_STORAGE_BASE, "water", "water_pond5_a_cached.json")
+    document = {"type": "water_image", "pond_number": 5, "text_content": "เขียว"}
+    main.result_cache.put(key, {"type": "water_image", "json_path": json_path, "document": document})
+
+    response = main._cached_result(key, "water_pond5_a.jpg")
+    assert response == {"type": "water_image", "filename": "water_pond5_a.jpg", "json": json_path, "cached": True}
+    with open(json_path, "r", encoding="utf-8") as f:
+        assert json.load(f) == document
+    assert main._cached_result(main._result_cache_key(_item(pond_id=6), "eager"), "water_pond6_a.jpg") is None
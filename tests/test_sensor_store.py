@@ -0,0 +1,113 @@
+"""utils.sensor_store: รูปแบบแถว binary, การอ่านท้ายไฟล์, merge ค่าย้อนหลัง และ migrate ไฟล์ JSON เดิม"""
+
+import json
+import math
+import os
+import struct
+from datetime import datetime
+
+import pytest
+
+from utils.sensor_store import (BANGKOK_TZ, ROW_SIZE, SensorStore, decode_row, encode_row, migrate_legacy,
+                                parse_device_timestamp)
+
+DAY1 = datetime(2025, 9, 10, 8, 0, tzinfo=BANGKOK_TZ).timestamp()
+DAY2 = datetime(2025, 9, 11, 8, 0, tzinfo=BANGKOK_TZ).timestamp()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SensorStore(str(tmp_path / "sensor_store"), group_commit_ms=0, fsync=False)
+    yield store
+    store.close()
+
+
+def _append(store, pond_id, received_at, **values):
+    return store.append({"pond_id": pond_id, **values}, received_at).result(timeout=10)
+
+
+def test_row_is_40_little_endian_doubles():
+    row = encode_row({"ph": 7.5, "temperature": 28, "do": None, "timestamp": "2025-09-10T08:00:00"}, 1000.0)
+    assert len(row) == ROW_SIZE == 40
+    received_at, device_ts, ph, temperature, do = struct.unpack("<ddddd", row)
+    assert (received_at, device_ts, ph, temperature) == (1000.0, DAY1, 7.5, 28.0)
+    assert math.isnan(do)
+
+
+def test_decode_uses_device_timestamp_and_none_for_missing():
+    reading = decode_row("3", struct.unpack("<ddddd", encode_row({"ph": "7.1", "timestamp": "bad"}, DAY1)))
+    assert reading == {"pond_id": 3, "ph": 7.1, "temperature": None, "do": None,
+                       "timestamp": "2025-09-10T08:00:00", "received_at": DAY1}
+
+
+def test_parse_device_timestamp():
+    assert parse_device_timestamp("2025-09-10T08:00:00") == DAY1
+    assert parse_device_timestamp("2025-09-10T01:00:00Z") == DAY1
+    assert parse_device_timestamp(DAY1) == DAY1
+    assert math.isnan(parse_device_timestamp("yesterday"))
+
+
+def test_append_writes_one_row_per_reading_in_day_partition(store):
+    path = _append(store, 1, DAY1, ph=7.0)
+    _append(store, 1, DAY1 + 60, ph=7.1)
+    assert path == os.path.join(store.root, "pond=1", "20250910.bin")
+    assert os.path.getsize(path) == 2 * ROW_SIZE
+    assert store.ponds() == ["1"]
+
+
+def test_last_is_newest_first_across_days(store):
+    _append(store, 1, DAY1, ph=7.0)
+    _append(store, 1, DAY1 + 60, ph=7.1)
+    _append(store, 1, DAY2, ph=7.2)
+    _append(store, 2, DAY2 + 60, ph=9.9)
+    assert [r["ph"] for r in store.last(1, 3)] == [7.2, 7.1, 7.0]
+    assert [r["ph"] for r in store.last(1, 10)] == [7.2, 7.1, 7.0]
+    assert store.last(3, 5) == []
+
+
+def test_partial_trailing_row_is_skipped(store):
+    path = _append(store, 1, DAY1, ph=7.0)
+    with open(path, "ab") as f:
+        f.write(b"\x00" * (ROW_SIZE // 2))  # writer อีก process ยังเขียนไม่ครบแถว
+    assert [r["ph"] for r in store.last(1, 5)] == [7.0]
+    assert len(store.range(1)) == 1
+
+
+def test_range_is_half_open_and_oldest_first(store):
+    for i in range(5):
+        _append(store, 1, DAY1 + i * 60, ph=7.0 + i / 10)
+    _append(store, 1, DAY2, ph=8.0)
+    assert [r["received_at"] for r in store.range(1, DAY1 + 60, DAY1 + 240)] == [DAY1 + 60, DAY1 + 120, DAY1 + 180]
+    assert [r["ph"] for r in store.range(1, start=DAY2)] == [8.0]
+    assert len(store.range(1)) == 6
+
+
+def test_import_merges_in_order_and_drops_duplicates(store):
+    _append(store, 1, DAY1, ph=7.0, do=None)
+    _append(store, 1, DAY1 + 120, ph=7.2)
+    added = store.import_readings([
+        {"pond_id": 1, "received_at": DAY1 + 60, "ph": 7.1},
+        {"pond_id": 1, "received_at": DAY1, "ph": 7.0, "do": None},  # ซ้ำทุกฟิลด์ (รวม NaN)
+    ])
+    assert added == 1
+    assert [r["ph"] for r in store.range(1)] == [7.0, 7.1, 7.2]
+    assert store.import_readings([{"pond_id": 1, "received_at": DAY1 + 60, "ph": 7.1}]) == 0
+    _append(store, 1, DAY1 + 180, ph=7.3)  # ยังต่อท้ายไฟล์ที่ถูกแทนที่ได้
+    assert [r["ph"] for r in store.last(1, 2)] == [7.3, 7.2]
+
+
+def test_migrate_legacy_json_is_rerunnable(store, tmp_path):
+    src = tmp_path / "sensor"
+    src.mkdir()
+    for i, ph in enumerate((7.0, 7.4)):
+        path = src / f"sensor_{i}.json"
+        path.write_text(json.dumps({"pond_id": 1, "ph": ph, "temperature": 28, "do": 5,
+                                    "timestamp": "2025-09-10T08:00:00"}), encoding="utf-8")
+        os.utime(path, (DAY1 + i, DAY1 + i))
+    (src / "sensor_broken.json").write_text("{", encoding="utf-8")
+
+    result = migrate_legacy(str(src), store)
+    assert result == {"files": 3, "imported": 2, "skipped": 1, "deleted": 0}
+    assert [r["ph"] for r in store.last(1, 5)] == [7.4, 7.0]
+    assert migrate_legacy(str(src), store, delete=True)["imported"] == 0
+    assert sorted(os.listdir(src)) == ["sensor_broken.json"]
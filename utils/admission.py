@@ -0,0 +1,123 @@
+"""
+Admission Control
+จำกัดจำนวนงานที่รันพร้อมกันของแต่ละ analyzer (size / shrimp / water / din) และความยาวคิวรอ
+ถ้าคิวเต็มให้ตอบ 429 + Retry-After ทันที แทนที่จะรับทุก request จน container memory หมด
+Raspberry Pi ดู /admission (queue depth, เวลารอ) เพื่อ back off แทนการ retry ซ้ำ ๆ
+
+ENV (ต่อ analyzer, KIND = SIZE / SHRIMP / WATER / DIN):
+    ADMISSION_<KIND>_CONCURRENCY = งานที่รันพร้อมกันได้ (ค่าเริ่มต้น 2, din 1)
+    ADMISSION_<KIND>_QUEUE       = งานที่รอได้ เกินนี้ตอบ 429 (ค่าเริ่มต้น 8, din 2)
+"""
+
+import asyncio
+import math
+import os
+import time
+
+DEFAULT_LIMITS = {"size": (2, 8), "shrimp": (2, 8), "water": (2, 8), "din": (1, 2)}
+EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, kind: str, retry_after: int):
+        super().__init__(f"คิว {kind} เต็ม กรุณาลองใหม่ใน {retry_after} วินาที")
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class AnalyzerGate:
+    """semaphore + คิวรอแบบมีขอบเขตของ analyzer หนึ่งตัว (ใช้ใน event loop เดียว ไม่ต้องมี lock)"""
+
+    def __init__(self, kind: str, concurrency: int, max_waiting: int):
+        self.kind = kind
+        self.concurrency = max(1, concurrency)
+        self.max_waiting = max(0, max_waiting)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.avg_wait = 0.0
+        self.last_wait = 0.0
+        self.avg_service = None
+
+    def is_full(self) -> bool:
+        return self.running >= self.concurrency and self.waiting >= self.max_waiting
+
+    def retry_after(self) -> int:
+        """ประมาณเวลาจนกว่าจะมีที่ว่างในคิว จากเวลาวิเคราะห์เฉลี่ยต่องาน"""
+        service = self.avg_service if self.avg_service is not None else 5.0
+        return max(1, math.ceil(service * (self.waiting + 1) / self.concurrency))
+
+    def check(self):
+        if self.is_full():
+            self.rejected += 1
+            raise AdmissionRejected(self.kind, self.retry_after())
+
+    async def run(self, func, *args, reject: bool = True, **kwargs):
+        """
+        await func(*args, **kwargs) เมื่อได้ slot
+        reject=True: คิวเต็มให้ raise AdmissionRejected ทันที, False: รอจนได้ slot (ใช้กับ /jobs ที่มีคิวของตัวเอง)
+        """
+        if reject:
+            self.check()
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        wait = time.perf_counter() - queued_at
+        self.last_wait = wait
+        self.avg_wait = wait if self.admitted == 0 else (1 - EWMA_ALPHA) * self.avg_wait + EWMA_ALPHA * wait
+        self.admitted += 1
+
+        self.running += 1
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self.running -= 1
+            service = time.perf_counter() - started
+            self.avg_service = service if self.avg_service is None else \
+                (1 - EWMA_ALPHA) * self.avg_service + EWMA_ALPHA * service
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "max_waiting": self.max_waiting,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_s": round(self.avg_wait, 3),
+            "last_wait_s": round(self.last_wait, 3),
+            "avg_service_s": round(self.avg_service, 3) if self.avg_service is not None else None,
+            "retry_after_s": self.retry_after() if self.is_full() else 0,
+        }
+
+
+class AdmissionController:
+    def __init__(self, limits: dict = None):
+        limits = limits or {}
+        self.gates = {}
+        for kind, (concurrency, max_waiting) in DEFAULT_LIMITS.items():
+            concurrency, max_waiting = limits.get(kind, (concurrency, max_waiting))
+            env = kind.upper()
+            self.gates[kind] = AnalyzerGate(
+                kind,
+                int(os.environ.get(f"ADMISSION_{env}_CONCURRENCY", concurrency)),
+                int(os.environ.get(f"ADMISSION_{env}_QUEUE", max_waiting)),
+            )
+
+    def check(self, kinds):
+        """ตรวจก่อนรับงานว่าทุก analyzer ที่ต้องใช้ยังมีที่ในคิว (ไม่ต้องเริ่มงานแล้วค่อยถูกปฏิเสธกลางทาง)"""
+        for kind in sorted(set(kinds)):
+            self.gates[kind].check()
+
+    async def run(self, kind: str, func, *args, reject: bool = True, **kwargs):
+        return await self.gates[kind].run(func, *args, reject=reject, **kwargs)
+
+    def stats(self) -> dict:
+        return {kind: gate.stats() for kind, gate in self.gates.items()}
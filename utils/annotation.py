@@ -0,0 +1,153 @@
+"""
+Annotation
+โหมดการวาดผลลัพธ์ลงบนภาพ / วิดีโอของแต่ละ analyzer
+- off   : ไม่สร้างไฟล์ภาพ / วิดีโอผลลัพธ์เลย (ได้แค่ตัวเลขใน txt / JSON)
+- eager : วาดและบันทึกทันทีตอนวิเคราะห์ (แบบเดิม)
+- lazy  : เก็บ detection ดิบไว้ในไฟล์ <output>.pending.json แล้วค่อยวาดตอนมีคนเปิด URL ครั้งแรก
+          (main.py เรียก render_pending() ก่อน serve static file)
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import cv2
+
+ANNOTATE_OFF = "off"
+ANNOTATE_EAGER = "eager"
+ANNOTATE_LAZY = "lazy"
+ANNOTATE_MODES = (ANNOTATE_OFF, ANNOTATE_EAGER, ANNOTATE_LAZY)
+
+ANNOTATE_MODE = os.environ.get("ANNOTATE_MODE", ANNOTATE_EAGER)
+
+PENDING_SUFFIX = ".pending.json"
+SOURCE_SUFFIX = ".src"
+
+_renderers = {}
+_render_locks = {}  # output_path -> [Lock, จำนวนผู้ใช้] ลบทิ้งเมื่อไม่มีใครใช้แล้ว
+_render_locks_lock = threading.Lock()
+
+
+def resolve_annotate_mode(mode=None) -> str:
+    """แปลงค่า annotate เป็นโหมด: None = ANNOTATE_MODE, True = eager, False = off"""
+    if mode is None:
+        mode = ANNOTATE_MODE
+    elif mode is True:
+        mode = ANNOTATE_EAGER
+    elif mode is False:
+        mode = ANNOTATE_OFF
+    mode = str(mode).strip().lower()
+    if mode not in ANNOTATE_MODES:
+        raise ValueError(f"❌ Unknown annotate mode: {mode}. ใช้ได้แค่ {list(ANNOTATE_MODES)}")
+    return mode
+
+
+def pending_path(output_path: str) -> str:
+    return f"{output_path}{PENDING_SUFFIX}"
+
+
+def is_pending(output_path: str) -> bool:
+    return not os.path.exists(output_path) and os.path.exists(pending_path(output_path))
+
+
+def _persist_source(output_path: str, source) -> str:
+    """
+    เก็บ input ไว้ให้ render ภายหลัง: path เดิมใช้ได้เลย, bytes เขียนลงไฟล์ตรง ๆ (ไม่ต้อง encode)
+    ส่วน numpy array ต้อง encode เป็น jpg
+    """
+    if isinstance(source, (str, os.PathLike)) and os.path.exists(source):
+        return os.path.abspath(os.fspath(source))
+    src_path = f"{output_path}{SOURCE_SUFFIX}"
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        with open(src_path, "wb") as f:
+            f.write(source)
+    else:
+        ok, encoded = cv2.imencode(".jpg", source)
+        if not ok:
+            raise ValueError("❌ encode ภาพต้นฉบับไม่สำเร็จ")
+        encoded.tofile(src_path)
+    return src_path
+
+
+def defer_render(output_path: str, kind: str, source, detections) -> str:
+    """
+    lazy mode: บันทึก input + detection ไว้ข้างไฟล์ output แทนการวาดทันที
+    :return: output_path (ยังไม่มีไฟล์จริงจนกว่าจะ render_pending)
+    """
+    data = {"kind": kind, "source": _persist_source(output_path, source), "detections": detections}
+    tmp_path = f"{pending_path(output_path)}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, pending_path(output_path))
+    if os.path.exists(output_path):
+        os.remove(output_path)  # ไฟล์เก่าชื่อเดียวกันจะทำให้ไม่ render ใหม่
+    return output_path
+
+
+def register_renderer(kind: str, renderer):
+    """renderer(source_path, output_path, detections) ต้องเขียนไฟล์ output_path ให้เสร็จ"""
+    _renderers[kind] = renderer
+
+
+def image_renderer(draw):
+    """สร้าง renderer สำหรับภาพจากฟังก์ชัน draw(image, detections) ที่วาดลงบนภาพ BGR"""
+    def render(source_path, output_path, detections):
+        image = cv2.imread(source_path)
+        if image is None:
+            raise ValueError(f"❌ ไม่พบภาพต้นฉบับ: {source_path}")
+        if draw is not None:
+            draw(image, detections)
+        cv2.imwrite(output_path, image)
+    return render
+
+
+@contextmanager
+def _render_lock(output_path: str):
+    """lock ต่อไฟล์ output นับจำนวนผู้ใช้ไว้ แล้วลบออกจาก _render_locks เมื่อคนสุดท้ายออก (dict ไม่โตตามจำนวนไฟล์)"""
+    with _render_locks_lock:
+        entry = _render_locks.get(output_path)
+        if entry is None:
+            entry = _render_locks[output_path] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _render_locks_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _render_locks[output_path]
+
+
+def render_pending(output_path: str) -> bool:
+    """
+    วาดไฟล์ที่ค้างไว้ (lazy) ถ้ามี คืน True ถ้าไฟล์พร้อม serve
+    เรียกพร้อมกันหลาย request ได้ จะ render แค่ครั้งเดียว
+    """
+    if os.path.exists(output_path):
+        return True
+    sidecar = pending_path(output_path)
+    if not os.path.exists(sidecar):
+        return False
+
+    with _render_lock(output_path):
+        if os.path.exists(output_path):
+            return True
+        with open(sidecar, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        renderer = _renderers.get(data["kind"])
+        if renderer is None:
+            print(f"⚠️ ไม่มี renderer สำหรับ {data['kind']}: {output_path}")
+            return False
+
+        root, ext = os.path.splitext(output_path)
+        tmp_output = f"{root}.rendering{ext}"  # นามสกุลเดิม เพื่อให้ cv2 / ffmpeg รู้ format
+        renderer(data["source"], tmp_output, data["detections"])
+        os.replace(tmp_output, output_path)
+        os.remove(sidecar)
+        if data["source"] == f"{output_path}{SOURCE_SUFFIX}":
+            os.remove(data["source"])
+        print(f"🎨 Rendered (lazy): {output_path}")
+        return True
+
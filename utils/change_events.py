@@ -0,0 +1,157 @@
+"""
+Change Events
+แจ้งเตือนเมื่อมีไฟล์ผลลัพธ์ใหม่ (sensor, san, water, shrimp, size, din) แทนการ poll โฟลเดอร์ทุก 5 วินาที
+- in-process: ผู้เขียนทุกตัวเรียก utils.result_index.index_record() อยู่แล้ว ดัชนีจึงส่ง event ต่อให้ ChangeBus
+- ไฟล์จาก process อื่น (เช่น auto_dose.py) ใช้ inotify ดูโฟลเดอร์ (Linux) ไฟล์ที่ยังไม่อยู่ในดัชนีจะถูก index
+  แล้วส่ง event เหมือนกัน ถ้าใช้ inotify ไม่ได้จะมีแค่ event ใน process
+ผู้รอ event (loop_build_and_push) ตื่นทันทีหลังเขียน และไม่ทำอะไรเลยถ้าไม่มีข้อมูลใหม่
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import threading
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class ChangeBus:
+    """
+    กระจาย event (result_type, pond) ไปยังผู้รอแต่ละราย publish เรียกจาก thread ไหนก็ได้
+    ผู้รอเลือก filter ตามบ่อได้ event ที่ไม่รู้บ่อ (pond=None) ส่งถึงทุกคน
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._subscribers = []  # Subscription
+        self.published = 0
+
+    def bind(self, loop=None):
+        self._loop = loop or asyncio.get_running_loop()
+
+    def subscribe(self, pond=None):
+        """คืน Subscription ที่ await wait() ได้ (ต้องเรียกใน event loop)"""
+        if self._loop is None:
+            self.bind()
+        subscription = Subscription(None if pond is None else str(pond))
+        self._subscribers.append(subscription)
+        return subscription
+
+    def publish(self, result_type: str, pond=None):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        self.published += 1
+        pond = None if pond is None else str(pond)
+        try:
+            loop.call_soon_threadsafe(self._dispatch, result_type, pond)
+        except RuntimeError:
+            pass  # loop ปิดไปแล้ว (ตอน shutdown)
+
+    def _dispatch(self, result_type: str, pond):
+        for subscription in self._subscribers:
+            if subscription.pond is None or pond is None or subscription.pond == pond:
+                subscription.pending.add((result_type, pond))
+                subscription.event.set()
+
+
+class Subscription:
+    def __init__(self, pond):
+        self.pond = pond
+        self.event = asyncio.Event()
+        self.pending = set()
+
+    async def wait(self, debounce: float = 0.0) -> set:
+        """
+        รอจนมี event แล้วรออีก debounce วินาทีเพื่อรวม event ที่ตามมาติด ๆ (เช่น ส่งหลายไฟล์ในครั้งเดียว)
+        :return: set ของ (result_type, pond) ที่เปลี่ยนระหว่างนั้น
+        """
+        await self.event.wait()
+        if debounce > 0:
+            await asyncio.sleep(debounce)
+        self.event.clear()
+        changed, self.pending = self.pending, set()
+        return changed
+
+
+class InotifyWatcher:
+    """
+    ดูไฟล์ *.json ใหม่ในโฟลเดอร์ (IN_CLOSE_WRITE / IN_MOVED_TO) ด้วย inotify ผ่าน ctypes ไม่ต้องมี dependency เพิ่ม
+    on_file(result_type, path) ถูกเรียกใน thread ของ watcher
+    """
+
+    def __init__(self, dirs: dict, on_file):
+        self.dirs = dirs
+        self.on_file = on_file
+        self._fd = None
+        self._watches = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> bool:
+        """คืน False ถ้าระบบไม่มี inotify (เช่น macOS / Windows)"""
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            return False
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            return False
+        fd = libc.inotify_init1(IN_NONBLOCK)
+        if fd < 0:
+            return False
+        for result_type, dir_path in self.dirs.items():
+            os.makedirs(dir_path, exist_ok=True)
+            wd = libc.inotify_add_watch(fd, os.fsencode(dir_path), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd >= 0:
+                self._watches[wd] = (result_type, dir_path)
+        self._fd = fd
+        self._thread = threading.Thread(target=self._run, name="inotify-results", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._fd], [], [], 1.0)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                wd, _, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + name_len].rstrip(b"\0")
+                offset += _EVENT_HEADER.size + name_len
+                name = os.fsdecode(name)
+                if wd in self._watches and name.endswith(".json"):
+                    result_type, dir_path = self._watches[wd]
+                    try:
+                        self.on_file(result_type, os.path.join(dir_path, name))
+                    except Exception as e:
+                        print(f"⚠️ inotify handler error ({name}): {e}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def read_json_file(path: str):
+    """อ่าน JSON ของไฟล์ที่ process อื่นเพิ่งเขียน (คืน None ถ้าอ่านไม่ได้ / ไม่ใช่ dict)"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return doc if isinstance(doc, dict) else None
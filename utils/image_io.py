@@ -0,0 +1,31 @@
+import os
+
+import cv2
+import numpy as np
+
+
+def decode_image(source):
+    """
+    แปลง input ของ analyzer ให้เป็นภาพ BGR (numpy) โดย decode เพียงครั้งเดียว
+    :param source: path ของไฟล์, bytes ของไฟล์ภาพ (jpg/png) หรือ numpy array ที่ decode แล้ว
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        image = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("❌ decode ภาพจาก bytes ไม่สำเร็จ")
+        return image
+    image = cv2.imread(os.fspath(source))
+    if image is None:
+        raise ValueError(f"❌ ไม่พบภาพที่ path: {source}")
+    return image
+
+
+def source_stem(source, name: str = None, default: str = "image") -> str:
+    """ชื่อไฟล์ (ไม่มีนามสกุล) สำหรับตั้งชื่อ output: ใช้ name ก่อน ถ้าไม่มีใช้ชื่อจาก path"""
+    if name:
+        return os.path.splitext(os.path.basename(name))[0]
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.splitext(os.path.basename(os.fspath(source)))[0]
+    return default
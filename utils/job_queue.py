@@ -0,0 +1,203 @@
+"""
+Job Queue
+คิวงานวิเคราะห์แบบ asynchronous สำหรับ POST /jobs
+- เก็บสถานะงานเป็นไฟล์ JSON ใน JOBS_DIR (อยู่บน Railway Volume) เพื่อไม่ให้งานหายตอน redeploy
+- จำกัดจำนวนงานที่รอในคิว (JOBS_MAX_QUEUED)
+- progress ของวิดีโอเขียนแยกเป็นไฟล์ <job_id>.progress.json ทำให้อัปเดตได้แม้รันใน process pool
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _write_json_atomic(path: str, data: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class JobProgress:
+    """
+    callback สำหรับรายงานจำนวนเฟรมที่ประมวลผลแล้ว: progress(frames_done, frames_total)
+    pickle ได้ จึงส่งเข้า process pool ไปพร้อมกับ analyze_video ได้
+    """
+
+    def __init__(self, progress_path: str, min_interval: float = 0.5):
+        self.progress_path = progress_path
+        self.min_interval = min_interval
+        self._last_write = 0.0
+
+    def __call__(self, frames_done: int, frames_total: int = None):
+        now = time.monotonic()
+        finished = frames_total is not None and frames_done >= frames_total
+        if not finished and now - self._last_write < self.min_interval:
+            return
+        self._last_write = now
+        try:
+            _write_json_atomic(self.progress_path, {
+                "frames_done": int(frames_done),
+                "frames_total": int(frames_total) if frames_total is not None else None,
+            })
+        except OSError:
+            pass
+
+
+class JobStore:
+    def __init__(self, jobs_dir: str, max_queued: int = 32):
+        self.jobs_dir = jobs_dir
+        self.max_queued = max_queued
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._queue = None
+
+    # ---------- paths ----------
+    def job_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def progress_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.progress.json")
+
+    def input_dir(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _queue_obj(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    # ---------- records ----------
+    def new_job_id(self) -> str:
+        return str(uuid.uuid4())
+
+    def save(self, job: dict):
+        job["updated_at"] = datetime.now().isoformat()
+        _write_json_atomic(self.job_path(job["id"]), job)
+
+    def load(self, job_id: str):
+        return _read_json(self.job_path(job_id))
+
+    def get(self, job_id: str):
+        """คืนสถานะงาน (รวม progress ของเฟรมล่าสุด) หรือ None ถ้าไม่พบ"""
+        job = self.load(job_id)
+        if job is None:
+            return None
+        frames = _read_json(self.progress_path(job_id))
+        if frames:
+            job.setdefault("progress", {}).update(frames)
+        return job
+
+    def update(self, job_id: str, **fields):
+        job = self.load(job_id)
+        if job is None:
+            return None
+        progress = fields.pop("progress", None)
+        job.update(fields)
+        if progress:
+            job.setdefault("progress", {}).update(progress)
+        self.save(job)
+        return job
+
+    def queued_count(self) -> int:
+        return self._queue_obj().qsize()
+
+    # ---------- queue ----------
+    def submit(self, job_id: str, items: list, options: dict = None) -> dict:
+        """
+        บันทึกงานใหม่ลงดิสก์แล้วเข้าคิว ถ้าคิวเต็มจะ raise JobQueueFull
+        options: ตัวเลือกของงาน (เช่น annotate) ที่ handler อ่านจาก job["options"]
+        """
+        if self.queued_count() >= self.max_queued:
+            raise JobQueueFull(f"job queue is full ({self.max_queued})")
+        job = {
+            "id": job_id,
+            "status": JOB_QUEUED,
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "items": items,
+            "options": options or {},
+            "progress": {
+                "files_done": 0,
+                "files_total": len(items),
+                "current_file": None,
+                "frames_done": 0,
+                "frames_total": None,
+            },
+            "results": [],
+            "error": None,
+        }
+        self.save(job)
+        self._queue_obj().put_nowait(job_id)
+        return job
+
+    def recover(self) -> int:
+        """
+        โหลดงานที่ค้างจากรอบก่อน (queued / running) กลับเข้าคิวตามเวลาที่สร้าง
+        งานที่ running ค้างไว้จะเริ่มใหม่ทั้งงาน
+        """
+        pending = []
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json") or name.endswith(".progress.json"):
+                continue
+            job = _read_json(os.path.join(self.jobs_dir, name))
+            if not job or job.get("status") not in (JOB_QUEUED, JOB_RUNNING):
+                continue
+            pending.append(job)
+
+        pending.sort(key=lambda j: j.get("created_at") or "")
+        for job in pending:
+            if job["status"] == JOB_RUNNING:
+                job["status"] = JOB_QUEUED
+                job["started_at"] = None
+                self.save(job)
+            self._queue_obj().put_nowait(job["id"])
+        if pending:
+            print(f"♻️ Recovered {len(pending)} pending job(s) from {self.jobs_dir}")
+        return len(pending)
+
+    async def worker(self, handler):
+        """
+        ดึงงานจากคิวทีละงานแล้วเรียก await handler(job) ซึ่งต้องคืน list ของผลลัพธ์
+        อ่าน / เขียนไฟล์สถานะงานใน thread เพื่อไม่ block event loop
+        """
+        queue = self._queue_obj()
+        while True:
+            job_id = await queue.get()
+            try:
+                job = await asyncio.to_thread(self.load, job_id)
+                if job is None or job.get("status") not in (JOB_QUEUED, JOB_RUNNING):
+                    continue
+                job = await asyncio.to_thread(self.update, job_id, status=JOB_RUNNING,
+                                              started_at=datetime.now().isoformat())
+                try:
+                    results = await handler(job)
+                except Exception as e:
+                    print(f"❌ Job {job_id} failed: {e}")
+                    await asyncio.to_thread(self.update, job_id, status=JOB_FAILED, error=str(e),
+                                            finished_at=datetime.now().isoformat())
+                else:
+                    await asyncio.to_thread(self.update, job_id, status=JOB_DONE, results=results,
+                                            finished_at=datetime.now().isoformat())
+            finally:
+                queue.task_done()
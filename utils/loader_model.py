@@ -14,6 +14,14 @@ MODEL_FILES = {
     "water": "water_class.pt" # โมเดลวิเคราะห์คุณภาพน้ำ
 }
 
+# task ของแต่ละโมเดล (ต้องระบุตอนโหลดไฟล์ที่ export แล้ว เช่น .onnx เพราะเดา task จากไฟล์ไม่ได้)
+MODEL_TASKS = {
+    "size": "pose",
+    "din": "detect",
+    "shrimp": "detect",
+    "water": "classify"
+}
+
 def get_model_path(model_key: str) -> str:
     """
     คืนค่า path เต็มของโมเดลที่อยู่ใน Railway Volume
@@ -0,0 +1,208 @@
+"""
+Model Export
+export โมเดล .pt เป็น ONNX / OpenVINO เพื่อใช้ inference บน CPU (Railway ไม่มี GPU)
+ไฟล์ที่ export แล้วเก็บไว้ข้าง ๆ .pt เช่น /data/Model/size.onnx, /data/Model/size_openvino_model/
+
+onnx_int8 คือ ONNX ที่ quantize เป็น INT8 ด้วย onnxruntime (ไฟล์ size.int8.onnx)
+- ถ้ามีโฟลเดอร์ภาพบ่อจริงสำหรับ calibration (QUANT_CALIB_DIR / --calib-dir) จะใช้ static quantization
+- ถ้าไม่มีจะใช้ dynamic quantization (quantize เฉพาะ weight)
+
+ตัวอย่าง:
+    python -m utils.model_export --backend onnx
+    python -m utils.model_export --backend openvino --models size water --force
+    python -m utils.model_export --backend onnx_int8 --models size water --calib-dir /data/calib
+"""
+
+import argparse
+import ast
+import glob
+import os
+import re
+
+import cv2
+import numpy as np
+
+from utils.loader_model import MODEL_FILES, MODEL_TASKS
+
+BACKENDS = ("torch", "onnx", "openvino", "onnx_int8")
+
+# โฟลเดอร์ภาพตัวแทนของบ่อ (jpg/png) สำหรับ static INT8 calibration
+QUANT_CALIB_DIR = os.environ.get("QUANT_CALIB_DIR", "")
+QUANT_CALIB_MAX_IMAGES = int(os.environ.get("QUANT_CALIB_MAX_IMAGES", "64"))
+
+
+def exported_path(pt_path: str, backend: str) -> str:
+    """path ของไฟล์ที่ export แล้ว (ตามรูปแบบชื่อที่ ultralytics ใช้)"""
+    stem = os.path.splitext(pt_path)[0]
+    if backend == "onnx":
+        return f"{stem}.onnx"
+    if backend == "openvino":
+        return f"{stem}_openvino_model"
+    if backend == "onnx_int8":
+        return f"{stem}.int8.onnx"
+    if backend == "torch":
+        return pt_path
+    raise ValueError(f"❌ Unknown backend: {backend}. ใช้ได้แค่ {list(BACKENDS)}")
+
+
+def is_up_to_date(pt_path: str, artifact_path: str) -> bool:
+    """ไฟล์ export ยังใช้ได้ถ้ามีอยู่และใหม่กว่า .pt"""
+    if not os.path.exists(artifact_path):
+        return False
+    return os.path.getmtime(artifact_path) >= os.path.getmtime(pt_path)
+
+
+# ===============================
+# INT8 quantization
+# ===============================
+def _onnx_metadata(model) -> dict:
+    return {p.key: p.value for p in model.metadata_props}
+
+
+def _calibration_input(image, task: str, imgsz):
+    """เตรียมภาพให้เหมือน preprocess ของ ultralytics: detect/pose = letterbox, classify = resize + center crop"""
+    h, w = image.shape[:2]
+    th, tw = imgsz
+    if task == "classify":
+        scale = max(th / h, tw / w)
+        resized = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_LINEAR)
+        top, left = (resized.shape[0] - th) // 2, (resized.shape[1] - tw) // 2
+        canvas = resized[top:top + th, left:left + tw]
+    else:
+        scale = min(th / h, tw / w)
+        nh, nw = round(h * scale), round(w * scale)
+        canvas = np.full((th, tw, 3), 114, dtype=np.uint8)
+        top, left = (th - nh) // 2, (tw - nw) // 2
+        canvas[top:top + nh, left:left + nw] = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    blob = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0  # BGR -> RGB, HWC -> CHW
+    return np.ascontiguousarray(blob[None])
+
+
+def _sensitive_nodes(model) -> list:
+    """
+    node ที่ไม่ควร quantize: head ตัวสุดท้าย (Detect / Pose / Classify) และ attention (C2PSA)
+    (ทดลองกับโมเดลสีน้ำแล้ว การเก็บส่วนนี้ไว้เป็น FP32 ทำให้ top-1 drift น้อยลง)
+    """
+    pattern = re.compile(r"^/model\.(\d+)/")
+    indexes = [int(m.group(1)) for m in (pattern.match(n.name) for n in model.graph.node) if m]
+    head = f"/model.{max(indexes)}/" if indexes else None
+    return [n.name for n in model.graph.node
+            if (head and n.name.startswith(head)) or "attn" in n.name]
+
+
+def _calibration_images(calib_dir: str, max_images: int):
+    paths = []
+    for ext in ("jpg", "jpeg", "png"):
+        paths += glob.glob(os.path.join(calib_dir, "**", f"*.{ext}"), recursive=True)
+    return sorted(paths)[:max_images]
+
+
+def quantize_onnx(fp32_path: str, int8_path: str, task: str, calib_dir: str = None,
+                  max_images: int = QUANT_CALIB_MAX_IMAGES) -> str:
+    """
+    quantize ไฟล์ ONNX (FP32) เป็น INT8
+    คืนชนิดที่ใช้จริง: "static" (มีภาพ calibration) หรือ "dynamic"
+    """
+    import onnx
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+
+    fp32_model = onnx.load(fp32_path)
+    metadata = _onnx_metadata(fp32_model)
+    paths = _calibration_images(calib_dir, max_images) if calib_dir and os.path.isdir(calib_dir) else []
+    exclude = _sensitive_nodes(fp32_model)
+
+    if paths:
+        imgsz = ast.literal_eval(metadata.get("imgsz", "[640, 640]"))
+        input_name = fp32_model.graph.input[0].name
+
+        class _Reader(CalibrationDataReader):
+            def __init__(self):
+                self._paths = iter(paths)
+
+            def get_next(self):
+                for path in self._paths:
+                    image = cv2.imread(path)
+                    if image is not None:
+                        return {input_name: _calibration_input(image, task, imgsz)}
+                return None
+
+        print(f"📏 Static INT8 calibration ด้วยภาพ {len(paths)} ภาพจาก {calib_dir}")
+        if len(paths) < 32:
+            print("⚠️ ภาพ calibration น้อยเกินไป ค่า scale อาจไม่ครอบคลุม ควรดู benchmarks/quant_parity.py ก่อนใช้")
+        quantize_static(fp32_path, int8_path, _Reader(), quant_format=QuantFormat.QDQ,
+                        per_channel=True, activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                        nodes_to_exclude=exclude)
+        mode = "static"
+    else:
+        print("📏 ไม่มีภาพ calibration -> ใช้ dynamic INT8 quantization")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QUInt8, nodes_to_exclude=exclude)
+        mode = "dynamic"
+
+    # ultralytics อ่าน names / stride / imgsz / task จาก metadata ของไฟล์ onnx จึงต้องคัดลอกไปด้วย
+    int8_model = onnx.load(int8_path)
+    existing = _onnx_metadata(int8_model)
+    for key, value in {**metadata, "quantization": mode}.items():
+        if key not in existing:
+            prop = int8_model.metadata_props.add()
+            prop.key, prop.value = key, value
+    onnx.save(int8_model, int8_path)
+    return mode
+
+
+def export_model(model_key: str, backend: str, force: bool = False, imgsz: int = None,
+                 calib_dir: str = None) -> str:
+    """
+    export โมเดลตาม key เป็น backend ที่ต้องการ ถ้ามีไฟล์ที่ใหม่กว่า .pt อยู่แล้วจะใช้ของเดิม
+    :return: path ของไฟล์ / โฟลเดอร์ที่ export แล้ว
+    """
+    from utils.model_registry import resolve_model_path
+
+    pt_path = resolve_model_path(model_key)
+    if backend == "torch":
+        return pt_path
+
+    target = exported_path(pt_path, backend)
+    if not force and is_up_to_date(pt_path, target):
+        return target
+
+    if backend == "onnx_int8":
+        fp32_path = export_model(model_key, "onnx", force=force, imgsz=imgsz)
+        print(f"⚙️ Quantizing model '{model_key}' -> INT8 ({target})")
+        mode = quantize_onnx(fp32_path, target, MODEL_TASKS[model_key], calib_dir or QUANT_CALIB_DIR)
+        print(f"✅ Quantized model '{model_key}' ({mode}): {target}")
+        return target
+
+    from ultralytics import YOLO
+
+    print(f"⚙️ Exporting model '{model_key}' -> {backend} ({target})")
+    options = {"format": backend, "dynamic": True}  # dynamic batch สำหรับ batch inference
+    if imgsz:
+        options["imgsz"] = imgsz
+    exported = YOLO(pt_path).export(**options)
+    exported = str(exported) if exported else target
+    if os.path.abspath(exported) != os.path.abspath(target) and os.path.exists(exported):
+        os.replace(exported, target)
+    print(f"✅ Exported model '{model_key}': {target}")
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export YOLO models to ONNX / OpenVINO")
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="onnx")
+    parser.add_argument("--models", nargs="+", default=list(MODEL_FILES.keys()))
+    parser.add_argument("--imgsz", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="export ใหม่แม้มีไฟล์เดิมอยู่แล้ว")
+    parser.add_argument("--calib-dir", default=None, help="โฟลเดอร์ภาพบ่อสำหรับ static INT8 (onnx_int8)")
+    args = parser.parse_args()
+
+    for model_key in args.models:
+        try:
+            export_model(model_key, args.backend, force=args.force, imgsz=args.imgsz,
+                         calib_dir=args.calib_dir)
+        except Exception as e:
+            print(f"⚠️ Export '{model_key}' -> {args.backend} failed: {e}")
+
+
+if __name__ == "__main__":
+    main()
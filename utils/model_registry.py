@@ -0,0 +1,261 @@
+"""
+Model Registry
+โหลดโมเดล YOLO แบบ lazy (โหลดตอนใช้ครั้งแรก) หรือ warm-up เบื้องหลังหลัง startup
+แทนการเรียก YOLO(model_path) ตอน import ในแต่ละ analyzer
+รองรับ backend torch / onnx / openvino / onnx_int8 (ดู utils/model_export.py)
+"""
+
+import os
+import threading
+import time
+
+from utils.loader_model import MODEL_FILES, MODEL_TASKS, get_model_path
+from utils.model_export import BACKENDS, export_model, exported_path, is_up_to_date
+
+# ===============================
+# CONFIG
+# ===============================
+# โฟลเดอร์สำรองในโปรเจกต์ (ใช้ตอนรัน local ที่ไม่มี /data/Model)
+LOCAL_MODEL_DIR = os.environ.get("LOCAL_MODEL_DIR", "Model")
+# backend สำหรับ inference: torch (.pt), onnx (onnxruntime) หรือ openvino
+# กำหนดรายโมเดลได้ด้วย MODEL_BACKEND_<KEY> เช่น MODEL_BACKEND_WATER=onnx
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "torch")
+# export ไฟล์ onnx / openvino ให้อัตโนมัติตอนโหลดถ้ายังไม่มี (ปิดได้ถ้าจะ export ไว้ก่อน deploy)
+MODEL_AUTO_EXPORT = os.environ.get("MODEL_AUTO_EXPORT", "1") == "1"
+# profile ของ inference: fp32 ใช้ backend ตามด้านบน, int8 ใช้ ONNX ที่ quantize แล้ว (onnx_int8)
+INFERENCE_PROFILES = {"fp32": None, "int8": "onnx_int8"}
+# model_version() ถูกเรียกทุก upload (cache key) จึงจำผลไว้ แล้ว stat ไฟล์ใหม่ทุก MODEL_VERSION_TTL วินาที
+MODEL_VERSION_TTL = float(os.environ.get("MODEL_VERSION_TTL", "30"))
+
+_models = {}
+_model_stats = {}
+_registry_lock = threading.Lock()
+_key_locks = {}
+_resolved_paths = {}  # model_key -> path ที่หาเจอ (get_model_path พิมพ์ log + stat ทุกครั้ง)
+_versions = {}        # (model_key, profile) -> (version, เวลาที่ตรวจ)
+
+
+def _current_rss_bytes():
+    """คืนค่า resident memory ของ process ปัจจุบัน (bytes)"""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:
+        return None
+
+
+def resolve_model_path(model_key: str) -> str:
+    """
+    หา path ของโมเดลตามลำดับ:
+    1) ENV MODEL_<KEY> เช่น MODEL_SIZE, MODEL_WATER
+    2) get_model_path() ใน Railway Volume (/data/Model)
+    3) โฟลเดอร์ Model/ ในโปรเจกต์
+    """
+    if model_key not in MODEL_FILES:
+        raise ValueError(
+            f"❌ Unknown model key: {model_key}. "
+            f"ใช้ได้แค่ {list(MODEL_FILES.keys())}"
+        )
+
+    env_path = os.environ.get(f"MODEL_{model_key.upper()}")
+    if env_path:
+        return env_path
+
+    path = _resolved_paths.get(model_key)
+    if path is None:
+        try:
+            path = get_model_path(model_key)
+        except FileNotFoundError:
+            path = os.path.join(LOCAL_MODEL_DIR, MODEL_FILES[model_key])
+        _resolved_paths[model_key] = path
+    return path
+
+
+def invalidate_model_versions():
+    """ล้าง path / version ที่จำไว้ (เรียกเมื่อโหลดโมเดลใหม่เข้า registry)"""
+    _resolved_paths.clear()
+    _versions.clear()
+
+
+def _lock_for(model_key: str) -> threading.Lock:
+    with _registry_lock:
+        lock = _key_locks.get(model_key)
+        if lock is None:
+            lock = threading.Lock()
+            _key_locks[model_key] = lock
+        return lock
+
+
+def model_backend(model_key: str) -> str:
+    """backend ของโมเดล: ENV MODEL_BACKEND_<KEY> ก่อน ถ้าไม่มีใช้ MODEL_BACKEND (ค่าเริ่มต้น torch)"""
+    backend = os.environ.get(f"MODEL_BACKEND_{model_key.upper()}") or MODEL_BACKEND
+    backend = backend.strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"❌ Unknown backend: {backend}. ใช้ได้แค่ {list(BACKENDS)}")
+    return backend
+
+
+def resolve_profile(model_key: str, profile: str = None, pond_number=None) -> str:
+    """
+    เลือก profile (fp32 / int8) ตามลำดับ:
+    1) ค่าที่ส่งมา
+    2) ENV <KEY>_PROFILE_POND_<n> เช่น SIZE_PROFILE_POND_3=int8 (เลือกรายบ่อ)
+    3) ENV <KEY>_PROFILE เช่น WATER_PROFILE=int8
+    """
+    if not profile and pond_number is not None:
+        profile = os.environ.get(f"{model_key.upper()}_PROFILE_POND_{pond_number}")
+    profile = (profile or os.environ.get(f"{model_key.upper()}_PROFILE") or "fp32").strip().lower()
+    if profile not in INFERENCE_PROFILES:
+        raise ValueError(f"❌ Unknown profile: {profile}. ใช้ได้แค่ {list(INFERENCE_PROFILES)}")
+    return profile
+
+
+def get_profile_model(model_key: str, profile: str = None):
+    """โมเดลตาม profile: fp32 = backend ปกติ, int8 = onnx_int8"""
+    return get_model(model_key, INFERENCE_PROFILES[resolve_profile(model_key, profile)])
+
+
+def group_by_profile(model_key: str, n: int, profile=None, pond_numbers=None) -> dict:
+    """แบ่ง index ของภาพตาม profile (เลือกได้รายภาพ / รายบ่อ) -> {profile: [index, ...]}"""
+    profiles = profile if isinstance(profile, (list, tuple)) else [profile] * n
+    ponds = pond_numbers if isinstance(pond_numbers, (list, tuple)) else [pond_numbers] * n
+    groups = {}
+    for idx in range(n):
+        groups.setdefault(resolve_profile(model_key, profiles[idx], ponds[idx]), []).append(idx)
+    return groups
+
+
+def model_version(model_key: str, profile: str = None) -> str:
+    """
+    เวอร์ชันของโมเดลที่จะถูกใช้ (backend + ชื่อ / ขนาด / เวลาแก้ไขของไฟล์ .pt) สำหรับใช้เป็น cache key
+    ไม่ต้องโหลดโมเดล ถ้าเปลี่ยนไฟล์โมเดลหรือ backend ค่านี้จะเปลี่ยนตาม (ภายใน MODEL_VERSION_TTL วินาที)
+    """
+    profile = resolve_profile(model_key, profile)
+    backend = INFERENCE_PROFILES[profile] or model_backend(model_key)
+    cached = _versions.get((model_key, profile))
+    if cached is not None and cached[0].startswith(f"{backend}:") and \
+            time.monotonic() - cached[1] < MODEL_VERSION_TTL:
+        return cached[0]
+
+    pt_path = resolve_model_path(model_key)
+    try:
+        st = os.stat(pt_path)
+        version = f"{backend}:{os.path.basename(pt_path)}:{st.st_size}:{int(st.st_mtime)}"
+    except OSError:
+        version = f"{backend}:{os.path.basename(pt_path)}:missing"
+    _versions[(model_key, profile)] = (version, time.monotonic())
+    return version
+
+
+def _cache_key(model_key: str, backend: str) -> str:
+    return model_key if backend == "torch" else f"{model_key}:{backend}"
+
+
+def _load(model_key: str, backend: str):
+    """โหลดโมเดลตาม backend: torch ใช้ .pt ตรง ๆ ส่วน onnx / openvino จะ export ให้ถ้ายังไม่มีไฟล์"""
+    from ultralytics import YOLO
+
+    pt_path = resolve_model_path(model_key)
+    if backend == "torch":
+        return pt_path, YOLO(pt_path)
+
+    model_path = exported_path(pt_path, backend)
+    if not is_up_to_date(pt_path, model_path):
+        if not MODEL_AUTO_EXPORT:
+            raise FileNotFoundError(f"ไม่พบไฟล์ {backend} ของโมเดล '{model_key}': {model_path}")
+        model_path = export_model(model_key, backend)
+    return model_path, YOLO(model_path, task=MODEL_TASKS[model_key])
+
+
+def get_model(model_key: str, backend: str = None):
+    """
+    คืนโมเดลจาก registry ถ้ายังไม่เคยโหลดจะโหลดตอนนี้ (thread-safe)
+    ถ้าโหลด backend onnx / openvino ไม่สำเร็จ จะ fallback ไปใช้ .pt (torch) แทน
+    """
+    backend = backend or model_backend(model_key)
+    cache_key = _cache_key(model_key, backend)
+    model = _models.get(cache_key)
+    if model is not None:
+        return model
+
+    with _lock_for(cache_key):
+        model = _models.get(cache_key)
+        if model is not None:
+            return model
+
+        _model_stats[cache_key] = {"backend": backend, "status": "loading"}
+        rss_before = _current_rss_bytes()
+        started = time.perf_counter()
+        try:
+            model_path, model = _load(model_key, backend)
+        except Exception as e:
+            _model_stats[cache_key] = {"backend": backend, "status": "error", "error": str(e)}
+            if backend == "torch":
+                raise
+            print(f"⚠️ Load model '{model_key}' ({backend}) failed: {e} -> fallback to torch")
+            model = get_model(model_key, "torch")
+            _models[cache_key] = model  # ไม่ต้องลอง export ซ้ำทุกครั้งที่เรียก
+            _model_stats[cache_key]["status"] = "fallback_torch"
+            return model
+        load_seconds = time.perf_counter() - started
+        rss_after = _current_rss_bytes()
+
+        rss_delta = None
+        if rss_before is not None and rss_after is not None:
+            rss_delta = max(rss_after - rss_before, 0)
+
+        _models[cache_key] = model
+        invalidate_model_versions()
+        _model_stats[cache_key] = {
+            "path": model_path,
+            "backend": backend,
+            "status": "loaded",
+            "load_seconds": round(load_seconds, 3),
+            "rss_delta_mb": round(rss_delta / (1024 * 1024), 1) if rss_delta is not None else None,
+            "loaded_at": time.time(),
+        }
+        print(f"✅ Loaded model '{model_key}' ({backend}) from {model_path} "
+              f"in {load_seconds:.2f}s (+{_model_stats[cache_key]['rss_delta_mb']} MB)")
+        return model
+
+
+def is_loaded(model_key: str, backend: str = None) -> bool:
+    return _cache_key(model_key, backend or model_backend(model_key)) in _models
+
+
+def warm_up(model_keys=None):
+    """โหลดโมเดลทั้งหมด (หรือเฉพาะที่ระบุ) ทีละตัว ถ้าตัวไหนพังจะข้ามไป"""
+    for key in model_keys or list(MODEL_FILES.keys()):
+        try:
+            get_model(key)
+        except Exception as e:
+            print(f"⚠️ Warm-up model '{key}' failed: {e}")
+
+
+def start_background_warm_up(model_keys=None) -> threading.Thread:
+    """warm-up โมเดลใน daemon thread เพื่อไม่ให้ block startup ของ server"""
+    thread = threading.Thread(target=warm_up, args=(model_keys,),
+                              name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def model_stats() -> dict:
+    """สถานะโมเดลทุกตัว: โหลดแล้วหรือยัง, เวลาโหลด, memory ที่เพิ่มขึ้น"""
+    stats = {}
+    for key in MODEL_FILES:
+        entries = {k: dict(v) for k, v in _model_stats.items() if k == key or k.startswith(f"{key}:")}
+        stats.update(entries or {key: {"backend": model_backend(key), "status": "not_loaded"}})
+    rss = _current_rss_bytes()
+    return {
+        "models": stats,
+        "process_rss_mb": round(rss / (1024 * 1024), 1) if rss is not None else None,
+        "pid": os.getpid(),
+    }
@@ -0,0 +1,142 @@
+"""
+Pipeline helpers
+ต่อ stage ที่ทำงานใน thread แยกกันด้วย bounded queue (เช่น decode -> infer/track -> encode)
+และจับเวลาที่แต่ละ stage ทำงานจริง เพื่อดูว่า stage ไหนเป็นคอขวด
+"""
+
+import queue
+import threading
+import time
+
+_END = object()
+
+
+class StageStats:
+    """เวลาทำงานจริง (busy) และเวลารอ queue ของแต่ละ stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def to_dict(self, wall_seconds: float) -> dict:
+        return {
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "wait_seconds": round(self.wait_seconds, 3),
+            "busy_percent": round(100.0 * self.busy_seconds / wall_seconds, 1) if wall_seconds > 0 else 0.0,
+        }
+
+
+def summarize_stages(stages, wall_seconds: float) -> dict:
+    report = {s.name: s.to_dict(wall_seconds) for s in stages}
+    bottleneck = max(stages, key=lambda s: s.busy_seconds).name if stages else None
+    return {"wall_seconds": round(wall_seconds, 3), "bottleneck": bottleneck, "stages": report}
+
+
+def format_stage_report(summary: dict) -> str:
+    parts = [f"{name} {info['busy_percent']:.0f}%" for name, info in summary["stages"].items()]
+    return f"⏱️ pipeline {summary['wall_seconds']:.2f}s | busy: " + ", ".join(parts) + \
+           f" | bottleneck: {summary['bottleneck']}"
+
+
+class ThreadedSource:
+    """
+    อ่าน iterable ใน thread แยกแล้วส่งต่อผ่าน bounded queue
+    transform(item) คืน None เพื่อข้าม item นั้นได้ (เช่น ข้ามเฟรมตาม stride)
+    """
+
+    def __init__(self, iterable, stats: StageStats, maxsize: int = 8, transform=None):
+        self._iterable = iterable
+        self._transform = transform
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._stop = threading.Event()
+        self.stats = stats
+        self._thread = threading.Thread(target=self._run, name=f"stage-{stats.name}", daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        started = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.stats.wait_seconds += time.perf_counter() - started
+
+    def _run(self):
+        try:
+            iterator = iter(self._iterable)
+            while not self._stop.is_set():
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                if self._transform is not None:
+                    item = self._transform(item)
+                self.stats.busy_seconds += time.perf_counter() - started
+                if item is None:
+                    continue
+                self.stats.items += 1
+                self._put(item)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._put(_END)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                break
+            yield item
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+
+class ThreadedSink:
+    """รับ item ผ่าน bounded queue แล้วเรียก func(item) ใน thread แยก (เช่น encode วิดีโอ)"""
+
+    def __init__(self, func, stats: StageStats, maxsize: int = 8):
+        self._func = func
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self.stats = stats
+        self._thread = threading.Thread(target=self._run, name=f"stage-{stats.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                break
+            if self._error is not None:
+                continue  # ทิ้ง item ที่เหลือหลัง error แต่ยังดึงออกจาก queue เพื่อไม่ให้ผู้ส่งค้าง
+            started = time.perf_counter()
+            try:
+                self._func(item)
+            except Exception as e:
+                self._error = e
+            self.stats.busy_seconds += time.perf_counter() - started
+            self.stats.items += 1
+
+    def put(self, item):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(item)
+
+    def close(self):
+        """รอจน item ในคิวถูกประมวลผลหมด แล้ว raise error (ถ้ามี)"""
+        self._queue.put(_END)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,230 @@
+"""
+Pond Status Engine
+สถานะของทุกบ่อในหน่วยความจำ (ตารางต่อบ่อ) อัปเดตทีละช่องเมื่อมีผลใหม่เข้า result index
+แล้ว materialize เอกสาร 2 ชนิดต่อบ่อ:
+- status      = sensor + san (แร่ธาตุ) + สีน้ำ + กุ้งลอย  (ส่ง APP_STATUS_URL)
+- shrimp_size = ขนาดกุ้ง + วิดีโอกุ้งดิน                  (ส่ง APP_SIZE_URL)
+change event หนึ่งครั้ง (result_type, pond) = indexed lookup 1 ครั้ง + build เฉพาะเอกสารของบ่อนั้นที่ได้รับผลกระทบ
+ต้นทุนต่อ event จึงไม่ขึ้นกับจำนวนบ่อ ส่วนหน่วยความจำโตเป็นเส้นตรง (ผลล่าสุด 6 ชนิด + เอกสาร 2 ชิ้นต่อบ่อ)
+เอกสารเก็บเป็น bytes ที่ serialize แล้ว + strong ETag เปลี่ยนเฉพาะเมื่อ signature เปลี่ยน
+GET /ponds/{id}/status จึงตอบจากหน่วยความจำได้เลย (หรือ 304 ถ้า If-None-Match ตรง)
+
+benchmark: python -m benchmarks.pond_scaling
+"""
+
+import hashlib
+import json
+import threading
+import time
+
+from utils.result_index import latest_record
+
+STATUS_SOURCE_TYPES = ("sensor", "san", "water", "shrimp")
+SIZE_SOURCE_TYPES = ("size", "din")
+SOURCE_TYPES = STATUS_SOURCE_TYPES + SIZE_SOURCE_TYPES
+SIGNATURE_IGNORE_KEYS = ("timestamp", "pondId")
+
+
+def payload_signature(payload: dict, ignore_keys: tuple[str, ...] = ()) -> str:
+    filtered = {k: payload[k] for k in payload if k not in ignore_keys}
+    return json.dumps(filtered, sort_keys=True, ensure_ascii=False)
+
+
+def _pick_url_maybe_list(v):
+    if isinstance(v, list):
+        return v[0] if v else None
+    return v
+
+
+def _extract_size_from_json(size_json: dict):
+    """ค่าเฉลี่ยความยาว / น้ำหนักจาก JSON ผลวัดขนาด (ใช้ค่าที่ save_json_result เก็บไว้ ไม่ต้อง parse ข้อความ)"""
+    result = size_json.get("result") or {}
+    if "avg_weight_g" in result:
+        return result.get("avg_length_cm"), result.get("avg_weight_g")
+
+    sc = size_json.get("shrimp_size") or {}
+    return sc.get("length_cm"), sc.get("weight_avg_g")
+
+
+def build_pond_status(pond_id, data: dict, timestamp: str) -> dict:
+    sensor_d = data.get("sensor")
+    san_d    = data.get("san")
+    water_d  = data.get("water")
+    shrimp_d = data.get("shrimp")
+
+    sensor_part = {"temperature": None, "ph": None, "do": None}
+    if sensor_d:
+        sensor_part = {
+            "temperature": sensor_d.get("temperature"),
+            "ph": sensor_d.get("ph"),
+            "do": sensor_d.get("do"),
+        }
+
+    minerals = {"Mineral_1": 0.0, "Mineral_2": 0.0, "Mineral_3": 0.0, "Mineral_4": 0.0}
+    if san_d:
+        arr = san_d.get("remaining_g") or []
+        for i in range(4):
+            minerals[f"Mineral_{i+1}"] = float(arr[i]) if i < len(arr) else 0.0
+
+    water_image = None
+    water_color = "unknown"
+    if water_d:
+        water_image = _pick_url_maybe_list(water_d.get("output_image"))
+        water_color = (water_d.get("text_content") or "").strip() or "unknown"
+
+    shrimp_float_image = None
+    if shrimp_d:
+        shrimp_float_image = _pick_url_maybe_list(shrimp_d.get("output_image"))
+
+    return {
+        "pondId": str(pond_id) if pond_id is not None else None,
+        "timestamp": timestamp,
+        "DO": sensor_part["do"],
+        "PH": sensor_part["ph"],
+        "Temp": sensor_part["temperature"],
+        "ColorWater": water_color,
+        "Mineral_1": minerals["Mineral_1"],
+        "Mineral_2": minerals["Mineral_2"],
+        "Mineral_3": minerals["Mineral_3"],
+        "Mineral_4": minerals["Mineral_4"],
+        "PicColorWater": water_image,
+        "PicKungOnWater": shrimp_float_image
+    }
+
+
+def build_shrimp_size(pond_id, data: dict, timestamp: str) -> dict:
+    size_d = data.get("size")
+    din_d  = data.get("din")
+
+    size_image = None
+    raw_image = None
+    length_cm, weight_g = None, None
+    if size_d:
+        size_image = _pick_url_maybe_list(size_d.get("output_image"))
+        raw_image = size_d.get("raw_input_image")
+        length_cm, weight_g = _extract_size_from_json(size_d)
+
+    video_url = None
+    if din_d:
+        video_url = din_d.get("output_video")
+
+    return {
+        "pondId": pond_id,
+        "timestamp": timestamp,
+        "Size_CM": length_cm,
+        "Size_gram": weight_g,
+        "SizePic": size_image,
+        "PicFood": raw_image or size_image,
+        "PicKungDinn": video_url
+    }
+
+
+def _pond_value(pond: str):
+    """pond ในดัชนีเป็น text: "1" -> 1 ให้ pondId ในเอกสารเหมือนเดิม"""
+    return int(pond) if pond.isdigit() else pond
+
+
+class PondState:
+    """ผลล่าสุดของแต่ละชนิด + เอกสารที่ build แล้วของบ่อหนึ่งบ่อ"""
+
+    __slots__ = ("pond", "data", "paths", "bodies", "signatures", "updated_at")
+
+    def __init__(self, pond: str):
+        self.pond = pond
+        self.data = {}        # result_type -> doc ล่าสุด
+        self.paths = {}       # result_type -> path ของ doc นั้น
+        self.bodies = {}      # "status" / "size" -> (JSON bytes, ETag) ของเอกสารที่ publish ล่าสุด
+        self.signatures = {}  # "status" / "size" -> signature ของเอกสารที่ publish ไปแล้ว
+        self.updated_at = None
+
+
+class PondStatusEngine:
+    """
+    on_publish(kind, pond, doc) ถูกเรียกเมื่อเอกสารของบ่อเปลี่ยนจริง (signature ใหม่) เช่น เขียนไฟล์ / push ไปแอป
+    ponds = จำกัดเฉพาะบ่อเหล่านี้ (None = ทุกบ่อที่มีข้อมูล)
+    """
+
+    def __init__(self, timestamp_fn, on_publish=None, ponds=None, lookup=latest_record):
+        self.timestamp_fn = timestamp_fn
+        self.on_publish = on_publish
+        self.ponds = None if ponds is None else {str(p) for p in ponds}
+        self.lookup = lookup
+        self.states = {}
+        self._lock = threading.Lock()
+        self.counters = {"events": 0, "lookups": 0, "builds": 0, "published": 0}
+        self.build_seconds = 0.0
+
+    def _state(self, pond: str):
+        state = self.states.get(pond)
+        if state is None:
+            state = self.states[pond] = PondState(pond)
+        return state
+
+    def load(self, ponds):
+        """build สถานะเริ่มต้นของบ่อที่มีข้อมูลอยู่แล้ว (ตอน startup)"""
+        self.apply({(result_type, str(pond)) for pond in ponds for result_type in SOURCE_TYPES})
+
+    def apply(self, changes):
+        """
+        changes = set ของ (result_type, pond) จาก change event
+        event ที่ไม่รู้บ่อ (pond=None) ไม่มีผลกับเอกสารของบ่อใด จึงข้าม
+        """
+        by_pond = {}
+        for result_type, pond in changes:
+            if pond is None or result_type not in SOURCE_TYPES:
+                continue
+            if self.ponds is not None and pond not in self.ponds:
+                continue
+            by_pond.setdefault(pond, set()).add(result_type)
+        with self._lock:
+            self.counters["events"] += len(changes)
+            for pond, result_types in by_pond.items():
+                self._refresh(pond, result_types)
+
+    def _refresh(self, pond: str, result_types):
+        state = self._state(pond)
+        dirty = set()
+        for result_type in result_types:
+            path, doc = self.lookup(result_type, pond)
+            self.counters["lookups"] += 1
+            if path is None or path == state.paths.get(result_type):
+                continue
+            state.paths[result_type] = path
+            state.data[result_type] = doc
+            dirty.add("status" if result_type in STATUS_SOURCE_TYPES else "size")
+        if not dirty:
+            return
+
+        started = time.perf_counter()
+        timestamp = self.timestamp_fn()
+        pond_id = _pond_value(pond)
+        for kind in sorted(dirty):
+            builder = build_pond_status if kind == "status" else build_shrimp_size
+            doc = builder(pond_id, state.data, timestamp)
+            self.counters["builds"] += 1
+            signature = payload_signature(doc, SIGNATURE_IGNORE_KEYS)
+            if signature == state.signatures.get(kind):
+                continue
+            state.signatures[kind] = signature
+            body = json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            state.bodies[kind] = (body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+            self.counters["published"] += 1
+            if self.on_publish is not None:
+                self.on_publish(kind, pond_id, doc)
+        state.updated_at = time.time()
+        self.build_seconds += time.perf_counter() - started
+
+    def body(self, kind: str, pond_id):
+        """(JSON bytes, ETag) ของเอกสารล่าสุด หรือ None (อ่านอย่างเดียว ไม่ต้อง lock: tuple ถูกแทนที่ทั้งก้อน)"""
+        state = self.states.get(str(pond_id))
+        return None if state is None else state.bodies.get(kind)
+
+    def stats(self) -> dict:
+        with self._lock:
+            builds = self.counters["builds"]
+            return {
+                "ponds": len(self.states),
+                "pond_filter": sorted(self.ponds) if self.ponds is not None else None,
+                **self.counters,
+                "avg_build_ms": round(1000 * self.build_seconds / builds, 3) if builds else None,
+            }
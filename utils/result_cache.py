@@ -0,0 +1,109 @@
+"""
+Result Cache
+แคชผลวิเคราะห์ตาม SHA-256 ของไฟล์ที่อัปโหลด + เวอร์ชันโมเดล + พารามิเตอร์การวิเคราะห์
+Raspberry Pi ส่งไฟล์เดิมซ้ำเมื่อเน็ตหลุด ถ้าเจอไฟล์เดิมจะคืน JSON ของ save_json_result เดิมโดยไม่รันโมเดลอีก
+- แต่ละ entry เป็นไฟล์ <key>.json ใน cache_dir (เก็บสำเนา JSON ผลลัพธ์ไว้ด้วย)
+- จำกัดขนาดรวมบนดิสก์ (max_bytes) ลบ entry ที่ไม่ได้ใช้นานที่สุดก่อน (LRU ตาม mtime)
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def make_cache_key(**parts) -> str:
+    """สร้าง key จากส่วนประกอบทั้งหมด (sha256 ของไฟล์, model version, พารามิเตอร์)"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> ขนาดไฟล์ (เรียงจากใช้ล่าสุดน้อยที่สุด -> มากที่สุด)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-len(".json")], st.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._bytes += size
+
+    def get(self, key: str):
+        """คืน entry (dict) ถ้ามีในแคช พร้อมนับ hit / miss"""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                os.utime(path)  # mtime = เวลาใช้ล่าสุด (ใช้เรียง LRU ตอนโหลดใหม่)
+            except (OSError, ValueError):
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: dict):
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            path = self._path(key)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._bytes -= self._index.pop(key, 0)
+            self._index[key] = len(data)
+            self._bytes += len(data)
+            self._evict()
+
+    def _drop(self, key: str):
+        self._bytes -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            oldest = next(iter(self._index))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
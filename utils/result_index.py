@@ -0,0 +1,199 @@
+"""
+Result Index
+ดัชนี SQLite ของไฟล์ JSON ผลลัพธ์ทุกชนิด (sensor, san, water, shrimp, size, din)
+key = (type, pond, timestamp) ทำให้ "ผลล่าสุดของบ่อ X ชนิด Y" เป็น indexed lookup ครั้งเดียว
+แทนการ glob ทั้งโฟลเดอร์ + getmtime ทุกไฟล์ + json.load ไล่หา (ช้าลงเรื่อย ๆ ตามประวัติที่สะสม)
+- ผู้เขียนไฟล์ (save_json_result, /data, auto_dose san writer) เรียก index_record() หลังเขียนไฟล์เสร็จ
+- เก็บ JSON ไว้ในแถวด้วย อ่านผลล่าสุดจึงไม่ต้องเปิดไฟล์
+- ใช้ WAL จึงอ่าน/เขียนพร้อมกันได้หลาย thread และหลาย process (main.py กับ auto_dose.py)
+
+Backfill ไฟล์ JSON ที่มีอยู่แล้ว:
+    python -m utils.result_index backfill --root /data/local_storage
+"""
+
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+
+RESULT_INDEX_DB = os.environ.get(
+    "RESULT_INDEX_DB",
+    os.path.join(os.environ.get("LOCAL_STORAGE_ROOT", "/data/local_storage"), "result_index.sqlite3"))
+
+# ชนิดผลลัพธ์ = ชื่อโฟลเดอร์ใต้ LOCAL_STORAGE_ROOT
+RESULT_TYPES = ("sensor", "san", "water", "shrimp", "size", "din")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    pond TEXT,
+    ts   REAL NOT NULL,
+    doc  TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_type_pond_ts ON results (type, pond, ts);
+CREATE INDEX IF NOT EXISTS idx_results_type_ts ON results (type, ts);
+"""
+
+_local = threading.local()
+_listeners = []  # fn(result_type, pond) ถูกเรียกหลัง index_record (ดู utils.change_events)
+
+
+def add_listener(fn):
+    _listeners.append(fn)
+
+
+def _pond_key(doc: dict):
+    """pond ของเอกสาร (pond_id หรือ pond_number) เก็บเป็น text ให้ 1 กับ "1" ตรงกัน"""
+    pond = doc.get("pond_id", doc.get("pond_number"))
+    return None if pond is None else str(pond)
+
+
+def _connect(db_path: str = None) -> sqlite3.Connection:
+    """connection ต่อ thread (sqlite3 ใช้ข้าม thread ไม่ได้)"""
+    db_path = db_path or RESULT_INDEX_DB
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        connections[db_path] = conn
+    return conn
+
+
+def index_record(result_type: str, path: str, doc: dict, ts: float = None, db_path: str = None):
+    """บันทึก (หรือแทนที่) ไฟล์ผลลัพธ์ในดัชนี ts = เวลาเขียนไฟล์ (ค่าเริ่มต้น = ตอนนี้)"""
+    conn = _connect(db_path)
+    pond = _pond_key(doc)
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO results (path, type, pond, ts, doc) VALUES (?, ?, ?, ?, ?)",
+                     (os.path.abspath(path), result_type, pond,
+                      time.time() if ts is None else ts, json.dumps(doc, ensure_ascii=False)))
+    for listener in _listeners:
+        listener(result_type, pond)
+
+
+def is_indexed(path: str, db_path: str = None) -> bool:
+    conn = _connect(db_path)
+    return conn.execute("SELECT 1 FROM results WHERE path = ?", (os.path.abspath(path),)).fetchone() is not None
+
+
+def latest_record(result_type: str, pond_id=None, db_path: str = None):
+    """
+    ผลล่าสุดของชนิดนี้ (และของบ่อนี้ ถ้าระบุ pond_id)
+    แถวที่ไฟล์ถูกลบไปแล้วจะถูกลบออกจากดัชนีแล้วหาแถวถัดไป
+    :return: (path, doc) หรือ (None, None)
+    """
+    conn = _connect(db_path)
+    while True:
+        if pond_id is None:
+            row = conn.execute("SELECT path, doc FROM results WHERE type = ? ORDER BY ts DESC LIMIT 1",
+                               (result_type,)).fetchone()
+        else:
+            row = conn.execute("SELECT path, doc FROM results WHERE type = ? AND pond = ? ORDER BY ts DESC LIMIT 1",
+                               (result_type, str(pond_id))).fetchone()
+        if row is None:
+            return None, None
+        path, doc = row
+        if os.path.exists(path):
+            return path, json.loads(doc)
+        with conn:
+            conn.execute("DELETE FROM results WHERE path = ?", (path,))
+
+
+def recent_records(result_type: str, pond_id=None, limit: int = 5, db_path: str = None):
+    """ผลล่าสุด limit รายการ (ใหม่ -> เก่า) คืน list ของ (path, doc)"""
+    conn = _connect(db_path)
+    if pond_id is None:
+        rows = conn.execute("SELECT path, doc FROM results WHERE type = ? ORDER BY ts DESC LIMIT ?",
+                            (result_type, limit)).fetchall()
+    else:
+        rows = conn.execute("SELECT path, doc FROM results WHERE type = ? AND pond = ? ORDER BY ts DESC LIMIT ?",
+                            (result_type, str(pond_id), limit)).fetchall()
+    return [(path, json.loads(doc)) for path, doc in rows]
+
+
+def known_ponds(result_types=RESULT_TYPES, db_path: str = None) -> list:
+    """บ่อทั้งหมดที่มีผลลัพธ์ในดัชนี (DISTINCT บน index (type, pond, ts) ไม่ต้องสแกนตาราง)"""
+    conn = _connect(db_path)
+    ponds = set()
+    for result_type in result_types:
+        ponds.update(row[0] for row in conn.execute(
+            "SELECT DISTINCT pond FROM results WHERE type = ? AND pond IS NOT NULL", (result_type,)))
+    return sorted(ponds)
+
+
+def count_records(result_type: str = None, db_path: str = None) -> int:
+    conn = _connect(db_path)
+    if result_type is None:
+        return conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    return conn.execute("SELECT COUNT(*) FROM results WHERE type = ?", (result_type,)).fetchone()[0]
+
+
+def backfill(dirs: dict, db_path: str = None) -> dict:
+    """
+    นำเข้าไฟล์ JSON ที่มีอยู่แล้ว dirs = {type: โฟลเดอร์} (ใช้ mtime ของไฟล์เป็น ts เหมือนการเรียงแบบเดิม)
+    ไฟล์ที่อยู่ในดัชนีแล้วจะถูกข้าม รันซ้ำได้
+    :return: {type: จำนวนไฟล์ที่นำเข้าใหม่}
+    """
+    conn = _connect(db_path)
+    imported = {}
+    for result_type, dir_path in dirs.items():
+        imported[result_type] = 0
+        if not os.path.isdir(dir_path):
+            continue
+        known = {row[0] for row in conn.execute("SELECT path FROM results WHERE type = ?", (result_type,))}
+        rows = []
+        for path in glob.glob(os.path.join(dir_path, "*.json")):
+            path = os.path.abspath(path)
+            if path in known:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    doc = json.load(f)
+                ts = os.path.getmtime(path)
+            except (OSError, ValueError):
+                continue
+            if not isinstance(doc, dict):
+                continue
+            rows.append((path, result_type, _pond_key(doc), ts, json.dumps(doc, ensure_ascii=False)))
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO results (path, type, pond, ts, doc) VALUES (?, ?, ?, ?, ?)",
+                             rows)
+        imported[result_type] = len(rows)
+    return imported
+
+
+def default_dirs(root: str) -> dict:
+    return {result_type: os.path.join(root, result_type) for result_type in RESULT_TYPES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Result index (SQLite) tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fill = sub.add_parser("backfill", help="นำเข้าไฟล์ JSON ที่มีอยู่แล้วเข้าดัชนี")
+    fill.add_argument("--root", default=os.environ.get("LOCAL_STORAGE_ROOT", "/data/local_storage"))
+    fill.add_argument("--db", default=None, help=f"ค่าเริ่มต้น {RESULT_INDEX_DB}")
+    fill.add_argument("--dir", nargs=2, action="append", metavar=("TYPE", "DIR"), default=[],
+                      help="เพิ่ม/แทนที่โฟลเดอร์ของชนิดนั้น เช่น --dir san ./local_storage/san")
+    args = parser.parse_args()
+
+    dirs = default_dirs(args.root)
+    dirs.update(dict(args.dir))
+    started = time.perf_counter()
+    imported = backfill(dirs, args.db)
+    for result_type, count in imported.items():
+        print(f"📥 {result_type:<7} +{count:>6}  ({dirs[result_type]})")
+    print(f"✅ backfill เสร็จใน {time.perf_counter() - started:.2f}s รวม {count_records(db_path=args.db)} รายการ")
+
+
+if __name__ == "__main__":
+    main()
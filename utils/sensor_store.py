@@ -0,0 +1,341 @@
+"""
+Sensor Store
+เก็บค่า sensor (pH / อุณหภูมิ / DO) แบบ append-only แยกไฟล์ตามบ่อและวัน แทนไฟล์ JSON ต่อหนึ่งค่าที่วัด
+    <SENSOR_STORE_DIR>/pond=<pond_id>/<YYYYMMDD>.bin   (วันตามเวลาไทย ของเวลาที่ server รับค่า)
+- 1 ค่าที่วัด = 1 แถว binary ขนาดคงที่ 40 bytes (ROW_FORMAT: received_at, device_ts, ph, temperature, do)
+  ไฟล์เรียงตาม received_at อ่าน N แถวล่าสุดได้ด้วยการ seek ท้ายไฟล์ ไม่ต้องอ่านทั้งไฟล์
+- group commit: แถวที่เข้าคิวระหว่าง writer กำลัง fsync รอบก่อน (+ รออีก SENSOR_GROUP_COMMIT_MS ถ้าตั้งไว้)
+  เขียน + fsync พร้อมกันครั้งเดียว
+  append() คืน Future ที่เสร็จเมื่อข้อมูลลงดิสก์แล้ว
+- อ่านได้จากทุก process (auto_dose.py) แถวที่ยังเขียนไม่ครบถูกข้าม
+- ค่า timestamp จากอุปกรณ์ถูก parse เป็นเวลา (ISO 8601) ถ้า parse ไม่ได้จะใช้เวลาที่ server รับแทน
+  ฟิลด์อื่นนอกจาก pond_id / ph / temperature / do / timestamp ไม่ถูกเก็บ
+
+ย้ายไฟล์ sensor_*.json เดิมเข้าสโตร์ (รันซ้ำได้ แถวซ้ำถูกตัดทิ้ง):
+    python -m utils.sensor_store migrate --src /data/local_storage/sensor [--delete]
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+
+try:
+    import fcntl  # ล็อกไฟล์ข้าม process (ไม่มีบน Windows ใช้ได้เฉพาะ lock ใน process)
+except ImportError:
+    fcntl = None
+
+SENSOR_STORE_DIR = os.environ.get(
+    "SENSOR_STORE_DIR",
+    os.path.join(os.environ.get("LOCAL_STORAGE_ROOT", "/data/local_storage"), "sensor_store"))
+SENSOR_GROUP_COMMIT_MS = float(os.environ.get("SENSOR_GROUP_COMMIT_MS", "0"))
+SENSOR_STORE_FSYNC = os.environ.get("SENSOR_STORE_FSYNC", "1") == "1"
+
+ROW_FORMAT = struct.Struct("<ddddd")  # received_at, device_ts, ph, temperature, do (NaN = ไม่มีค่า)
+ROW_SIZE = ROW_FORMAT.size
+BANGKOK_TZ = timezone(timedelta(hours=7))
+_UNSAFE_POND_CHARS = re.compile(r"[^0-9A-Za-z_-]")
+
+
+def _float_or_nan(value) -> float:
+    try:
+        return float(value) if value is not None else math.nan
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _value(x: float):
+    return None if math.isnan(x) else x
+
+
+def parse_device_timestamp(value) -> float:
+    """timestamp จากอุปกรณ์ -> epoch (ไม่มี timezone ถือเป็นเวลาไทย) parse ไม่ได้ = NaN"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        dt = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return math.nan
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=BANGKOK_TZ)
+    return dt.timestamp()
+
+
+def format_ts(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, BANGKOK_TZ).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _day(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, BANGKOK_TZ).strftime("%Y%m%d")
+
+
+def _pond_dir_name(pond_id) -> str:
+    return "pond=" + _UNSAFE_POND_CHARS.sub("_", str(pond_id))
+
+
+def encode_row(reading: dict, received_at: float) -> bytes:
+    return ROW_FORMAT.pack(received_at, parse_device_timestamp(reading.get("timestamp")),
+                           _float_or_nan(reading.get("ph")), _float_or_nan(reading.get("temperature")),
+                           _float_or_nan(reading.get("do")))
+
+
+def decode_row(pond_id, row: tuple) -> dict:
+    received_at, device_ts, ph, temperature, do = row
+    return {
+        "pond_id": int(pond_id) if str(pond_id).isdigit() else pond_id,
+        "ph": _value(ph),
+        "temperature": _value(temperature),
+        "do": _value(do),
+        "timestamp": format_ts(received_at if math.isnan(device_ts) else device_ts),
+        "received_at": received_at,
+    }
+
+
+class _LockedFile:
+    """เปิดไฟล์ partition แบบ append + flock ถ้าไฟล์ถูกแทนที่ (merge) ระหว่างรอ lock จะเปิดใหม่"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __enter__(self):
+        while True:
+            self.f = open(self.path, "ab")
+            if fcntl is None:
+                return self.f
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+            if os.path.exists(self.path) and os.fstat(self.f.fileno()).st_ino == os.stat(self.path).st_ino:
+                return self.f
+            self.f.close()
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        self.f.close()
+
+
+class SensorStore:
+    def __init__(self, root: str = SENSOR_STORE_DIR, group_commit_ms: float = SENSOR_GROUP_COMMIT_MS,
+                 fsync: bool = SENSOR_STORE_FSYNC):
+        self.root = root
+        self.group_commit = max(0.0, group_commit_ms) / 1000.0
+        self.fsync = fsync
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._file_lock = threading.Lock()  # fcntl ไม่มีบน Windows: กันแค่ใน process
+        self.counters = {"rows": 0, "commits": 0, "max_batch": 0}
+
+    def partition_path(self, pond_id, epoch: float) -> str:
+        return os.path.join(self.root, _pond_dir_name(pond_id), f"{_day(epoch)}.bin")
+
+    # ---------- เขียน ----------
+    def append(self, reading: dict, received_at: float = None) -> Future:
+        """
+        เพิ่มค่าที่วัดหนึ่งค่า (dict แบบที่ /data รับ) คืน Future ที่เสร็จ (ผล = path ของ partition)
+        เมื่อแถวนี้ถูกเขียนลงดิสก์แล้วพร้อมกับแถวอื่นใน group เดียวกัน
+        """
+        received_at = time.time() if received_at is None else received_at
+        pond_id = reading.get("pond_id")
+        future = Future()
+        self._queue.put((self.partition_path(pond_id, received_at), encode_row(reading, received_at), future))
+        self._ensure_writer()
+        return future
+
+    def _ensure_writer(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sensor-store-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.group_commit
+            while True:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._commit(batch)
+                    return
+                batch.append(item)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        by_path = {}
+        for path, row, future in batch:
+            by_path.setdefault(path, ([], []))
+            by_path[path][0].append(row)
+            by_path[path][1].append(future)
+        for path, (rows, futures) in by_path.items():
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with self._file_lock, _LockedFile(path) as f:
+                    f.write(b"".join(rows))
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future in futures:
+                future.set_result(path)
+        self.counters["rows"] += len(batch)
+        self.counters["commits"] += 1
+        self.counters["max_batch"] = max(self.counters["max_batch"], len(batch))
+
+    def close(self):
+        """รอเขียนแถวที่ค้างให้เสร็จแล้วหยุด writer thread"""
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._queue.put(None)
+                self._thread.join()
+            self._thread = None
+
+    def import_readings(self, readings) -> int:
+        """
+        นำเข้าค่าย้อนหลัง (dict ที่มี received_at) merge เข้า partition ให้ยังเรียงตามเวลา แถวที่ซ้ำทุกฟิลด์ถูกตัดทิ้ง
+        :return: จำนวนแถวที่เพิ่มจริง
+        """
+        by_path = {}
+        for reading in readings:
+            received_at = reading["received_at"]
+            by_path.setdefault(self.partition_path(reading.get("pond_id"), received_at), []).append(
+                encode_row(reading, received_at))
+        added = 0
+        for path, rows in by_path.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._file_lock, _LockedFile(path):
+                # เทียบแถวซ้ำเป็น bytes (NaN != NaN ถ้าเทียบเป็น float)
+                existing = {ROW_FORMAT.pack(*row) for row in _read_rows(path)}
+                merged = sorted(existing | set(rows), key=lambda row: ROW_FORMAT.unpack(row)[0])
+                added += len(merged) - len(existing)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.writelines(merged)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+        return added
+
+    # ---------- อ่าน ----------
+    def ponds(self) -> list:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[len("pond="):] for name in os.listdir(self.root) if name.startswith("pond="))
+
+    def _partitions(self, pond_id) -> list:
+        return sorted(glob.glob(os.path.join(self.root, _pond_dir_name(pond_id), "*.bin")))
+
+    def last(self, pond_id, n: int = 1) -> list:
+        """n ค่าล่าสุดของบ่อ (ใหม่ -> เก่า) อ่านเฉพาะท้ายไฟล์ของวันล่าสุด (ย้อนวันก่อนหน้าถ้าไม่พอ)"""
+        readings = []
+        for path in reversed(self._partitions(pond_id)):
+            need = n - len(readings)
+            if need <= 0:
+                break
+            rows = _read_rows(path, last=need)
+            readings.extend(decode_row(pond_id, row) for row in reversed(rows))
+        return readings
+
+    def range(self, pond_id, start: float = None, end: float = None) -> list:
+        """ค่าที่รับระหว่าง start <= received_at < end (epoch, None = ไม่จำกัด) เรียงเก่า -> ใหม่"""
+        first_day = _day(start) if start is not None else None
+        last_day = _day(end) if end is not None else None
+        readings = []
+        for path in self._partitions(pond_id):
+            day = os.path.splitext(os.path.basename(path))[0]
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            readings.extend(decode_row(pond_id, row) for row in _read_rows(path)
+                            if (start is None or row[0] >= start) and (end is None or row[0] < end))
+        return readings
+
+    def stats(self) -> dict:
+        return {"root": self.root, "group_commit_ms": self.group_commit * 1000, "fsync": self.fsync,
+                "queued": self._queue.qsize(), **self.counters}
+
+
+def _read_rows(path: str, last: int = None) -> list:
+    """อ่านแถวทั้งหมด (หรือ last แถวสุดท้าย) ข้ามเศษท้ายไฟล์ที่ writer ยังเขียนไม่ครบแถว"""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            count = size // ROW_SIZE
+            skip = 0 if last is None else max(0, count - last)
+            f.seek(skip * ROW_SIZE)
+            data = f.read((count - skip) * ROW_SIZE)
+    except FileNotFoundError:
+        return []
+    return list(ROW_FORMAT.iter_unpack(data[:len(data) - len(data) % ROW_SIZE]))
+
+
+def migrate_legacy(src_dir: str, store: SensorStore, delete: bool = False, chunk: int = 50000) -> dict:
+    """
+    นำเข้าไฟล์ sensor_*.json เดิม (received_at = mtime ของไฟล์ ตามลำดับที่ตัวอ่านเดิมใช้)
+    delete=True ลบไฟล์เดิมหลังนำเข้าสำเร็จ
+    """
+    paths = glob.glob(os.path.join(src_dir, "sensor_*.json"))
+    result = {"files": len(paths), "imported": 0, "skipped": 0, "deleted": 0}
+    for offset in range(0, len(paths), chunk):
+        readings, done = [], []
+        for path in paths[offset:offset + chunk]:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    doc = json.load(f)
+                received_at = os.path.getmtime(path)
+            except (OSError, ValueError):
+                result["skipped"] += 1
+                continue
+            if not isinstance(doc, dict) or doc.get("pond_id") is None:
+                result["skipped"] += 1
+                continue
+            readings.append(dict(doc, received_at=received_at))
+            done.append(path)
+        result["imported"] += store.import_readings(readings)
+        if delete:
+            for path in done:
+                os.remove(path)
+            result["deleted"] += len(done)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sensor time-series store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="นำเข้าไฟล์ sensor_*.json เดิม")
+    migrate.add_argument("--src", default=os.environ.get("SENSOR_DIR", "/data/local_storage/sensor"))
+    migrate.add_argument("--root", default=SENSOR_STORE_DIR, help="โฟลเดอร์ของสโตร์")
+    migrate.add_argument("--delete", action="store_true", help="ลบไฟล์ JSON เดิมหลังนำเข้าแล้ว")
+    tail = sub.add_parser("tail", help="แสดงค่าล่าสุดของบ่อ")
+    tail.add_argument("pond_id")
+    tail.add_argument("-n", type=int, default=10)
+    tail.add_argument("--root", default=SENSOR_STORE_DIR)
+    args = parser.parse_args()
+
+    store = SensorStore(args.root)
+    if args.command == "migrate":
+        started = time.perf_counter()
+        result = migrate_legacy(args.src, store, delete=args.delete)
+        print(f"✅ migrate เสร็จใน {time.perf_counter() - started:.2f}s: {result}")
+    else:
+        for reading in store.last(args.pond_id, args.n):
+            print(json.dumps(reading, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
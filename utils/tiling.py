@@ -0,0 +1,159 @@
+"""
+Tiled (sliced) inference
+ภาพถาดอาหาร / ผิวน้ำความละเอียดสูง (เช่น 12MP) ถ้าส่งทั้งภาพ YOLO จะย่อเหลือ 640 px กุ้งตัวเล็กจะหายไป
+จึงตัดภาพเป็น tile ขนาดเท่า input ของโมเดล (ซ้อนกัน TILE_OVERLAP) แล้วส่งทุก tile เข้าโมเดลเป็น batch เดียว
+จากนั้นเลื่อนกล่อง / keypoints กลับเป็นพิกัดภาพเต็มและรวมกล่องที่ซ้ำกันตรงรอยต่อ tile ด้วย NMS
+- TILE_FULL_FRAME=1 ส่งภาพเต็ม (ย่อ) เพิ่มอีก 1 ภาพ เพื่อจับกุ้งตัวใหญ่ที่ยาวเกิน tile
+- กล่องที่ชนขอบ tile (ด้านที่ไม่ใช่ขอบภาพ) คือกุ้งที่ถูกตัด จะถูกเลือกทีหลังกล่องที่เห็นทั้งตัวเสมอ
+- ภาพที่ด้านยาวไม่ถึง TILE_MIN_SIDE รันแบบเดิม (ทั้งภาพ) ผลเหมือนไม่เปิด tiling
+เปิดรายโมเดลด้วย <KEY>_TILED=1 (เช่น SIZE_TILED=1, SHRIMP_TILED=1) หรือส่ง tiled=True ให้ analyzer
+"""
+
+import os
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+TILE_SIZE = int(os.environ.get("TILE_SIZE", "640"))
+TILE_OVERLAP = float(os.environ.get("TILE_OVERLAP", "0.2"))
+TILE_MIN_SIDE = int(os.environ.get("TILE_MIN_SIDE", str(int(TILE_SIZE * 1.5))))
+TILE_FULL_FRAME = os.environ.get("TILE_FULL_FRAME", "1") == "1"
+TILE_MERGE_IOU = float(os.environ.get("TILE_MERGE_IOU", "0.5"))
+TILE_MERGE_IOS = float(os.environ.get("TILE_MERGE_IOS", "0.6"))
+EDGE_MARGIN = 2  # px: กล่องที่ห่างขอบ tile ไม่เกินนี้ถือว่าถูกตัด
+
+
+def tiling_enabled(model_key: str, tiled=None) -> bool:
+    """tiled=None ใช้ค่า <KEY>_TILED จาก env (ค่าเริ่มต้นปิด)"""
+    if tiled is None:
+        return os.environ.get(f"{model_key.upper()}_TILED", "0") == "1"
+    return bool(tiled)
+
+
+def tiling_signature(model_key: str, tiled=None):
+    """ค่าที่มีผลต่อผลลัพธ์ของ tiling (ใช้ประกอบ result cache key) คืน None ถ้าไม่เปิด"""
+    if not tiling_enabled(model_key, tiled):
+        return None
+    return {"tile": TILE_SIZE, "overlap": TILE_OVERLAP, "min_side": TILE_MIN_SIDE,
+            "full_frame": TILE_FULL_FRAME, "iou": TILE_MERGE_IOU, "ios": TILE_MERGE_IOS}
+
+
+def tile_windows(height: int, width: int, tile: int = TILE_SIZE, overlap: float = TILE_OVERLAP):
+    """
+    ตำแหน่ง tile (x0, y0, x1, y1) ที่คลุมทั้งภาพ tile สุดท้ายของแต่ละแถว/คอลัมน์ชิดขอบภาพ
+    ทุก tile จึงมีขนาด tile x tile เท่ากัน (ยกเว้นภาพเล็กกว่า tile) ทำให้ batch ได้ไม่ต้อง pad
+    """
+    stride = max(1, int(tile * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile:
+            return [0]
+        return list(range(0, length - tile, stride)) + [length - tile]
+
+    return [(x, y, min(x + tile, width), min(y + tile, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def _edge_touching(boxes, window, height, width):
+    """กล่องที่ชนขอบ tile ด้านที่อยู่ในภาพ (ไม่ใช่ขอบภาพจริง) = วัตถุที่ถูก tile ตัด"""
+    x0, y0, x1, y1 = window
+    return (((boxes[:, 0] <= x0 + EDGE_MARGIN) & (x0 > 0)) |
+            ((boxes[:, 1] <= y0 + EDGE_MARGIN) & (y0 > 0)) |
+            ((boxes[:, 2] >= x1 - EDGE_MARGIN) & (x1 < width)) |
+            ((boxes[:, 3] >= y1 - EDGE_MARGIN) & (y1 < height)))
+
+
+def merge_detections(boxes, scores, classes, sources, touching):
+    """
+    NMS แยกตาม class สำหรับกล่องจากหลาย tile
+    - กล่องจาก tile เดียวกันไม่ตัดกันเอง (โมเดลทำ NMS ให้แล้ว กุ้งที่อยู่ชิดกันจะไม่หาย)
+    - คู่ที่มีกล่องถูกตัดที่ขอบใช้ intersection / พื้นที่กล่องที่เล็กกว่า (IoS) เพราะกล่องที่ถูกตัดอยู่ข้างในกล่องเต็ม
+      แต่ IoU ต่ำ ส่วนคู่อื่นใช้ IoU ปกติ
+    :return: index ของกล่องที่เก็บไว้ (กล่องเต็มตัวก่อน แล้วเรียงตาม confidence)
+    """
+    order = np.lexsort((-scores, touching))
+    areas = np.prod(np.clip(boxes[:, 2:] - boxes[:, :2], 0, None), axis=1)
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for idx in order:
+        if suppressed[idx]:
+            continue
+        keep.append(idx)
+        tl = np.maximum(boxes[idx, :2], boxes[:, :2])
+        br = np.minimum(boxes[idx, 2:], boxes[:, 2:])
+        inter = np.prod(np.clip(br - tl, 0, None), axis=1)
+        iou = inter / np.maximum(areas[idx] + areas - inter, 1e-9)
+        ios = inter / np.maximum(np.minimum(areas[idx], areas), 1e-9)
+        overlap = np.where(touching | touching[idx], ios > TILE_MERGE_IOS, iou > TILE_MERGE_IOU)
+        suppressed |= overlap & (classes == classes[idx]) & (sources != sources[idx])
+    return np.asarray(keep, dtype=int)
+
+
+def _merge(image, parts):
+    """รวมผลของทุก tile ของภาพเดียวเป็น Results เดียว (พิกัดภาพเต็ม)"""
+    height, width = image.shape[:2]
+    names, path = parts[0][1].names, parts[0][1].path
+    has_keypoints = parts[0][1].keypoints is not None
+    boxes, keypoints, sources, touching = [], [], [], []
+
+    for source_idx, (window, r) in enumerate(parts):
+        if r.boxes is None or len(r.boxes) == 0:
+            continue
+        data = r.boxes.data.cpu().numpy()[:, :6].astype(np.float32)  # x1, y1, x2, y2, conf, cls
+        kpts = r.keypoints.data.cpu().numpy().astype(np.float32) if has_keypoints else None
+        if window is None:
+            edge = np.zeros(len(data), dtype=bool)
+        else:
+            x0, y0 = window[:2]
+            data[:, [0, 2]] += x0
+            data[:, [1, 3]] += y0
+            if kpts is not None:
+                kpts[..., 0] += x0
+                kpts[..., 1] += y0
+            edge = _edge_touching(data, window, height, width)
+        boxes.append(data)
+        keypoints.append(kpts)
+        sources.append(np.full(len(data), source_idx))
+        touching.append(edge)
+
+    if boxes:
+        boxes = np.concatenate(boxes)
+        keep = merge_detections(boxes[:, :4], boxes[:, 4], boxes[:, 5],
+                                np.concatenate(sources), np.concatenate(touching))
+        boxes = boxes[keep]
+        keypoints = np.concatenate(keypoints)[keep] if has_keypoints else None
+    else:
+        boxes = np.zeros((0, 6), dtype=np.float32)
+        n_kpts = parts[0][1].keypoints.data.shape[1:] if has_keypoints else None
+        keypoints = np.zeros((0, *n_kpts), dtype=np.float32) if has_keypoints else None
+
+    return Results(image, path=path, names=names, boxes=torch.from_numpy(boxes),
+                   keypoints=torch.from_numpy(keypoints) if keypoints is not None else None)
+
+
+def predict_tiled(model, images, batch: int = 16, tile: int = TILE_SIZE, overlap: float = TILE_OVERLAP):
+    """
+    predict หลายภาพแบบ sliced: tile ของทุกภาพรวมเป็น batch เดียวกัน (สูงสุด batch ต่อครั้ง)
+    :return: list ของ ultralytics Results ตามลำดับ images (ใช้แทนผลของ model(images) ได้เลย)
+    """
+    jobs, crops = [], []
+    for image_idx, image in enumerate(images):
+        height, width = image.shape[:2]
+        windows = [None]
+        if max(height, width) >= TILE_MIN_SIDE:
+            windows = tile_windows(height, width, tile, overlap) + ([None] if TILE_FULL_FRAME else [])
+        for window in windows:
+            jobs.append((image_idx, window))
+            crops.append(image if window is None else
+                         np.ascontiguousarray(image[window[1]:window[3], window[0]:window[2]]))
+
+    raw = []
+    for start in range(0, len(crops), batch):
+        raw.extend(model.predict(crops[start:start + batch], verbose=False))
+
+    parts = [[] for _ in images]
+    for (image_idx, window), r in zip(jobs, raw):
+        parts[image_idx].append((window, r))
+    return [p[0][1] if len(p) == 1 and p[0][0] is None else _merge(images[i], p)
+            for i, p in enumerate(parts)]
@@ -0,0 +1,95 @@
+"""
+Worker Pool
+รันงานวิเคราะห์ (YOLO / DeepSort / เขียนไฟล์) นอก asyncio event loop
+เพื่อให้ endpoint เบา ๆ อย่าง /data และ /ponds/{id}/status ตอบได้ทันทีระหว่างวิเคราะห์วิดีโอ
+
+ENV:
+    ANALYSIS_EXECUTOR = thread | process   (ค่าเริ่มต้น thread)
+    ANALYSIS_WORKERS  = จำนวน worker สูงสุด (ค่าเริ่มต้น 2)
+    ANALYSIS_MP_START = spawn | fork | forkserver (ใช้เมื่อเป็น process, ค่าเริ่มต้น spawn)
+
+warm-up โมเดล (start_warm_up): thread = โหลดใน process หลัก, process = โหลดใน initializer ของแต่ละ worker
+"""
+
+import asyncio
+import functools
+import importlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils.model_registry import start_background_warm_up, warm_up
+
+ANALYSIS_EXECUTOR = os.environ.get("ANALYSIS_EXECUTOR", "thread").lower()
+ANALYSIS_WORKERS = max(1, int(os.environ.get("ANALYSIS_WORKERS", "2")))
+ANALYSIS_MP_START = os.environ.get("ANALYSIS_MP_START", "spawn")
+
+_executor = None
+_executor_lock = threading.Lock()
+_warm_up_args = None  # (model_keys, preload) เมื่อสั่ง warm-up ไว้ก่อนสร้าง process pool
+
+
+def _warm_up_worker(model_keys, preload):
+    """initializer ของ process worker: import module ของฟังก์ชันที่จะถูกส่งมา แล้วโหลดโมเดลก่อนรับงานแรก"""
+    for module_name in preload:
+        importlib.import_module(module_name)
+    warm_up(model_keys)
+
+
+def get_executor():
+    """สร้าง executor ครั้งแรกที่ถูกเรียก (ขนาดจำกัดตาม ANALYSIS_WORKERS)"""
+    global _executor
+    if _executor is not None:
+        return _executor
+    with _executor_lock:
+        if _executor is None:
+            if ANALYSIS_EXECUTOR == "process":
+                _executor = ProcessPoolExecutor(
+                    max_workers=ANALYSIS_WORKERS,
+                    mp_context=multiprocessing.get_context(ANALYSIS_MP_START),
+                    initializer=_warm_up_worker if _warm_up_args is not None else None,
+                    initargs=_warm_up_args or (),
+                )
+            else:
+                _executor = ThreadPoolExecutor(
+                    max_workers=ANALYSIS_WORKERS,
+                    thread_name_prefix="analysis",
+                )
+            print(f"✅ Analysis executor: {ANALYSIS_EXECUTOR} x{ANALYSIS_WORKERS}")
+    return _executor
+
+
+def start_warm_up(model_keys=None, preload=()):
+    """
+    warm-up โมเดลให้ตรงกับที่ที่งานวิเคราะห์รันจริง
+    - thread: โหลดใน daemon thread ของ process หลัก (worker thread ใช้ cache เดียวกัน)
+    - process: process หลักไม่ต้องโหลดโมเดลเลย ให้ worker ทุกตัวโหลดใน initializer
+      แล้วส่งงานว่างไปเพื่อเปิด worker ครบทันที (ต้องเรียกก่อน get_executor ครั้งแรก)
+      preload = ชื่อ module ของฟังก์ชันที่ส่งเข้า run_analysis (worker ต้อง import ตอน unpickle งานแรกอยู่แล้ว)
+    """
+    global _warm_up_args
+    if ANALYSIS_EXECUTOR != "process":
+        return start_background_warm_up(model_keys)
+    _warm_up_args = (model_keys, tuple(preload))
+    executor = get_executor()
+    for _ in range(ANALYSIS_WORKERS):
+        executor.submit(os.getpid)
+    return None
+
+
+async def run_analysis(func, *args, **kwargs):
+    """
+    รัน func ใน analysis executor แล้ว await ผลลัพธ์
+    ถ้าเป็น process pool, func และ argument ทั้งหมดต้อง pickle ได้ (ฟังก์ชันระดับ module)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown(wait: bool = True):
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=wait)
+            _executor = None